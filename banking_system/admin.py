@@ -1,20 +1,132 @@
+from itertools import islice
+
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from django.db.models import Sum
+from django.db.models import Count, Sum
 from .models import (
     User, Branch, Member, AccountType, Account, Transaction, 
-    LoanProduct, LoanApplication, Loan, LoanPayment, SharePrice, 
+    LoanProduct, LoanApplication, Loan, LoanScheduleLine, LoanPayment, SharePrice, 
     ShareTransaction, FixedDeposit, Dividend, DividendPayment, 
     Committee, CommitteeMember, Meeting, Notification, 
-    SystemConfiguration, AuditLog
+    SystemConfiguration, AuditLog, TransactionArchive, AuditLogArchive
+)
+from .admin_counts import (
+    EXACT_COUNT_VAR, EstimatedCountPaginator, CachedAllValuesFieldListFilter,
+    CachedChoicesFieldListFilter, CachedDateFieldListFilter,
 )
+from . import audit
+from .archive import audit_trail
+from .search import matching_ids
+from .snapshots import invalidate_users
+
+
+class ChangelistQueryMixin:
+    """
+    Keep changelist pages at a constant number of queries.
+
+    Admins list the relations their list_display callables traverse in
+    list_select_related and replace per-row counts with list_annotations,
+    a mapping of attribute name to aggregate that is added to the queryset.
+    """
+    list_annotations = {}
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.list_annotations:
+            queryset = queryset.annotate(**self.list_annotations)
+        return queryset
+
+
+class SearchIndexMixin:
+    """Answer the changelist search box from the search index instead of LIKE across joins"""
+    search_document_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=matching_ids(self.search_document_kind, search_term)), False
+
+
+class ApprovalAuditMixin:
+    """Write an audit event when a change form moves an object into an approved status"""
+    approval_action = None
+    approved_statuses = ()
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'status' in form.changed_data and obj.status in self.approved_statuses:
+            audit.record(
+                self.approval_action, obj._meta.object_name, obj.pk,
+                f"{obj} status set to {obj.status}", user=request.user,
+            )
+
+
+class EstimatedCountMixin:
+    """
+    Changelist without exact COUNT(*) queries for tables with millions of rows.
+
+    Pagination and facet counts come from planner estimates or the count
+    cache; adding ?exact_count=1 recounts for that request.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/banking_system/estimated_count_change_list.html'
+
+    def changelist_view(self, request, extra_context=None):
+        # Pop the toggle so the changelist does not mistake it for a field lookup
+        request.GET = request.GET.copy()
+        request.exact_count = request.GET.pop(EXACT_COUNT_VAR, None) is not None
+        extra_context = {**(extra_context or {}), 'exact_count': request.exact_count}
+        return super().changelist_view(request, extra_context)
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        paginator.exact = getattr(request, 'exact_count', False)
+        return paginator
+
+
+class AuditTrailMixin:
+    """
+    Add the object's audit events to its history page.
+
+    Events come from the live and archived audit logs through
+    archive.audit_trail, newest first, so history does not stop at the
+    archival cutoff.
+    """
+    object_history_template = 'admin/banking_system/audit_trail.html'
+    audit_trail_rows = 100
+
+    def audit_object_id(self, obj):
+        return obj.pk
+
+    def history_view(self, request, object_id, extra_context=None):
+        obj = self.get_object(request, unquote(object_id))
+        events = []
+        if obj is not None:
+            events = list(islice(
+                audit_trail(page_size=self.audit_trail_rows + 1, model_name=self.model._meta.object_name,
+                            object_id=str(self.audit_object_id(obj))),
+                self.audit_trail_rows + 1,
+            ))
+        usernames = dict(User.objects.filter(pk__in={row[2] for row in events}).values_list('pk', 'username'))
+        extra_context = {
+            **(extra_context or {}),
+            'audit_events': [
+                {'timestamp': row[0], 'user': usernames.get(row[2], row[2] or ''), 'action_type': row[3],
+                 'description': row[6], 'ip_address': row[7] or ''}
+                for row in events[:self.audit_trail_rows]
+            ],
+            'audit_events_truncated': len(events) > self.audit_trail_rows,
+        }
+        return super().history_view(request, object_id, extra_context)
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(AuditTrailMixin, BaseUserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'phone_number', 'is_member', 'is_staff_member', 'is_active')
     list_filter = ('is_member', 'is_staff_member', 'is_active', 'is_staff', 'created_at')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'phone_number', 'national_id')
@@ -42,31 +154,39 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(Branch)
-class BranchAdmin(admin.ModelAdmin):
+class BranchAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('name', 'code', 'manager', 'phone_number', 'is_active', 'members_count')
+    list_select_related = ('manager',)
+    list_annotations = {'members_total': Count('members')}
     list_filter = ('is_active', 'created_at')
     search_fields = ('name', 'code', 'address', 'phone_number')
     ordering = ('name',)
     
     def members_count(self, obj):
-        return obj.members.count()
+        return obj.members_total
     members_count.short_description = 'Members Count'
+    members_count.admin_order_field = 'members_total'
 
 
 @admin.register(Member)
-class MemberAdmin(admin.ModelAdmin):
-    list_display = ('member_number', 'user_full_name', 'branch', 'status', 'membership_date', 'total_shares', 'accounts_count')
+class MemberAdmin(AuditTrailMixin, ApprovalAuditMixin, SearchIndexMixin, ChangelistQueryMixin, admin.ModelAdmin):
+    list_display = ('member_number', 'user_full_name', 'branch', 'status', 'membership_date', 'total_shares',
+                    'savings_balance', 'loan_balance', 'accounts_count')
+    list_select_related = ('user', 'branch')
     list_filter = ('status', 'branch', 'membership_date')
     search_fields = ('member_number', 'user__first_name', 'user__last_name', 'user__email')
+    search_document_kind = 'member'
+    approval_action = 'member_approval'
+    approved_statuses = ('active',)
     ordering = ('-membership_date',)
-    readonly_fields = ('total_savings', 'created_at', 'updated_at')
+    readonly_fields = ('savings_balance', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Member Information', {
             'fields': ('user', 'member_number', 'branch', 'membership_date', 'status')
         }),
         ('Financial Information', {
-            'fields': ('monthly_contribution', 'total_shares', 'total_savings')
+            'fields': ('monthly_contribution', 'total_shares', 'savings_balance')
         }),
         ('Guarantors', {
             'fields': ('guarantor_1', 'guarantor_2'),
@@ -78,13 +198,22 @@ class MemberAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_financials()
+
     def user_full_name(self, obj):
         return obj.user.get_full_name()
     user_full_name.short_description = 'Full Name'
     
+    def loan_balance(self, obj):
+        return obj.loan_balance
+    loan_balance.short_description = 'Loan Balance'
+    loan_balance.admin_order_field = 'loan_balance'
+
     def accounts_count(self, obj):
-        return obj.accounts.count()
+        return obj.accounts_count
     accounts_count.short_description = 'Accounts'
+    accounts_count.admin_order_field = 'accounts_count'
 
 
 @admin.register(AccountType)
@@ -96,12 +225,14 @@ class AccountTypeAdmin(admin.ModelAdmin):
 
 
 @admin.register(Account)
-class AccountAdmin(admin.ModelAdmin):
+class AccountAdmin(AuditTrailMixin, SearchIndexMixin, ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('account_number', 'member_name', 'account_type', 'balance', 'status', 'date_opened')
+    list_select_related = ('member__user', 'account_type')
     list_filter = ('account_type', 'status', 'date_opened')
     search_fields = ('account_number', 'member__user__first_name', 'member__user__last_name')
+    search_document_kind = 'account'
     ordering = ('-date_opened',)
-    readonly_fields = ('date_opened', 'last_transaction_date', 'created_at', 'updated_at')
+    readonly_fields = ('date_opened', 'last_transaction_date', 'dormant_since', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Account Information', {
@@ -111,7 +242,7 @@ class AccountAdmin(admin.ModelAdmin):
             'fields': ('balance', 'available_balance', 'interest_earned')
         }),
         ('Timestamps', {
-            'fields': ('date_opened', 'last_transaction_date', 'created_at', 'updated_at'),
+            'fields': ('date_opened', 'last_transaction_date', 'dormant_since', 'created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
@@ -122,12 +253,23 @@ class AccountAdmin(admin.ModelAdmin):
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(AuditTrailMixin, SearchIndexMixin, EstimatedCountMixin, ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('transaction_id', 'account_number', 'transaction_type', 'amount', 'status', 'created_at')
-    list_filter = ('transaction_type', 'status', 'created_at', 'processed_at')
+    list_select_related = ('account',)
+    list_filter = (
+        ('transaction_type', CachedChoicesFieldListFilter),
+        ('status', CachedChoicesFieldListFilter),
+        ('created_at', CachedDateFieldListFilter),
+        ('processed_at', CachedDateFieldListFilter),
+    )
     search_fields = ('transaction_id', 'account__account_number', 'reference_number', 'description')
+    search_document_kind = 'transaction'
     ordering = ('-created_at',)
     readonly_fields = ('transaction_id', 'created_at', 'processed_at')
+
+    def audit_object_id(self, obj):
+        # The posting engine records transactions by their transaction_id
+        return obj.transaction_id
     
     fieldsets = (
         ('Transaction Information', {
@@ -156,17 +298,20 @@ class TransactionAdmin(admin.ModelAdmin):
 
 @admin.register(LoanProduct)
 class LoanProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'code', 'interest_rate', 'minimum_amount', 'maximum_amount', 'is_active')
-    list_filter = ('is_active', 'collateral_required')
+    list_display = ('name', 'code', 'interest_rate', 'interest_method', 'minimum_amount', 'maximum_amount', 'is_active')
+    list_filter = ('is_active', 'interest_method', 'collateral_required')
     search_fields = ('name', 'code')
     ordering = ('name',)
 
 
 @admin.register(LoanApplication)
-class LoanApplicationAdmin(admin.ModelAdmin):
+class LoanApplicationAdmin(AuditTrailMixin, ApprovalAuditMixin, ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('application_number', 'member_name', 'loan_product', 'amount_requested', 'status', 'application_date')
+    list_select_related = ('member__user', 'loan_product')
     list_filter = ('status', 'loan_product', 'application_date')
     search_fields = ('application_number', 'member__user__first_name', 'member__user__last_name')
+    approval_action = 'loan_approval'
+    approved_statuses = ('approved',)
     ordering = ('-application_date',)
     readonly_fields = ('application_date', 'created_at')
     
@@ -192,13 +337,26 @@ class LoanApplicationAdmin(admin.ModelAdmin):
     member_name.short_description = 'Member Name'
 
 
+class LoanScheduleLineInline(admin.TabularInline):
+    model = LoanScheduleLine
+    fields = ('installment_number', 'due_date', 'principal', 'interest', 'closing_balance')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False  # Schedules are generated by build_loan_schedules
+
+
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(AuditTrailMixin, ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('loan_number', 'member_name', 'principal_amount', 'balance', 'status', 'next_payment_date', 'days_overdue_display')
-    list_filter = ('status', 'loan_product', 'disbursement_date')
+    list_select_related = ('member__user',)
+    list_filter = ('status', 'par_bucket', 'loan_product', 'disbursement_date')
     search_fields = ('loan_number', 'member__user__first_name', 'member__user__last_name')
     ordering = ('-disbursement_date',)
-    readonly_fields = ('created_at', 'updated_at', 'days_overdue')
+    readonly_fields = ('created_at', 'updated_at', 'arrears_days', 'par_bucket')
+    inlines = [LoanScheduleLineInline]
     
     fieldsets = (
         ('Loan Information', {
@@ -213,6 +371,9 @@ class LoanAdmin(admin.ModelAdmin):
         ('Dates', {
             'fields': ('disbursement_date', 'maturity_date', 'next_payment_date')
         }),
+        ('Arrears', {
+            'fields': ('arrears_days', 'par_bucket')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -224,7 +385,7 @@ class LoanAdmin(admin.ModelAdmin):
     member_name.short_description = 'Member Name'
     
     def days_overdue_display(self, obj):
-        days = obj.days_overdue
+        days = obj.arrears_days  # Stored by classify_loan_arrears, no per-row date math
         if days > 0:
             return format_html('<span style="color: red;">{} days</span>', days)
         return 'Current'
@@ -232,8 +393,9 @@ class LoanAdmin(admin.ModelAdmin):
 
 
 @admin.register(LoanPayment)
-class LoanPaymentAdmin(admin.ModelAdmin):
+class LoanPaymentAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('loan_number', 'amount', 'principal_amount', 'interest_amount', 'payment_date', 'processed_by')
+    list_select_related = ('loan', 'processed_by')
     list_filter = ('payment_date', 'processed_by')
     search_fields = ('loan__loan_number', 'loan__member__user__first_name', 'loan__member__user__last_name')
     ordering = ('-payment_date',)
@@ -245,16 +407,18 @@ class LoanPaymentAdmin(admin.ModelAdmin):
 
 
 @admin.register(SharePrice)
-class SharePriceAdmin(admin.ModelAdmin):
+class SharePriceAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('price_per_share', 'effective_date', 'is_current', 'set_by', 'created_at')
+    list_select_related = ('set_by',)
     list_filter = ('is_current', 'effective_date')
     ordering = ('-effective_date',)
     readonly_fields = ('created_at',)
 
 
 @admin.register(ShareTransaction)
-class ShareTransactionAdmin(admin.ModelAdmin):
+class ShareTransactionAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('member_name', 'transaction_type', 'number_of_shares', 'price_per_share', 'total_amount', 'transaction_date')
+    list_select_related = ('member__user',)
     list_filter = ('transaction_type', 'transaction_date')
     search_fields = ('member__user__first_name', 'member__user__last_name')
     ordering = ('-transaction_date',)
@@ -266,12 +430,13 @@ class ShareTransactionAdmin(admin.ModelAdmin):
 
 
 @admin.register(FixedDeposit)
-class FixedDepositAdmin(admin.ModelAdmin):
+class FixedDepositAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('account_number', 'principal_amount', 'interest_rate', 'term_months', 'maturity_date', 'status')
+    list_select_related = ('account',)
     list_filter = ('status', 'start_date', 'maturity_date', 'auto_renew')
     search_fields = ('account__account_number', 'account__member__user__first_name')
     ordering = ('-start_date',)
-    readonly_fields = ('created_at',)
+    readonly_fields = ('interest_accrued_to', 'created_at')
     
     def account_number(self, obj):
         return obj.account.account_number
@@ -287,8 +452,9 @@ class DividendAdmin(admin.ModelAdmin):
 
 
 @admin.register(DividendPayment)
-class DividendPaymentAdmin(admin.ModelAdmin):
+class DividendPaymentAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('member_name', 'dividend_year', 'shares_held', 'amount', 'payment_date')
+    list_select_related = ('member__user', 'dividend')
     list_filter = ('dividend__year', 'payment_date')
     search_fields = ('member__user__first_name', 'member__user__last_name')
     ordering = ('-payment_date',)
@@ -304,21 +470,24 @@ class DividendPaymentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Committee)
-class CommitteeAdmin(admin.ModelAdmin):
+class CommitteeAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('name', 'is_active', 'members_count', 'created_at')
+    list_annotations = {'members_total': Count('members')}
     list_filter = ('is_active', 'created_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
     readonly_fields = ('created_at',)
     
     def members_count(self, obj):
-        return obj.members.count()
+        return obj.members_total
     members_count.short_description = 'Members Count'
+    members_count.admin_order_field = 'members_total'
 
 
 @admin.register(CommitteeMember)
-class CommitteeMemberAdmin(admin.ModelAdmin):
+class CommitteeMemberAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('member_name', 'committee', 'position', 'start_date', 'end_date', 'is_active')
+    list_select_related = ('member__user', 'committee')
     list_filter = ('position', 'is_active', 'committee', 'start_date')
     search_fields = ('member__user__first_name', 'member__user__last_name', 'committee__name')
     ordering = ('-start_date',)
@@ -330,8 +499,9 @@ class CommitteeMemberAdmin(admin.ModelAdmin):
 
 
 @admin.register(Meeting)
-class MeetingAdmin(admin.ModelAdmin):
+class MeetingAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('title', 'meeting_type', 'committee', 'date', 'venue', 'is_completed')
+    list_select_related = ('committee',)
     list_filter = ('meeting_type', 'is_completed', 'committee', 'date')
     search_fields = ('title', 'venue')
     ordering = ('-date',)
@@ -339,8 +509,9 @@ class MeetingAdmin(admin.ModelAdmin):
 
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('recipient', 'title', 'notification_type', 'is_read', 'created_at')
+    list_select_related = ('recipient',)
     list_filter = ('notification_type', 'is_read', 'created_at')
     search_fields = ('recipient__username', 'title', 'message')
     ordering = ('-created_at',)
@@ -348,17 +519,24 @@ class NotificationAdmin(admin.ModelAdmin):
     actions = ['mark_as_read', 'mark_as_unread']
     
     def mark_as_read(self, request, queryset):
+        recipients = list(queryset.values_list('recipient_id', flat=True).distinct())
         queryset.update(is_read=True)
+        # After the update, so a snapshot rebuilt meanwhile cannot keep the old counts
+        invalidate_users(recipients, 'notifications')
     mark_as_read.short_description = "Mark selected notifications as read"
     
     def mark_as_unread(self, request, queryset):
+        recipients = list(queryset.values_list('recipient_id', flat=True).distinct())
         queryset.update(is_read=False)
+        # After the update, so a snapshot rebuilt meanwhile cannot keep the old counts
+        invalidate_users(recipients, 'notifications')
     mark_as_unread.short_description = "Mark selected notifications as unread"
 
 
 @admin.register(SystemConfiguration)
-class SystemConfigurationAdmin(admin.ModelAdmin):
+class SystemConfigurationAdmin(ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('key', 'value_preview', 'updated_by', 'updated_at')
+    list_select_related = ('updated_by',)
     search_fields = ('key', 'description')
     ordering = ('key',)
     readonly_fields = ('updated_at',)
@@ -371,9 +549,14 @@ class SystemConfigurationAdmin(admin.ModelAdmin):
 
 
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(EstimatedCountMixin, ChangelistQueryMixin, admin.ModelAdmin):
     list_display = ('user', 'action_type', 'model_name', 'object_id', 'timestamp', 'ip_address')
-    list_filter = ('action_type', 'model_name', 'timestamp')
+    list_select_related = ('user',)
+    list_filter = (
+        ('action_type', CachedChoicesFieldListFilter),
+        ('model_name', CachedAllValuesFieldListFilter),
+        ('timestamp', CachedDateFieldListFilter),
+    )
     search_fields = ('user__username', 'model_name', 'object_id', 'description')
     ordering = ('-timestamp',)
     readonly_fields = ('timestamp',)
@@ -388,6 +571,41 @@ class AuditLogAdmin(admin.ModelAdmin):
         return False  # Audit logs should not be deleted
 
 
+class ArchiveAdminMixin:
+    """Archived history is read-only"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TransactionArchive)
+class TransactionArchiveAdmin(ArchiveAdminMixin, EstimatedCountMixin, admin.ModelAdmin):
+    list_display = ('transaction_id', 'account_id', 'transaction_type', 'amount', 'status', 'created_at')
+    list_filter = (
+        ('period', CachedDateFieldListFilter),
+        ('transaction_type', CachedChoicesFieldListFilter),
+    )
+    search_fields = ('=transaction_id', '=reference_number')
+    ordering = ('-created_at',)
+
+
+@admin.register(AuditLogArchive)
+class AuditLogArchiveAdmin(ArchiveAdminMixin, EstimatedCountMixin, admin.ModelAdmin):
+    list_display = ('user_id', 'action_type', 'model_name', 'object_id', 'timestamp', 'ip_address')
+    list_filter = (
+        ('period', CachedDateFieldListFilter),
+        ('action_type', CachedChoicesFieldListFilter),
+    )
+    search_fields = ('=model_name', '=object_id')
+    ordering = ('-timestamp',)
+
+
 # Customize admin site headers
 admin.site.site_header = "Cooperative Banking System Administration"
 admin.site.site_title = "Banking Admin"
@@ -0,0 +1,127 @@
+"""Estimated and cached row counts for the large admin changelists"""
+import hashlib
+import json
+
+from django.contrib.admin.filters import (
+    AllValuesFieldListFilter, ChoicesFieldListFilter, DateFieldListFilter,
+)
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import metrics
+
+# Query string parameter that switches a changelist to exact counts for one request
+EXACT_COUNT_VAR = 'exact_count'
+
+# Planner estimates are only trusted above this many rows; smaller tables are counted
+ESTIMATE_THRESHOLD = 100000
+
+COUNT_CACHE_TIMEOUT = 300
+
+
+def wants_exact_count(request):
+    return getattr(request, 'exact_count', False)
+
+
+def planner_estimate(queryset):
+    """
+    Return the planner's row estimate for a queryset, or None if the backend has none.
+
+    Unfiltered querysets read the table statistics directly; filtered ones
+    take the top-level row estimate of their EXPLAIN plan. Only PostgreSQL
+    keeps statistics good enough for pagination.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    queryset = queryset.order_by()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 until the table has been vacuumed or analyzed
+            return row[0] if row and row[0] >= 0 else None
+
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_cache_key(prefix, queryset, *extra):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(repr((queryset.db, sql, params, extra)).encode()).hexdigest()
+    return f'banking_system:{prefix}:{queryset.model._meta.label_lower}:{digest}'
+
+
+def cached_result(key, compute, refresh=False):
+    """Return compute() from the count cache, recomputing it when refresh is set"""
+    result = None if refresh else cache.get(key)
+    metrics.record_cache('admin_counts', result is not None)
+    if result is None:
+        result = compute()
+        cache.set(key, result, COUNT_CACHE_TIMEOUT)
+    return result
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids COUNT(*) over large tables.
+
+    Where the planner estimates more than ESTIMATE_THRESHOLD rows that
+    estimate is used. Without planner statistics the exact count is cached
+    per filter combination for COUNT_CACHE_TIMEOUT seconds. Setting exact
+    recounts and refreshes the cache.
+    """
+    exact = False
+
+    @cached_property
+    def count(self):
+        if self.exact:
+            return self._cached_count(refresh=True)
+        estimate = planner_estimate(self.object_list)
+        if estimate is not None:
+            return estimate if estimate >= ESTIMATE_THRESHOLD else self.object_list.count()
+        return self._cached_count()
+
+    def _cached_count(self, refresh=False):
+        return cached_result(
+            count_cache_key('count', self.object_list.order_by()), self.object_list.count, refresh
+        )
+
+
+class CachedFacetsMixin:
+    """Serve facet counts from the count cache unless the request asked for exact counts"""
+
+    def get_facet_queryset(self, changelist):
+        filtered_qs = changelist.get_queryset(self.request, exclude_parameters=self.expected_parameters())
+        counts = self.get_facet_counts(changelist.pk_attname, filtered_qs)
+        key = count_cache_key('facets', filtered_qs.order_by(), self.field_path, repr(sorted(counts.items())))
+        return cached_result(key, lambda: filtered_qs.aggregate(**counts), wants_exact_count(self.request))
+
+
+class CachedChoicesFieldListFilter(CachedFacetsMixin, ChoicesFieldListFilter):
+    pass
+
+
+class CachedDateFieldListFilter(CachedFacetsMixin, DateFieldListFilter):
+    pass
+
+
+class CachedAllValuesFieldListFilter(CachedFacetsMixin, AllValuesFieldListFilter):
+    """AllValuesFieldListFilter whose DISTINCT scan for the choices is cached as well"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        choices = self.lookup_choices
+        self.lookup_choices = cached_result(
+            count_cache_key('choices', choices, field_path), lambda: list(choices), wants_exact_count(request)
+        )
@@ -0,0 +1,143 @@
+"""
+Monthly archival of Transaction and AuditLog history and queries spanning live and archived rows.
+
+Closed months are copied into TransactionArchive / AuditLogArchive and removed
+from the live tables in primary key chunks, so the live tables and their
+indexes only cover recent activity. The archive tables can live in a
+separate database (routers.ArchiveRouter). Copies use ignore_conflicts and
+deletes run after the copy commits, so an interrupted run is resumed
+safely by running it again.
+"""
+import heapq
+from datetime import date
+
+from django.db import connections, router, transaction as db_transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import search, snapshots
+from .models import (
+    AuditLog, AuditLogArchive, DividendPayment, LoanPayment, ShareTransaction, Transaction,
+    TransactionArchive,
+)
+from .statements import keyset, statement_period
+
+# Months kept in the live tables, counting the current one
+DEFAULT_RETENTION_MONTHS = 12
+
+ARCHIVE_CHUNK_SIZE = 5000
+
+TRANSACTION_FIELDS = (
+    'id', 'transaction_id', 'account_id', 'transaction_type', 'amount', 'balance_before', 'balance_after',
+    'description', 'reference_number', 'status', 'processed_by_id', 'processed_at', 'created_at',
+    'destination_account_id',
+)
+AUDIT_FIELDS = (
+    'id', 'user_id', 'action_type', 'model_name', 'object_id', 'description', 'ip_address', 'user_agent',
+    'timestamp',
+)
+
+# Statuses that can still change stay live whatever their age
+OPEN_TRANSACTION_STATUSES = ('pending',)
+
+
+def retention_cutoff(months=DEFAULT_RETENTION_MONTHS, today=None):
+    """First day of the oldest month kept live; everything before it is archivable"""
+    today = today or timezone.localdate()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archivable_transactions(cutoff):
+    """
+    Transactions created before cutoff that can leave the live table.
+
+    Loan, share and dividend payments keep a one-to-one link to their
+    Transaction that would cascade on delete, so linked rows stay live.
+    """
+    start, _ = statement_period(cutoff, cutoff)
+    return (
+        Transaction.objects.filter(created_at__lt=start)
+        .exclude(status__in=OPEN_TRANSACTION_STATUSES)
+        .exclude(pk__in=LoanPayment.objects.filter(transaction__isnull=False).values('transaction_id'))
+        .exclude(pk__in=ShareTransaction.objects.filter(transaction__isnull=False).values('transaction_id'))
+        .exclude(pk__in=DividendPayment.objects.filter(transaction__isnull=False).values('transaction_id'))
+    )
+
+
+def archivable_audit_logs(cutoff):
+    start, _ = statement_period(cutoff, cutoff)
+    return AuditLog.objects.filter(timestamp__lt=start)
+
+
+def _move(queryset, archive_model, fields, date_field, chunk_size, after_delete=None):
+    """Copy a queryset into its archive model chunk by chunk and delete the copied rows"""
+    live_model = queryset.model
+    live_db = router.db_for_write(live_model)
+    archive_db = router.db_for_write(archive_model)
+    rows = queryset.annotate(archive_period=TruncMonth(date_field)).order_by('pk')
+    moved = 0
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk).values(*fields, 'archive_period')[:chunk_size])
+        if not chunk:
+            return moved
+        ids = [row['id'] for row in chunk]
+        # With a separate archive database the copy commits before the live delete runs
+        with db_transaction.atomic(using=live_db):
+            with db_transaction.atomic(using=archive_db):
+                archive_model.objects.bulk_create(
+                    [archive_model(period=_month(row.pop('archive_period')), **row) for row in chunk],
+                    ignore_conflicts=True,
+                )
+            # Plain DELETE: a queryset delete would load every row to send per-object signals
+            connection = connections[live_db]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(live_model._meta.db_table)} '
+                    f'WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids,
+                )
+            if after_delete:
+                after_delete(chunk)
+        moved += len(chunk)
+        last_pk = ids[-1]
+
+
+def _month(value):
+    value = value.date() if hasattr(value, 'date') else value
+    return value.replace(day=1)
+
+
+def _transactions_removed(chunk):
+    search.remove('transaction', [row['id'] for row in chunk])
+    snapshots.invalidate_accounts({row['account_id'] for row in chunk})
+
+
+def archive_transactions(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE):
+    return _move(
+        archivable_transactions(cutoff), TransactionArchive, TRANSACTION_FIELDS, 'created_at', chunk_size,
+        after_delete=_transactions_removed,
+    )
+
+
+def archive_audit_logs(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE):
+    return _move(archivable_audit_logs(cutoff), AuditLogArchive, AUDIT_FIELDS, 'timestamp', chunk_size)
+
+
+def audit_trail(page_size=1000, **filters):
+    """
+    Yield (timestamp, id, user_id, action_type, model_name, object_id, description, ip_address)
+    newest first across live and archived audit logs.
+
+    filters are applied to both tables, so use plain column lookups such as
+    user_id, model_name, object_id or timestamp__gte.
+    """
+    columns = ('timestamp', 'id', 'user_id', 'action_type', 'model_name', 'object_id', 'description',
+               'ip_address')
+    streams = [
+        keyset(model.objects.filter(**filters).values_list(*columns), 'timestamp', page_size, descending=True)
+        for model in (AuditLog, AuditLogArchive)
+    ]
+    return heapq.merge(*streams, key=lambda row: (row[0], row[1]), reverse=True)
+
@@ -0,0 +1,120 @@
+"""Set-based loan arrears classification and portfolio-at-risk reporting"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import models, transaction as db_transaction
+from django.db.models import Case, Count, Func, Sum, Value, When
+from django.utils import timezone
+
+from . import metrics
+from .models import Loan
+
+PAR_REPORT_CACHE_KEY = 'banking_system:portfolio_at_risk'
+
+# The default cache is per process, so a report cached by the classification
+# job never reaches the web workers; theirs must expire on their own
+PAR_REPORT_CACHE_TIMEOUT = 600
+
+# Lower bound in days overdue of each bucket past 'current', oldest first
+BUCKET_THRESHOLDS = [('90_plus', 91), ('61_90', 61), ('31_60', 31), ('1_30', 1)]
+
+
+class DaysSince(Func):
+    """Whole days from a date column up to a fixed date"""
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, as_of, **extra):
+        super().__init__(Value(as_of, output_field=models.DateField()), expression, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function='DATEDIFF', template='%(function)s(%(expressions)s)',
+                           arg_joiner=', ', **extra_context)
+
+
+def par_report_cache_key(as_of):
+    return f'{PAR_REPORT_CACHE_KEY}:{as_of.isoformat()}'
+
+
+def classify_arrears(as_of=None):
+    """
+    Store days overdue and PAR bucket on every loan with two UPDATE statements.
+
+    Returns the portfolio-at-risk report for the new classification, which is
+    also cached for the report view.
+    """
+    as_of = as_of or timezone.now().date()
+    overdue = When(next_payment_date__lt=as_of, then=DaysSince('next_payment_date', as_of))
+    bucket = Case(
+        *[When(next_payment_date__lte=as_of - timedelta(days=days), then=Value(name))
+          for name, days in BUCKET_THRESHOLDS],
+        default=Value('current'),
+    )
+
+    with db_transaction.atomic():
+        Loan.objects.filter(status='active').update(
+            arrears_days=Case(overdue, default=Value(0)),
+            par_bucket=bucket,
+        )
+        Loan.objects.exclude(status='active').exclude(par_bucket='current', arrears_days=0).update(
+            arrears_days=0, par_bucket='current',
+        )
+
+    report = build_par_report(as_of)
+    cache.set(par_report_cache_key(as_of), report, PAR_REPORT_CACHE_TIMEOUT)
+    return report
+
+
+def build_par_report(as_of=None):
+    """Aggregate outstanding balances of active loans per PAR bucket"""
+    rows = {
+        row['par_bucket']: row
+        for row in Loan.objects.filter(status='active').values('par_bucket')
+        .annotate(loans=Count('id'), balance=Sum('balance')).order_by()
+    }
+    total = sum((row['balance'] for row in rows.values()), Decimal('0'))
+    buckets = []
+    for code, label in Loan.PAR_BUCKETS:
+        row = rows.get(code, {'loans': 0, 'balance': Decimal('0')})
+        buckets.append({
+            'code': code,
+            'label': label,
+            'loans': row['loans'],
+            'balance': row['balance'],
+            'share': (row['balance'] / total * 100) if total else Decimal('0'),
+        })
+
+    at_risk_30 = sum((b['balance'] for b in buckets if b['code'] in ('31_60', '61_90', '90_plus')), Decimal('0'))
+    return {
+        'as_of': as_of or timezone.now().date(),
+        'buckets': buckets,
+        'total_balance': total,
+        'par_30': (at_risk_30 / total * 100) if total else Decimal('0'),
+    }
+
+
+def portfolio_at_risk_report():
+    """
+    Return today's PAR report from the cache, building it from the stored classification on a miss.
+
+    Entries are keyed on the date and expire after PAR_REPORT_CACHE_TIMEOUT,
+    so a worker picks up a new classification run within that time even
+    when the cache is not shared between processes.
+    """
+    as_of = timezone.now().date()
+    key = par_report_cache_key(as_of)
+    report = cache.get(key)
+    metrics.record_cache('par_report', report is not None)
+    if report is None:
+        report = build_par_report(as_of)
+        cache.set(key, report, PAR_REPORT_CACHE_TIMEOUT)
+    return report
@@ -0,0 +1,189 @@
+"""
+Asynchronous, batched AuditLog writer.
+
+record() builds the AuditLog row on the calling thread and queues it once
+the caller's DB transaction commits, so rolled-back work leaves no trail. A
+daemon thread drains the queue with bulk_create whenever AUDIT_BATCH_SIZE
+events are waiting or AUDIT_FLUSH_INTERVAL_MS has passed. Shutdown drains
+whatever is still queued. A failed insert keeps its batch for the next
+attempt, made after a delay that doubles while the failures go on, and
+nothing more is taken off the queue until it succeeds, so a database
+outage or a long-held SQLite write lock backs up into the bounded queue.
+A batch rejected by a constraint is split until the offending rows are
+found; those are logged and dropped.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import (
+    DatabaseError, IntegrityError, close_old_connections, connection, transaction as db_transaction,
+)
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'AUDIT_FLUSH_INTERVAL_MS', 200) / 1000
+BATCH_SIZE = getattr(settings, 'AUDIT_BATCH_SIZE', 500)
+
+# A full queue blocks record() rather than dropping events
+MAX_QUEUED = 100000
+
+# A failed batch is retried after RETRY_DELAY seconds, doubling up to MAX_RETRY_DELAY while it keeps failing
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 30
+
+# Request being served, set by AuditContextMiddleware
+current_request = ContextVar('audit_request', default=None)
+
+
+def client_details(request):
+    """Return (user, ip_address, user_agent) for a request, or blanks outside one"""
+    if request is None:
+        return None, None, ''
+    user = getattr(request, 'user', None)
+    return (
+        user if user is not None and user.is_authenticated else None,
+        request.META.get('REMOTE_ADDR') or None,
+        request.META.get('HTTP_USER_AGENT', '')[:500],
+    )
+
+
+class AuditWriter:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(MAX_QUEUED)
+        self.pending = []  # batch taken off the queue but not yet written
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.stopping = threading.Event()
+
+    def put(self, entries):
+        self._ensure_thread()
+        for entry in entries:
+            self.queue.put(entry)
+
+    def _ensure_thread(self):
+        # A forked worker inherits the object but not the thread
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                    self.pid = os.getpid()
+                    self.stopping.clear()
+                    self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                    self.thread.start()
+
+    def _drain(self, deadline=None):
+        """Take up to a batch of queued entries, waiting until deadline for more if one is given"""
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                if deadline is None:
+                    batch.append(self.queue.get_nowait())
+                else:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _insert(self, entries, done):
+        """bulk_create entries, halving a batch that violates a constraint until the bad rows are isolated"""
+        try:
+            AuditLog.objects.bulk_create(entries)
+        except IntegrityError:
+            if len(entries) > 1:
+                middle = len(entries) // 2
+                self._insert(entries[:middle], done)
+                self._insert(entries[middle:], done)
+                return
+            bad = entries[0]
+            logger.exception("Dropping audit event that cannot be stored: %s %s %s by user %s",
+                             bad.action_type, bad.model_name, bad.object_id, bad.user_id)
+        done.extend(entries)
+
+    def _write(self):
+        if not self.pending:
+            return True
+        done = []
+        try:
+            self._insert(self.pending, done)
+        except DatabaseError:
+            logger.exception("Audit log flush of %s events failed; retrying", len(self.pending) - len(done))
+            connection.close()
+            written = {id(entry) for entry in done}
+            self.pending = [entry for entry in self.pending if id(entry) not in written]
+            return False
+        self.pending = []
+        return True
+
+    def _run(self):
+        delay = RETRY_DELAY
+        try:
+            while not self.stopping.is_set():
+                # A batch that failed is retried alone; new events wait in the bounded queue
+                batch = [] if self.pending else self._drain(time.monotonic() + self.flush_interval)
+                with self.lock:
+                    self.pending.extend(batch)
+                    written = self._write()
+                if written:
+                    delay = RETRY_DELAY
+                else:
+                    self.stopping.wait(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    def flush(self):
+        """Write every queued event from the calling thread"""
+        with self.lock:
+            while True:
+                if not self.pending:
+                    self.pending = self._drain()
+                if not self.pending or not self._write():
+                    break
+
+    def shutdown(self, timeout=5):
+        self.stopping.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(timeout)
+        self.flush()
+
+
+writer = AuditWriter()
+atexit.register(writer.shutdown)
+
+
+def entry(action_type, model_name, object_id, description='', user=None, ip_address=None, user_agent=None):
+    """Build an unsaved AuditLog, filling user and client details from the current request"""
+    request_user, request_ip, request_agent = client_details(current_request.get())
+    user = user if user is not None else request_user
+    return AuditLog(
+        user_id=getattr(user, 'pk', user),
+        action_type=action_type,
+        model_name=model_name,
+        object_id=str(object_id),
+        description=description,
+        ip_address=ip_address if ip_address is not None else request_ip,
+        user_agent=user_agent if user_agent is not None else request_agent,
+        timestamp=timezone.now(),
+    )
+
+
+def record_entries(entries):
+    """Queue AuditLog rows for the background writer once the current transaction commits"""
+    if entries:
+        db_transaction.on_commit(lambda: writer.put(entries))
+
+
+def record(action_type, model_name, object_id, description='', **details):
+    record_entries([entry(action_type, model_name, object_id, description, **details)])
@@ -0,0 +1,164 @@
+"""Set-based dividend entitlements and chunked, resumable dividend payouts"""
+from collections import namedtuple
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import (
+    Case, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, ExtractMonth
+
+from .models import Account, AccountType, DividendPayment, Member, ShareTransaction
+from .posting import Posting, post_batch
+
+PAYOUT_CHUNK_SIZE = 2000
+
+CENT = Decimal('0.01')
+
+MONEY = DecimalField(max_digits=18, decimal_places=4)
+
+RunResult = namedtuple('RunResult', ['paid', 'amount', 'rejected', 'no_account', 'complete'])
+DividendTotals = namedtuple('DividendTotals', ['members', 'amount', 'no_account'])
+
+
+def _share_sum(member_filter, amount):
+    """Correlated per-member sum of signed share movements; sales reduce holdings"""
+    signed = Case(
+        When(transaction_type='sale', then=-amount),
+        default=amount,
+        output_field=MONEY,
+    )
+    return Coalesce(
+        Subquery(
+            ShareTransaction.objects.filter(member=OuterRef('pk'), **member_filter)
+            .order_by().values('member').annotate(total=Sum(signed)).values('total')[:1],
+            output_field=MONEY,
+        ),
+        Value(Decimal('0')),
+        output_field=MONEY,
+    )
+
+
+def entitlements(dividend, pro_rate=False):
+    """
+    Active members annotated with their dividend base (share capital) and payout account.
+
+    total_shares holds each member's share capital today. Movements after
+    the dividend year are backed out to get the year-end holding. With
+    pro_rate, capital bought during the year only counts for the months it
+    was held, and capital sold counts until the month of the sale.
+    """
+    year_start = date(dividend.year, 1, 1)
+    year_end = date(dividend.year, 12, 31)
+
+    base = F('total_shares') - _share_sum({'transaction_date__gt': year_end}, F('total_amount'))
+    if pro_rate:
+        # Months of the year before the movement, as a fraction of the year
+        unheld = ExpressionWrapper(
+            F('total_amount') * (ExtractMonth('transaction_date') - 1) / Value(Decimal('12')),
+            output_field=MONEY,
+        )
+        base = base - _share_sum(
+            {'transaction_date__gte': year_start, 'transaction_date__lte': year_end}, unheld
+        )
+
+    payout_account = (
+        Account.objects.filter(member=OuterRef('pk'), status__in=Account.POSTABLE_STATUSES)
+        .filter(AccountType.savings_filter('account_type__'))
+        .order_by('pk').values('pk')[:1]
+    )
+    return (
+        Member.objects.filter(status='active', membership_date__lte=year_end)
+        .exclude(Exists(DividendPayment.objects.filter(dividend=dividend, member=OuterRef('pk'))))
+        .annotate(dividend_base=ExpressionWrapper(base, output_field=MONEY),
+                  payout_account_id=Subquery(payout_account))
+        .filter(dividend_base__gt=0)
+    )
+
+
+def payout_amount(base, rate_percentage):
+    return (Decimal(base) * rate_percentage / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def dividend_totals(dividend, pro_rate=False):
+    """
+    DividendTotals for the members still to pay.
+
+    Members without a savings account that can take the credit are counted
+    in no_account rather than members, as run_dividend skips them.
+    """
+    members = no_account = 0
+    amount = Decimal('0')
+    rows = entitlements(dividend, pro_rate).values_list('dividend_base', 'payout_account_id').iterator()
+    for base, account_id in rows:
+        payout = payout_amount(base, dividend.rate_percentage)
+        if account_id is None:
+            no_account += 1
+        elif payout > 0:
+            members += 1
+            amount += payout
+    return DividendTotals(members, amount, no_account)
+
+
+def run_dividend(dividend, pro_rate=False, chunk_size=PAYOUT_CHUNK_SIZE, processed_by=None):
+    """
+    Pay a declared dividend into each entitled member's savings account.
+
+    Members are taken in primary key chunks. Each chunk's credits are posted
+    by post_batch, and its DividendPayment rows are written in the same DB
+    transaction. Members already holding a DividendPayment for this dividend
+    are excluded, so a rerun after an interruption or a failed posting picks
+    up where the last one stopped. The dividend is marked paid once no
+    entitled member is left unpaid.
+    """
+    queryset = entitlements(dividend, pro_rate).order_by('pk')
+    paid = rejected = no_account = 0
+    paid_amounts = []
+    last_pk = 0
+    while True:
+        members = list(
+            queryset.filter(pk__gt=last_pk)
+            .values_list('pk', 'dividend_base', 'payout_account_id')[:chunk_size]
+        )
+        if not members:
+            break
+        last_pk = members[-1][0]
+
+        payable = []
+        for member_id, base, account_id in members:
+            amount = payout_amount(base, dividend.rate_percentage)
+            if account_id is None:
+                no_account += 1
+            elif amount > 0:
+                payable.append((member_id, Decimal(base).quantize(CENT), amount, account_id))
+        if not payable:
+            continue
+
+        def link(transactions, payable=payable):
+            payments = [
+                DividendPayment(
+                    dividend=dividend, member_id=member_id, shares_held=shares, amount=amount,
+                    payment_date=dividend.payment_date, transaction=txn,
+                )
+                for (member_id, shares, amount, _), txn in zip(payable, transactions)
+                if txn.status == 'completed'
+            ]
+            DividendPayment.objects.bulk_create(payments)
+            paid_amounts.extend(payment.amount for payment in payments)
+
+        result = post_batch(
+            (Posting(account_id, 'dividend_payment', amount,
+                     f"Dividend {dividend.year} at {dividend.rate_percentage}%",
+                     f"DIV-{dividend.year}", getattr(processed_by, 'pk', None))
+             for _, _, amount, account_id in payable),
+            chunk_size=len(payable),
+            on_chunk=link,
+        )
+        paid += result.posted
+        rejected += result.rejected
+
+    complete = not rejected and not no_account
+    if complete and not dividend.is_paid:
+        dividend.is_paid = True
+        dividend.save(update_fields=['is_paid'])
+    return RunResult(paid, sum(paid_amounts, Decimal('0')), rejected, no_account, complete)
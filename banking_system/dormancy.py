@@ -0,0 +1,65 @@
+"""
+Dormancy: move active accounts with no customer activity for DORMANCY_DAYS to dormant.
+
+One UPDATE over the (status, last_transaction_date) index flags every
+inactive account and stamps dormant_since with the run's time. The owners'
+notifications are then written with bulk_create from the rows carrying that
+stamp. A customer posting reactivates the account in the posting engine
+(posting.activity_fields).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import audit, snapshots
+from .models import Account, Notification
+
+DORMANCY_DAYS = getattr(settings, 'DORMANCY_DAYS', 365)
+
+NOTIFICATION_CHUNK_SIZE = 2000
+
+
+def inactive_accounts(cutoff):
+    """Active accounts without activity since cutoff; accounts never used count from their opening"""
+    return Account.objects.filter(status='active').filter(
+        Q(last_transaction_date__lt=cutoff) | Q(last_transaction_date__isnull=True, created_at__lt=cutoff)
+    )
+
+
+def mark_dormant(days=DORMANCY_DAYS, now=None, chunk_size=NOTIFICATION_CHUNK_SIZE):
+    """Flag accounts inactive for days as dormant, notify their owners and return how many were flagged"""
+    now = now or timezone.now()
+    with db_transaction.atomic():
+        flagged = inactive_accounts(now - timedelta(days=days)).update(
+            status='dormant', dormant_since=now, updated_at=now
+        )
+        if not flagged:
+            return 0
+
+        flagged_accounts = Account.objects.filter(status='dormant', dormant_since=now)
+        rows = (
+            flagged_accounts.values_list('account_number', 'member__user_id')
+            .iterator(chunk_size=chunk_size)
+        )
+        notifications = []
+        for account_number, user_id in rows:
+            notifications.append(Notification(
+                recipient_id=user_id,
+                title='Account marked dormant',
+                message=(f"Account {account_number} has had no activity for {days} days and is now dormant. "
+                         "Any deposit, withdrawal or transfer on it will reactivate it."),
+                notification_type='account_update',
+            ))
+            if len(notifications) >= chunk_size:
+                Notification.objects.bulk_create(notifications)
+                notifications = []
+        Notification.objects.bulk_create(notifications)
+
+        # bulk UPDATE and bulk_create send no signals, so refresh the owners' dashboards here
+        snapshots.invalidate_members(flagged_accounts.values('member_id'), 'accounts', 'notifications')
+        audit.record('update', 'Account', '',
+                     f"{flagged} accounts marked dormant after {days} days without activity")
+    return flagged
@@ -0,0 +1,93 @@
+"""
+Monthly account fees.
+
+Each account type's monthly_fee is charged to its active accounts whose
+balance is below the type's minimum_balance; accounts holding the minimum
+are waived. Who owes is worked out with one query per account type, and
+the fee_charge postings go through post_batch in chunks. Every charge
+carries the reference FEE-YYYYMM, so accounts already charged for the
+month are left out of any rerun.
+"""
+from collections import namedtuple
+from datetime import date
+
+from django.db.models import Count, Q
+
+from .interest import month_bounds
+from .models import Account, AccountType, Transaction
+from .posting import Posting, post_batch
+from .statements import statement_period
+
+FEE_CHUNK_SIZE = 1000
+
+FeeTotals = namedtuple('FeeTotals', ['account_type', 'accounts', 'amount', 'insufficient'])
+
+
+def reference(year, month):
+    return f"FEE-{year}{month:02d}"
+
+
+def fee_account_types():
+    return AccountType.objects.filter(monthly_fee__gt=0).order_by('pk')
+
+
+def accounts_owing(account_type, year, month):
+    """Active accounts of a type that owe its monthly fee for the month and have not been charged yet"""
+    _, last_day = month_bounds(year, month)
+    _, end = statement_period(last_day, last_day)
+    charged = Transaction.objects.filter(
+        transaction_type='fee_charge', status='completed', created_at__gte=end,
+        reference_number=reference(year, month),
+    ).values('account_id')
+    return (
+        Account.objects.filter(account_type=account_type, status='active',
+                               balance__lt=account_type.minimum_balance)
+        .exclude(pk__in=charged)
+    )
+
+
+def fee_totals(year, month):
+    """
+    FeeTotals per account type for the fees still to charge for the month.
+
+    insufficient counts the owing accounts whose available balance cannot
+    cover the fee; they are skipped rather than overdrawn.
+    """
+    totals = []
+    for account_type in fee_account_types():
+        fee = account_type.monthly_fee
+        counts = accounts_owing(account_type, year, month).aggregate(
+            accounts=Count('pk', filter=Q(available_balance__gte=fee)),
+            insufficient=Count('pk', filter=Q(available_balance__lt=fee)),
+        )
+        totals.append(FeeTotals(account_type, counts['accounts'], fee * counts['accounts'], counts['insufficient']))
+    return totals
+
+
+def charge_fees(year, month, chunk_size=FEE_CHUNK_SIZE, processed_by=None):
+    """Post the month's fee_charge transactions and return the FeeTotals actually charged"""
+    first_day = date(year, month, 1)
+    totals = []
+    for account_type in fee_account_types():
+        fee = account_type.monthly_fee
+        owing = accounts_owing(account_type, year, month).order_by('pk')
+        insufficient = owing.filter(available_balance__lt=fee).count()
+        payable = owing.filter(available_balance__gte=fee)
+        charged = 0
+        last_pk = 0
+        while True:
+            account_ids = list(payable.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not account_ids:
+                break
+            last_pk = account_ids[-1]
+            result = post_batch(
+                (Posting(account_id, 'fee_charge', fee, f"{account_type.name} monthly fee for {first_day:%B %Y}",
+                         reference(year, month), getattr(processed_by, 'pk', None))
+                 for account_id in account_ids),
+                chunk_size=len(account_ids),
+            )
+            charged += result.posted
+            # A rejection here means the balance moved since the query; the rerun picks it up
+            insufficient += result.rejected
+        totals.append(FeeTotals(account_type, charged, fee * charged, insufficient))
+    return totals
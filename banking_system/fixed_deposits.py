@@ -0,0 +1,164 @@
+"""
+Fixed deposit maturity: settle or roll over every deposit due on or before a date.
+
+Due deposits are read in (maturity_date, id) order from the
+(status, maturity_date) index, so one run works through any backlog of
+missed days. Each chunk credits the term's interest with post_batch and
+updates the deposits in the same DB transaction. A rolled-over deposit
+whose new term has also run out comes up again later in the same run.
+
+The term's interest uses the actual/365 day count of the monthly accrual
+(interest.deposit_interest), so the credit at maturity is exactly what
+was accrued into Account.interest_earned over the term.
+"""
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .interest import deposit_interest, term_interest
+from .models import FixedDeposit
+from .posting import Posting, add_interest_earned, post_batch
+
+MATURITY_CHUNK_SIZE = 1000
+
+FIELDS = (
+    'maturity_date', 'id', 'account_id', 'principal_amount', 'interest_rate', 'term_months', 'maturity_amount',
+    'start_date', 'status', 'auto_renew', 'interest_accrued_to',
+)
+
+MaturityResult = namedtuple('MaturityResult', ['matured', 'renewed', 'interest', 'rejected'])
+
+
+def add_months(value, months):
+    """Same day of the month months later, clamped to the end of shorter months"""
+    index = value.year * 12 + value.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def maturity_amount(principal, rate, start_date, maturity_date):
+    """Principal plus simple interest for the term"""
+    return principal + Decimal(term_interest(principal, rate, start_date, maturity_date)) / 100
+
+
+def due_deposits(through):
+    return FixedDeposit.objects.filter(status__in=FixedDeposit.OPEN_STATUSES, maturity_date__lte=through)
+
+
+def _settle(deposit):
+    """Move a matured deposit's row to its next state: rolled over when auto_renew is set, else matured"""
+    deposit.interest_accrued_to = deposit.maturity_date - timedelta(days=1)
+    if not deposit.auto_renew:
+        deposit.status = 'matured'
+        return deposit
+    deposit.status = 'renewed'
+    deposit.principal_amount = deposit.maturity_amount
+    deposit.start_date = deposit.maturity_date
+    deposit.maturity_date = add_months(deposit.start_date, deposit.term_months)
+    deposit.maturity_amount = maturity_amount(
+        deposit.principal_amount, deposit.interest_rate, deposit.start_date, deposit.maturity_date
+    )
+    return deposit
+
+
+def _accrue_remaining(deposits):
+    """Accrue the days between the last monthly accrual and maturity into Account.interest_earned"""
+    cents = deposit_interest(
+        [d.principal_amount for d in deposits], [d.interest_rate for d in deposits],
+        [d.start_date for d in deposits], [d.maturity_date for d in deposits],
+        [d.interest_accrued_to or date.min for d in deposits],
+        max(d.maturity_date for d in deposits),
+    )
+    amounts = {}
+    for deposit, value in zip(deposits, cents):
+        if value:
+            amounts[deposit.account_id] = amounts.get(deposit.account_id, Decimal('0')) + Decimal(int(value)) / 100
+    add_interest_earned(amounts)
+
+
+def _settle_all(deposits):
+    if not deposits:
+        return
+    _accrue_remaining(deposits)
+    FixedDeposit.objects.bulk_update(
+        [_settle(d) for d in deposits],
+        ['status', 'principal_amount', 'maturity_amount', 'start_date', 'maturity_date', 'interest_accrued_to'],
+    )
+
+
+def _settle_chunk(deposits, processed_by, settled, interest, rejected):
+    """Credit one chunk of due deposits and settle those whose credit went through"""
+    for deposit in deposits:
+        # Replaces any amount entered when the deposit was opened with the one accrued
+        deposit.maturity_amount = maturity_amount(
+            deposit.principal_amount, deposit.interest_rate, deposit.start_date, deposit.maturity_date
+        )
+    payable = [d for d in deposits if d.maturity_amount > d.principal_amount]
+    # Nothing to credit, e.g. a zero rate: settled without a transaction
+    unpaid = [d for d in deposits if d.maturity_amount <= d.principal_amount]
+
+    def settle(transactions):
+        credited = []
+        for deposit, txn in zip(payable, transactions):
+            if txn.status == 'completed':
+                credited.append(deposit)
+                interest.append(txn.amount)
+            else:
+                rejected.add(deposit.pk)
+        _settle_all(credited + unpaid)
+        settled.extend(credited + unpaid)
+
+    if not payable:
+        with db_transaction.atomic():
+            settle([])
+        return
+    post_batch(
+        (Posting(d.account_id, 'interest_payment', d.maturity_amount - d.principal_amount,
+                 f"Fixed deposit interest at maturity on {d.maturity_date}",
+                 f"FDM-{d.pk}-{d.maturity_date:%Y%m%d}", getattr(processed_by, 'pk', None))
+         for d in payable),
+        chunk_size=len(payable),
+        on_chunk=settle,
+    )
+
+
+def process_maturities(through=None, chunk_size=MATURITY_CHUNK_SIZE, processed_by=None):
+    """
+    Settle every open deposit maturing on or before through (default today).
+
+    The term's interest is credited to the deposit account as an
+    interest_payment and recorded in maturity_amount. Deposits with auto_renew
+    then start a new term on the maturity date with principal and interest
+    as the new principal; the others are marked matured. A rolled-over
+    term that is already due is settled by a further pass over the index,
+    so a backlog of missed days clears in one run. A deposit whose credit
+    is rejected, e.g. because its account is frozen, is left open for the
+    next run.
+    """
+    through = through or timezone.localdate()
+    settled = []
+    interest = []
+    rejected = set()
+    while True:
+        queryset = due_deposits(through).exclude(pk__in=rejected).order_by('maturity_date', 'pk')
+        passed = len(settled)
+        last = None
+        while True:
+            page = queryset
+            if last is not None:
+                page = page.filter(Q(maturity_date__gt=last[0]) | Q(maturity_date=last[0], pk__gt=last[1]))
+            deposits = [FixedDeposit(**dict(zip(FIELDS, row))) for row in page.values_list(*FIELDS)[:chunk_size]]
+            if not deposits:
+                break
+            last = (deposits[-1].maturity_date, deposits[-1].pk)
+            _settle_chunk(deposits, processed_by, settled, interest, rejected)
+        if not any(d.status == 'renewed' and d.maturity_date <= through for d in settled[passed:]):
+            break
+
+    renewed = sum(1 for d in settled if d.status == 'renewed')
+    return MaturityResult(len(settled) - renewed, renewed, sum(interest, Decimal('0')), len(rejected))
@@ -0,0 +1,291 @@
+"""
+Daily interest accrual with monthly capitalization.
+
+Interest accrues every day on the end-of-day balance at the account type's
+annual rate and is capitalized once a month as an ``interest_payment``
+credit with reference INT-YYYYMM. Daily balances are rebuilt from the
+current balance by backing out the completed postings made since the
+start of the month, one (accounts, days) array per account-id range, and
+the ranges are computed by separate worker processes. Fixed deposits
+accrue at their own rate on the principal into Account.interest_earned
+only; the interest itself is paid out at maturity.
+"""
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+
+import numpy as np
+from django.db import connection, connections, transaction as db_transaction
+from django.db.models import Q
+
+from .models import Account, FixedDeposit, Transaction
+from .posting import Posting, add_interest_earned, post_batch
+from .statements import statement_period
+
+# Day count convention: actual days over a 365-day year
+DAYS_IN_YEAR = 365
+
+POSTING_CHUNK_SIZE = 1000
+
+# Accounts per worker task; bounds the (accounts, days) balance array
+RANGE_SIZE = 20000
+
+AccrualResult = namedtuple('AccrualResult', ['posted', 'amount', 'rejected', 'deposits', 'accrued'])
+
+
+def reference(year, month):
+    return f"INT-{year}{month:02d}"
+
+
+def month_bounds(year, month):
+    """First and last day of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def interest_bearing_accounts(year, month):
+    """
+    Accounts whose balance earns interest for the month and that have not been credited for it yet.
+
+    Fixed deposit accounts are left out; they accrue through accrue_deposits.
+    """
+    _, last_day = month_bounds(year, month)
+    _, end = statement_period(last_day, last_day)
+    credited = Transaction.objects.filter(
+        transaction_type='interest_payment', status='completed', created_at__gte=end,
+        reference_number=reference(year, month),
+    ).values('account_id')
+    return (
+        Account.objects.filter(account_type__interest_rate__gt=0, status__in=Account.POSTABLE_STATUSES,
+                               fixeddeposit__isnull=True)
+        .exclude(pk__in=credited)
+    )
+
+
+def daily_balances(current, rows, day_ends):
+    """
+    End-of-day balances in cents, shape (accounts, days).
+
+    current holds each account's balance now and rows are
+    (account indexes, timestamps, signed cents) arrays, or None, for the completed postings
+    made since the first day; postings after the last day only serve to back the
+    balance out to the end of the month.
+    """
+    days = len(day_ends)
+    deltas = np.zeros((len(current), days + 1), dtype=np.int64)
+    if rows is not None:
+        index, timestamps, cents = rows
+        # Day a posting falls on, or the extra column for anything after the month
+        np.add.at(deltas, (index, np.searchsorted(day_ends, timestamps, side='right')), cents)
+    closing = current - deltas[:, days]
+    in_month = deltas[:, :days]
+    return closing[:, None] - in_month.sum(axis=1)[:, None] + np.cumsum(in_month, axis=1)
+
+
+def accrue_range(year, month, low, high):
+    """
+    Compute (account_id, interest in cents) for interest-bearing accounts with low <= pk <= high.
+
+    Balances and postings are read in one snapshot so a posting made
+    meanwhile cannot be counted in one and missed in the other.
+    """
+    first_day, last_day = month_bounds(year, month)
+    start, _ = statement_period(first_day, first_day)
+    day_ends = np.array([
+        statement_period(first_day + timedelta(days=offset), first_day + timedelta(days=offset))[1].timestamp()
+        for offset in range(last_day.day)
+    ])
+
+    with db_transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        accounts = list(
+            interest_bearing_accounts(year, month).filter(pk__gte=low, pk__lte=high)
+            .order_by('pk').values_list('pk', 'balance', 'account_type__interest_rate')
+        )
+        if not accounts:
+            return []
+        account_ids = {pk for pk, _, _ in accounts}
+        # Range filters keep to the account index; accounts outside the set are dropped below
+        sent = Q(account_id__gte=low, account_id__lte=high)
+        received = Q(transaction_type='transfer', destination_account_id__gte=low, destination_account_id__lte=high)
+        postings = (
+            Transaction.objects.filter(sent | received, status='completed', created_at__gte=start)
+            .values_list('account_id', 'destination_account_id', 'transaction_type', 'amount', 'created_at')
+        )
+        rows = []
+        for account_id, destination_id, transaction_type, amount, created_at in postings.iterator(chunk_size=5000):
+            cents = int(amount * 100)
+            if account_id in account_ids:
+                sign = 1 if transaction_type in Transaction.CREDIT_TYPES else -1
+                rows.append((account_id, created_at.timestamp(), sign * cents))
+            if transaction_type == 'transfer' and destination_id in account_ids:
+                rows.append((destination_id, created_at.timestamp(), cents))
+
+    ids = np.array([pk for pk, _, _ in accounts], dtype=np.int64)
+    current = np.array([int(balance * 100) for _, balance, _ in accounts], dtype=np.int64)
+    rates = np.array([float(rate) for _, _, rate in accounts])
+    if rows:
+        columns = list(zip(*rows))
+        rows = (
+            np.searchsorted(ids, np.array(columns[0], dtype=np.int64)),
+            np.array(columns[1]),
+            np.array(columns[2], dtype=np.int64),
+        )
+    balances = daily_balances(current, rows or None, day_ends)
+
+    # Balance-days: overdrawn days earn nothing
+    balance_days = np.maximum(balances, 0).sum(axis=1)
+    interest = np.floor(balance_days * rates / (100 * DAYS_IN_YEAR) + 0.5).astype(np.int64)
+    return [(int(pk), int(cents)) for pk, cents in zip(ids, interest) if cents > 0]
+
+
+def account_ranges(ids, size):
+    """Split sorted account ids into (low, high) ranges of at most size accounts"""
+    return [(ids[start], ids[min(start + size, len(ids)) - 1]) for start in range(0, len(ids), size)]
+
+
+def _accrue_range(args):
+    try:
+        return accrue_range(*args)
+    finally:
+        connections.close_all()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def compute_interest(year, month, workers=1, range_size=RANGE_SIZE):
+    """
+    Return [(account_id, interest in cents)] for every account still to be credited for the month.
+
+    Account-id ranges are spread over a pool of worker processes. Each
+    worker opens its own database connection, so the parent's connections
+    are closed before the pool forks.
+    """
+    ids = list(interest_bearing_accounts(year, month).order_by('pk').values_list('pk', flat=True))
+    tasks = [(year, month, low, high) for low, high in account_ranges(ids, range_size)]
+    if workers <= 1 or len(tasks) <= 1:
+        return [credit for task in tasks for credit in accrue_range(*task)]
+
+    connections.close_all()
+    with get_context().Pool(min(workers, len(tasks)), initializer=_init_worker) as pool:
+        return [credit for credits in pool.imap(_accrue_range, tasks) for credit in credits]
+
+
+def capitalize(credits, year, month, chunk_size=POSTING_CHUNK_SIZE, processed_by=None):
+    """Post interest credits and add them to Account.interest_earned in the same DB transactions"""
+    paid = []
+
+    def earned(transactions):
+        amounts = {txn.account_id: txn.amount for txn in transactions if txn.status == 'completed'}
+        add_interest_earned(amounts)
+        paid.extend(amounts.values())
+
+    first_day, _ = month_bounds(year, month)
+    result = post_batch(
+        (Posting(account_id, 'interest_payment', Decimal(cents) / 100,
+                 f"Interest for {first_day:%B %Y}", reference(year, month), getattr(processed_by, 'pk', None))
+         for account_id, cents in credits),
+        chunk_size=chunk_size,
+        on_chunk=earned,
+    )
+    return result, sum(paid, Decimal('0'))
+
+
+def deposits_to_accrue(last_day):
+    return FixedDeposit.objects.filter(status__in=FixedDeposit.OPEN_STATUSES, start_date__lte=last_day).filter(
+        Q(interest_accrued_to__isnull=True) | Q(interest_accrued_to__lt=last_day)
+    )
+
+
+def deposit_interest(principals, rates, start_dates, maturity_dates, accrued_to, last_day):
+    """
+    Simple daily interest in cents from the day after accrued_to (or the start date) through last_day.
+
+    Accrual stops the day before maturity, so a deposit that has missed
+    runs catches up on every day since it was last accrued. Each amount is
+    the rounded interest from the start date through last_day less the
+    rounded interest through accrued_to, so a term's accruals add up to
+    exactly its term_interest.
+    """
+    start = _ordinals(start_dates)
+    first = np.maximum(start, _ordinals(accrued_to) + 1)
+    last = np.minimum(_ordinals(maturity_dates) - 1, last_day.toordinal())
+    principal_cents = np.array([int(p * 100) for p in principals], dtype=np.float64)
+    rates = np.array([float(rate) for rate in rates])
+    through_last = _interest_cents(principal_cents, rates, np.maximum(last - start + 1, 0))
+    before_first = _interest_cents(principal_cents, rates, np.maximum(first - start, 0))
+    return np.maximum(through_last - before_first, 0)
+
+
+def term_interest(principal, rate, start_date, maturity_date):
+    """Interest in cents for a whole deposit term, on the same day count as deposit_interest"""
+    return int(deposit_interest([principal], [rate], [start_date], [maturity_date], [date.min], maturity_date)[0])
+
+
+def _interest_cents(principal_cents, rates, days):
+    return np.floor(principal_cents * rates * days / (100 * DAYS_IN_YEAR) + 0.5).astype(np.int64)
+
+
+def _ordinals(dates):
+    return np.array([value.toordinal() for value in dates], dtype=np.int64)
+
+
+def accrue_deposits(year, month, chunk_size=POSTING_CHUNK_SIZE, dry_run=False):
+    """
+    Accrue fixed deposit interest through the end of the month into Account.interest_earned.
+
+    FixedDeposit.interest_accrued_to records how far each deposit has been
+    accrued and moves forward in the same DB transaction as the amounts, so
+    a rerun for the same month adds nothing. Returns (deposits, amount).
+    """
+    _, last_day = month_bounds(year, month)
+    queryset = deposits_to_accrue(last_day).order_by('pk')
+    count = 0
+    total = Decimal('0')
+    last_pk = 0
+    while True:
+        deposits = list(
+            queryset.filter(pk__gt=last_pk).values_list(
+                'pk', 'account_id', 'principal_amount', 'interest_rate', 'start_date', 'maturity_date',
+                'interest_accrued_to',
+            )[:chunk_size]
+        )
+        if not deposits:
+            break
+        last_pk = deposits[-1][0]
+
+        pks, account_ids, principals, rates, start_dates, maturity_dates, accrued_to = zip(*deposits)
+        accrued_to = [value or date.min for value in accrued_to]
+        cents = deposit_interest(principals, rates, start_dates, maturity_dates, accrued_to, last_day)
+        amounts = {account_id: Decimal(int(value)) / 100 for account_id, value in zip(account_ids, cents) if value}
+        count += len(amounts)
+        total += sum(amounts.values(), Decimal('0'))
+        if dry_run:
+            continue
+        with db_transaction.atomic():
+            add_interest_earned(amounts)
+            FixedDeposit.objects.filter(pk__in=pks).update(interest_accrued_to=last_day)
+    return count, total
+
+
+def run_accrual(year, month, workers=1, chunk_size=POSTING_CHUNK_SIZE, processed_by=None, dry_run=False):
+    """
+    Capitalize a closed month's interest on interest-bearing accounts and accrue fixed deposits.
+
+    Accounts already holding their INT-YYYYMM credit are skipped, so a rerun
+    after an interruption only posts what is missing.
+    """
+    credits = compute_interest(year, month, workers)
+    if dry_run:
+        posted, amount, rejected = len(credits), Decimal(sum(cents for _, cents in credits)) / 100, 0
+    else:
+        result, amount = capitalize(credits, year, month, chunk_size, processed_by)
+        posted, rejected = result
+    deposits, accrued = accrue_deposits(year, month, chunk_size, dry_run)
+    return AccrualResult(posted, amount, rejected, deposits, accrued)
@@ -0,0 +1,226 @@
+"""Latency and query-count benchmarks for the dashboard, login, admin and posting paths"""
+import http.client
+import math
+import re
+import threading
+import time
+from decimal import Decimal
+from urllib.parse import urlencode, urlsplit
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, transaction as db_transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .models import Account
+from .posting import Posting, post_batch, post_transaction
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies, errors=0, elapsed=None):
+    """Milliseconds summary of a list of latencies in seconds"""
+    values = sorted(latency * 1000 for latency in latencies)
+    summary = {'requests': len(values), 'errors': errors}
+    if values:
+        summary['mean_ms'] = round(sum(values) / len(values), 3)
+        for pct in PERCENTILES:
+            summary[f'p{pct}_ms'] = round(percentile(values, pct), 3)
+        summary['max_ms'] = round(values[-1], 3)
+    if elapsed:
+        summary['throughput_per_s'] = round(len(values) / elapsed, 1)
+    return summary
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """Threaded WSGI server for the project on a free localhost port"""
+
+    def __init__(self):
+        self.httpd = ThreadedWSGIServer(('127.0.0.1', 0), _QuietHandler, allow_reuse_address=False)
+        self.httpd.set_app(WSGIHandler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def session_cookie(user):
+    """Log a user in through the test client and return the session cookie header value"""
+    client = Client()
+    client.force_login(user)
+    return '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+
+
+def profile_queries(path, user=None):
+    """Issue one in-process request and return (status, query count, SQL time in ms)"""
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path)
+    sql_ms = sum(float(query['time']) for query in queries.captured_queries) * 1000
+    return response.status_code, len(queries), round(sql_ms, 3)
+
+
+class _Worker(threading.Thread):
+    def __init__(self, base_url, request, deadline, remaining, lock):
+        super().__init__(daemon=True)
+        self.parts = urlsplit(base_url)
+        self.request = request
+        self.deadline = deadline
+        self.remaining = remaining
+        self.lock = lock
+        self.latencies = []
+        self.errors = 0
+
+    def take(self):
+        with self.lock:
+            if self.remaining[0] <= 0 or time.monotonic() > self.deadline:
+                return False
+            self.remaining[0] -= 1
+            return True
+
+    def run(self):
+        conn = http.client.HTTPConnection(self.parts.hostname, self.parts.port, timeout=60)
+        while self.take():
+            try:
+                latency, ok = self.request(conn)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(self.parts.hostname, self.parts.port, timeout=60)
+                self.errors += 1
+                continue
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+        conn.close()
+
+
+def drive(base_url, request, total, concurrency, max_seconds=300):
+    """
+    Run request(conn) -> (latency, ok) total times across concurrency keep-alive connections.
+
+    Returns the latency summary with throughput over the wall-clock time.
+    """
+    lock = threading.Lock()
+    remaining = [total]
+    started = time.monotonic()
+    workers = [_Worker(base_url, request, started + max_seconds, remaining, lock) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+    return summarize(
+        [latency for worker in workers for latency in worker.latencies],
+        errors=sum(worker.errors for worker in workers),
+        elapsed=elapsed,
+    )
+
+
+def get_request(path, cookie=''):
+    """Request callable for drive() that GETs a path with an optional session cookie"""
+    headers = {'Cookie': cookie} if cookie else {}
+
+    def request(conn):
+        started = time.perf_counter()
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return time.perf_counter() - started, response.status < 400
+    return request
+
+
+def login_request(path, username, password):
+    """Request callable that fetches the CSRF token, then times only the credential POST"""
+
+    def request(conn):
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = response.read().decode()
+        cookies = '; '.join(
+            header.split(';', 1)[0] for name, header in response.getheaders() if name.lower() == 'set-cookie'
+        )
+        token = CSRF_INPUT.search(body)
+        if token is None:
+            return 0, False
+        form = urlencode({'csrfmiddlewaretoken': token.group(1), 'username': username, 'password': password})
+        started = time.perf_counter()
+        conn.request('POST', path, body=form, headers={
+            'Content-Type': 'application/x-www-form-urlencoded', 'Cookie': cookies,
+        })
+        response = conn.getresponse()
+        response.read()
+        # A successful login redirects to the dashboard; a failed one re-renders the form
+        return time.perf_counter() - started, response.status == 302
+    return request
+
+
+class _Rollback(Exception):
+    pass
+
+
+def benchmark_posting(account_ids, single=200, batch=20000):
+    """
+    Time post_transaction calls and a post_batch run, rolling both back afterwards.
+
+    Single postings alternate deposits and withdrawals over the given accounts
+    so balances stay positive.
+    """
+    latencies = []
+    result = {}
+    try:
+        with db_transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                for number in range(single):
+                    account_id = account_ids[number % len(account_ids)]
+                    kind = 'deposit' if number % 2 == 0 else 'withdrawal'
+                    started = time.perf_counter()
+                    with db_transaction.atomic():
+                        post_transaction(Account(pk=account_id), kind, Decimal('10.00'), allow_overdraft=True)
+                    latencies.append(time.perf_counter() - started)
+            result['post_transaction'] = dict(summarize(latencies), queries_per_posting=round(len(queries) / single, 2))
+
+            postings = (
+                Posting(account_ids[number % len(account_ids)], 'deposit', Decimal('1.00'))
+                for number in range(batch)
+            )
+            started = time.perf_counter()
+            outcome = post_batch(postings)
+            elapsed = time.perf_counter() - started
+            result['post_batch'] = {
+                'postings': outcome.posted + outcome.rejected,
+                'seconds': round(elapsed, 3),
+                'throughput_per_s': round((outcome.posted + outcome.rejected) / elapsed, 1),
+            }
+            raise _Rollback
+    except _Rollback:
+        pass
+    return result
+
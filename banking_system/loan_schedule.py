@@ -0,0 +1,189 @@
+"""Vectorized loan amortization schedules"""
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction as db_transaction
+
+from .models import LoanScheduleLine
+
+
+class Schedules:
+    """
+    Installment tables for a batch of loans as 2-D arrays of shape (loans, max_period).
+
+    Amounts are int64 cents; cells beyond a loan's period are zero and
+    ``mask`` marks the real installments.
+    """
+
+    def __init__(self, principal, interest, balance, due_dates, mask):
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+        self.due_dates = due_dates
+        self.mask = mask
+
+    @property
+    def installment(self):
+        return self.principal + self.interest
+
+
+def compute_schedules(principals, annual_rates, periods, methods, disbursement_dates):
+    """
+    Compute full installment tables for many loans at once.
+
+    principals and annual_rates are sequences of Decimal, periods of int,
+    methods of LoanProduct interest method codes and disbursement_dates of
+    date. Floating point is only used for the per-installment split; every
+    loan is then reconciled in integer cents so its principal lines add up
+    exactly to the principal and flat-rate interest to the exact flat total.
+    Raises ValueError if a period is shorter than one month.
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    count = len(periods)
+    if count and periods.min() < 1:
+        raise ValueError("Loan periods must be at least one month")
+    width = int(periods.max()) if count else 0
+    principal_cents = np.array([int(p * 100) for p in principals], dtype=np.int64)
+    p = principal_cents.astype(np.float64)[:, None]
+    r = (np.array([float(rate) for rate in annual_rates]) / 1200.0)[:, None]
+    n = periods.astype(np.float64)[:, None]
+    methods = np.asarray(methods)
+
+    k = np.arange(1, width + 1, dtype=np.float64)[None, :]
+    mask = k <= n
+
+    # Equal principal (flat rate and declining balance)
+    straight_principal = np.broadcast_to(p / n, (count, width))
+    opening_straight = p - (k - 1) * p / n
+    flat_interest = np.broadcast_to(p * r, (count, width))
+    declining_interest = opening_straight * r
+
+    # Annuity (reducing balance); a zero rate degenerates to equal principal
+    growth = np.power(1.0 + r, k - 1)
+    safe_r = np.where(r > 0, r, 1.0)
+    annuity = np.where(r > 0, p * safe_r / (1.0 - np.power(1.0 + safe_r, -n)), p / n)
+    opening_annuity = np.where(r > 0, p * growth - annuity * (growth - 1.0) / safe_r, opening_straight)
+    annuity_interest = opening_annuity * r
+    annuity_principal = annuity - annuity_interest
+
+    reducing = (methods == 'reducing_balance')[:, None]
+    flat = (methods == 'flat_rate')[:, None]
+    principal = np.where(reducing, annuity_principal, straight_principal)
+    interest = np.where(reducing, annuity_interest, np.where(flat, flat_interest, declining_interest))
+
+    principal = np.where(mask, _to_cents(principal), 0)
+    interest = np.where(mask, _to_cents(interest), 0)
+
+    # The last installment absorbs rounding so principal lines add up to the principal exactly
+    rows = np.arange(count)
+    last = periods - 1
+    principal[rows, last] += principal_cents - principal.sum(axis=1)
+
+    # Flat interest is reconciled to round(P * rate * n / 1200) computed in exact integer arithmetic
+    rate_hundredths = np.array([int(Decimal(rate) * 100) for rate in annual_rates], dtype=np.int64)
+    numerator = principal_cents * rate_hundredths * periods
+    exact_flat = (2 * numerator + 120000) // 240000
+    interest[rows, last] += np.where(flat[:, 0], exact_flat - interest.sum(axis=1), 0)
+
+    balance = np.where(mask, principal_cents[:, None] - np.cumsum(principal, axis=1), 0)
+    return Schedules(principal, interest, balance, _due_dates(disbursement_dates, width), mask)
+
+
+def _to_cents(values):
+    return np.floor(values + 0.5).astype(np.int64)
+
+
+def _due_dates(disbursement_dates, width):
+    """Monthly due dates after disbursement, clamped to the end of shorter months"""
+    dates = np.array(disbursement_dates, dtype='datetime64[D]')
+    months = dates.astype('datetime64[M]')[:, None] + np.arange(1, width + 1)[None, :]
+    month_start = months.astype('datetime64[D]')
+    month_length = ((months + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    day = (dates - dates.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64)[:, None] + 1
+    return month_start + (np.minimum(day, month_length) - 1)
+
+
+def schedules_for(loans):
+    """Compute schedules for a list of Loan instances with their loan_product loaded"""
+    return compute_schedules(
+        [loan.principal_amount for loan in loans],
+        [loan.interest_rate for loan in loans],
+        [loan.period_months for loan in loans],
+        [loan.loan_product.interest_method for loan in loans],
+        [loan.disbursement_date for loan in loans],
+    )
+
+
+def build_schedules(loans, chunk_size=2000):
+    """Replace the persisted LoanScheduleLine rows for the given loans; returns lines written"""
+    loans = loans.select_related('loan_product').order_by('pk')
+    written = 0
+    last_pk = 0
+    while True:
+        chunk = list(loans.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return written
+        last_pk = chunk[-1].pk
+        schedules = schedules_for(chunk)
+        lines = []
+        for row, loan in enumerate(chunk):
+            for column in range(loan.period_months):
+                lines.append(LoanScheduleLine(
+                    loan_id=loan.pk,
+                    installment_number=column + 1,
+                    due_date=schedules.due_dates[row, column].item(),
+                    principal=_decimal(schedules.principal[row, column]),
+                    interest=_decimal(schedules.interest[row, column]),
+                    closing_balance=_decimal(schedules.balance[row, column]),
+                ))
+        with db_transaction.atomic():
+            LoanScheduleLine.objects.filter(loan__in=chunk).delete()
+            LoanScheduleLine.objects.bulk_create(lines, batch_size=5000)
+        written += len(lines)
+
+
+def _decimal(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def project_portfolio(loans, chunk_size=20000):
+    """
+    Return {month (YYYY-MM): (principal, interest)} of scheduled collections.
+
+    Schedules are computed in memory from the loan terms, so the projection
+    does not depend on LoanScheduleLine being populated.
+    """
+    loans = loans.select_related('loan_product').order_by('pk').only(
+        'pk', 'principal_amount', 'interest_rate', 'period_months', 'disbursement_date',
+        'loan_product__interest_method',
+    )
+    principal_by_month = {}
+    interest_by_month = {}
+    last_pk = 0
+    while True:
+        chunk = list(loans.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+        schedules = schedules_for(chunk)
+        months = schedules.due_dates.astype('datetime64[M]')[schedules.mask]
+        keys, index = np.unique(months, return_inverse=True)
+        principal = np.bincount(index, weights=schedules.principal[schedules.mask])
+        interest = np.bincount(index, weights=schedules.interest[schedules.mask])
+        for key, month_principal, month_interest in zip(keys, principal, interest):
+            month = str(key)
+            principal_by_month[month] = principal_by_month.get(month, 0) + int(month_principal)
+            interest_by_month[month] = interest_by_month.get(month, 0) + int(month_interest)
+
+    return {
+        month: (_decimal(principal_by_month[month]), _decimal(interest_by_month[month]))
+        for month in sorted(principal_by_month)
+    }
+
+
+def loan_terms(principal, annual_rate, period_months, method):
+    """Return (monthly_payment, total_payable) of a single loan as Decimals"""
+    schedules = compute_schedules([principal], [annual_rate], [period_months], [method], [date.today()])
+    total = int(schedules.installment[0].sum())
+    return _decimal(schedules.installment[0, 0]), _decimal(total)
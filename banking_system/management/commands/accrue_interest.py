@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import datetime, timedelta
+from banking_system.interest import POSTING_CHUNK_SIZE, month_bounds, run_accrual
+from banking_system.models import TransactionArchive
+
+class Command(BaseCommand):
+    help = 'Capitalize a closed month\'s daily interest accrual and accrue fixed deposits (run monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to accrue (YYYY-MM); defaults to the previous month')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes computing account-id ranges')
+        parser.add_argument('--chunk-size', type=int, default=POSTING_CHUNK_SIZE, help='Credits posted per DB transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the interest that would be credited')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--month must be a month in YYYY-MM format")
+        else:
+            month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        first_day, last_day = month_bounds(month.year, month.month)
+        if last_day >= today:
+            raise CommandError(f"{month:%Y-%m} has not ended yet")
+        # Daily balances are rebuilt from live transactions only
+        if TransactionArchive.objects.filter(period__gte=first_day).exists():
+            raise CommandError(f"Transactions from {month:%Y-%m} on have been archived")
+
+        result = run_accrual(month.year, month.month, options['workers'], options['chunk_size'],
+                             dry_run=options['dry_run'])
+        verb = 'Would credit' if options['dry_run'] else 'Credited'
+        self.stdout.write(f"{verb} {result.posted} accounts {result.amount:,.2f} interest for {month:%Y-%m}")
+        self.stdout.write(f"{verb} {result.deposits} fixed deposits {result.accrued:,.2f} accrued interest")
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f"{result.rejected} credits rejected; rerun after fixing them"))
+        elif not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Interest for {month:%Y-%m} complete"))
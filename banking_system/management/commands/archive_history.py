@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+from banking_system.archive import (
+    DEFAULT_RETENTION_MONTHS, ARCHIVE_CHUNK_SIZE, archivable_audit_logs, archivable_transactions,
+    archive_audit_logs, archive_transactions, retention_cutoff,
+)
+
+class Command(BaseCommand):
+    help = 'Move transactions and audit logs of closed months into the archive tables (run monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive months before this one (YYYY-MM); defaults to the retention window')
+        parser.add_argument('--retention-months', type=int, default=DEFAULT_RETENTION_MONTHS,
+                            help='Months kept live, counting the current one')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would move')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = datetime.strptime(options['before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--before must be a month in YYYY-MM format")
+        else:
+            cutoff = retention_cutoff(options['retention_months'])
+
+        if options['dry_run']:
+            self.stdout.write(f"Transactions before {cutoff:%Y-%m}: {archivable_transactions(cutoff).count()}")
+            self.stdout.write(f"Audit logs before {cutoff:%Y-%m}: {archivable_audit_logs(cutoff).count()}")
+            return
+
+        transactions = archive_transactions(cutoff, options['chunk_size'])
+        audit_logs = archive_audit_logs(cutoff, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {transactions} transactions and {audit_logs} audit logs from before {cutoff:%Y-%m}"
+        ))
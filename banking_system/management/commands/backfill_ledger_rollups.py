@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from banking_system.models import Account, DailyLedgerRollup, Transaction, TransactionArchive
+from banking_system.statements import statement_period
+from datetime import timedelta
+
+class Command(BaseCommand):
+    help = 'Rebuild daily ledger rollups from the live and archived transactions for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD), defaults to the oldest transaction')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        if options['start']:
+            start_date = parse_date(options['start'])
+        else:
+            firsts = (
+                Transaction.objects.order_by('created_at').values_list('created_at', flat=True).first(),
+                TransactionArchive.objects.order_by('period', 'created_at').values_list('created_at', flat=True).first(),
+            )
+            oldest = min((value for value in firsts if value is not None), default=None)
+            if oldest is None:
+                self.stdout.write(self.style.WARNING("No transactions to roll up."))
+                return
+            start_date = timezone.localdate(oldest)
+        end_date = parse_date(options['end']) if options['end'] else timezone.now().date()
+        if start_date is None or end_date is None or start_date > end_date:
+            raise CommandError("Invalid --start/--end range")
+
+        # Archived rows only keep the account id; their branch comes from the account
+        archive_branch = Subquery(Account.objects.filter(pk=OuterRef('account_id')).values('member__branch_id')[:1])
+        day = start_date
+        rows = 0
+        # One GROUP BY per day and table keeps each statement on an index range
+        while day <= end_date:
+            day_start, day_end = statement_period(day, day)
+            live = (
+                Transaction.objects.filter(created_at__gte=day_start, created_at__lt=day_end)
+                .values('transaction_type', 'status', branch_id=F('account__member__branch_id'))
+                .annotate(count=Count('id'), total_amount=Sum('amount'))
+                .order_by()
+            )
+            archived = (
+                TransactionArchive.objects.filter(period=day.replace(day=1), created_at__gte=day_start,
+                                                  created_at__lt=day_end)
+                .values('transaction_type', 'status', branch_id=archive_branch)
+                .annotate(count=Count('id'), total_amount=Sum('amount'))
+                .order_by()
+            )
+            totals = {}
+            for row in [*live, *archived]:
+                key = (row['branch_id'], row['transaction_type'], row['status'])
+                count, amount = totals.get(key, (0, 0))
+                totals[key] = (count + row['count'], amount + row['total_amount'])
+            with db_transaction.atomic():
+                DailyLedgerRollup.objects.filter(date=day).delete()
+                created = DailyLedgerRollup.objects.bulk_create([
+                    DailyLedgerRollup(date=day, branch_id=branch_id, transaction_type=transaction_type,
+                                      status=status, count=count, total_amount=amount)
+                    for (branch_id, transaction_type, status), (count, amount) in totals.items()
+                ])
+            rows += len(created)
+            day += timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} rollup rows for {start_date} to {end_date}."
+        ))
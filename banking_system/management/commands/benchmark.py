@@ -0,0 +1,167 @@
+from django.contrib import admin
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from banking_system import loadtest
+from banking_system.models import User, Member, Account, Transaction
+import json
+import platform
+import secrets
+import subprocess
+
+# Changelists driven over HTTP; every registered changelist still gets a query count
+LOADED_CHANGELISTS = ('transaction', 'member', 'account', 'auditlog')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _bench_user(username, password=None, **flags):
+    """
+    Create a throwaway user for the run; the caller deletes it afterwards.
+
+    Only the login benchmark needs a password, and it gets a random one per
+    run; the other users are logged in through their session cookie.
+    """
+    User.objects.filter(username=username).delete()
+    user = User(username=username, national_id=f'BENCH-{username}', first_name='Bench', last_name=username,
+                **flags)
+    user.set_password(password)  # None leaves an unusable password
+    user.save()
+    return user
+
+
+class Command(BaseCommand):
+    help = 'Benchmark login, dashboards, admin changelists and posting; writes a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int,
+                            help='Flush the database and seed a fresh data set with seed_bank at this scale first')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Flush for --scale without asking for confirmation')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per HTTP endpoint')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--url', help='Base URL of a running server; defaults to an in-process server')
+        parser.add_argument('--postings', type=int, default=200, help='Single postings to time')
+        parser.add_argument('--batch-postings', type=int, default=20000, help='Postings in the timed batch run')
+        parser.add_argument('--skip-http', action='store_true', help='Only collect query counts and posting timings')
+        parser.add_argument('--output', help='Report file; defaults to stdout, with progress on stderr')
+
+    def handle(self, *args, **options):
+        if options['scale']:
+            self._reseed(options)
+
+        member_user = (
+            User.objects.filter(is_member=True, is_active=True, member__status='active')
+            .order_by('pk').first()
+        )
+        account_ids = list(
+            Account.objects.filter(status='active').order_by('pk').values_list('pk', flat=True)[:500]
+        )
+        if member_user is None or not account_ids:
+            raise CommandError('No active member with accounts found; run with --scale or seed_bank first')
+
+        login_password = secrets.token_urlsafe(24)
+        staff_user = _bench_user('bench_staff', is_staff=True, is_superuser=True, is_staff_member=True)
+        login_user = _bench_user('bench_login', login_password)
+        try:
+            self._benchmark(member_user, account_ids, staff_user, login_user, login_password, options)
+        finally:
+            User.objects.filter(pk__in=[staff_user.pk, login_user.pk]).delete()
+
+    def _reseed(self, options):
+        """Seed from an empty database, so runs at the same scale compare like with like"""
+        database = connection.settings_dict['NAME']
+        if options['interactive']:
+            answer = input(f"--scale deletes ALL data in {database} before seeding. Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError('Benchmark cancelled')
+        call_command('flush', interactive=False, verbosity=0)
+        call_command('seed_bank', scale=options['scale'], seed=42, verbosity=0)
+
+    def _benchmark(self, member_user, account_ids, staff_user, login_user, login_password, options):
+        paths = {
+            'login': reverse('login'),
+            'dashboard_member': reverse('dashboard'),
+            'dashboard_staff': reverse('dashboard'),
+        }
+        users = {'dashboard_member': member_user, 'dashboard_staff': staff_user}
+        for model in admin.site._registry:
+            opts = model._meta
+            paths[f'admin_{opts.model_name}'] = reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+            users[f'admin_{opts.model_name}'] = staff_user
+
+        report = {
+            'commit': _git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'scale': {
+                'members': Member.objects.count(),
+                'accounts': Account.objects.count(),
+                'transactions': Transaction.objects.count(),
+            },
+            'concurrency': options['concurrency'],
+            'requests_per_endpoint': options['requests'],
+            'endpoints': {},
+        }
+
+        for name, path in paths.items():
+            status, queries, sql_ms = loadtest.profile_queries(path, users.get(name))
+            report['endpoints'][name] = {'path': path, 'status': status, 'queries': queries, 'sql_ms': sql_ms}
+            self.stderr.write(f"{name:<32} {status} {queries:>4} queries {sql_ms:>9.1f} ms SQL")
+
+        if not options['skip_http']:
+            self._drive(report, paths, users, staff_user, login_user, login_password, options)
+
+        self.stderr.write('Timing postings (rolled back afterwards)')
+        report['posting'] = loadtest.benchmark_posting(
+            account_ids, single=options['postings'], batch=options['batch_postings']
+        )
+
+        output = json.dumps(report, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _drive(self, report, paths, users, staff_user, login_user, login_password, options):
+        cookies = {user.pk: loadtest.session_cookie(user) for user in set(users.values())}
+        requests = {
+            'login': loadtest.login_request(paths['login'], login_user.username, login_password),
+            'dashboard_member': loadtest.get_request(
+                paths['dashboard_member'], cookies[users['dashboard_member'].pk]
+            ),
+            'dashboard_staff': loadtest.get_request(paths['dashboard_staff'], cookies[staff_user.pk]),
+        }
+        for model_name in LOADED_CHANGELISTS:
+            name = f'admin_{model_name}'
+            if name in paths:
+                requests[name] = loadtest.get_request(paths[name], cookies[staff_user.pk])
+
+        if options['url']:
+            self._run(report, requests, options['url'].rstrip('/'), options)
+        else:
+            with loadtest.LocalServer() as server:
+                self._run(report, requests, server.url, options)
+
+    def _run(self, report, requests, base_url, options):
+        report['base_url'] = base_url
+        for name, request in requests.items():
+            summary = loadtest.drive(base_url, request, options['requests'], options['concurrency'])
+            report['endpoints'][name].update(summary)
+            self.stderr.write(
+                f"{name:<32} p50 {summary.get('p50_ms', 0):>8.1f} ms  p95 {summary.get('p95_ms', 0):>8.1f} ms  "
+                f"p99 {summary.get('p99_ms', 0):>8.1f} ms  {summary['errors']} errors"
+            )
+
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from banking_system.loan_schedule import build_schedules
+from banking_system.models import Loan
+
+class Command(BaseCommand):
+    help = 'Compute and store repayment schedules for loans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='active', help="Loan status to schedule, or 'all'")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        loans = Loan.objects.all()
+        if options['status'] != 'all':
+            loans = loans.filter(status=options['status'])
+
+        written = build_schedules(loans, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} schedule lines."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import datetime, timedelta
+from banking_system.fees import FEE_CHUNK_SIZE, charge_fees, fee_totals
+from banking_system.interest import month_bounds
+
+class Command(BaseCommand):
+    help = 'Charge account types\' monthly fees to active accounts below their minimum balance (run monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to charge (YYYY-MM); defaults to the previous month')
+        parser.add_argument('--chunk-size', type=int, default=FEE_CHUNK_SIZE, help='Fees posted per DB transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the fees that would be charged')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['month']:
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--month must be a month in YYYY-MM format")
+        else:
+            month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        _, last_day = month_bounds(month.year, month.month)
+        if last_day >= today:
+            raise CommandError(f"{month:%Y-%m} has not ended yet")
+
+        if options['dry_run']:
+            totals = fee_totals(month.year, month.month)
+            verb = 'Would charge'
+        else:
+            totals = charge_fees(month.year, month.month, options['chunk_size'])
+            verb = 'Charged'
+        for line in totals:
+            self.stdout.write(
+                f"{line.account_type.code}: {verb.lower()} {line.accounts} accounts {line.amount:,.2f}, "
+                f"{line.insufficient} without funds for the fee"
+            )
+        total = sum((line.amount for line in totals), 0)
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total:,.2f} in monthly fees for {month:%Y-%m}"))
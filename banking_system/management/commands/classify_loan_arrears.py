@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from banking_system.arrears import classify_arrears
+
+class Command(BaseCommand):
+    help = 'Classify active loans into portfolio-at-risk buckets (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', help='Classification date (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            as_of = parse_date(options['as_of'])
+            if as_of is None:
+                raise CommandError("--as-of must be a date in YYYY-MM-DD format")
+
+        report = classify_arrears(as_of)
+        for bucket in report['buckets']:
+            self.stdout.write(f"{bucket['label']:<14} {bucket['loans']:>8} {bucket['balance']:>18,.2f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Classified loans as of {report['as_of']}; PAR30 {report['par_30']:.2f}%"
+        ))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from banking_system.models import Account, Member, AccountType
+from banking_system.numbering import allocate
 from faker import Faker
 from random import choice, randint, uniform
 from decimal import Decimal
@@ -22,20 +23,12 @@ class Command(BaseCommand):
 
         account_statuses = ['active', 'dormant', 'closed', 'frozen']
         created = 0
-        used_account_numbers = set(Account.objects.values_list('account_number', flat=True))
 
-        for _ in range(500):
+        for acc_number in allocate('account', 500):
             member = choice(members)
             acc_type = choice(account_types)
             status = choice(account_statuses)
 
-            # Generate a unique account number
-            while True:
-                acc_number = f"{randint(1000000000, 9999999999)}"
-                if acc_number not in used_account_numbers:
-                    used_account_numbers.add(acc_number)
-                    break
-
             balance = Decimal(round(uniform(500, 500000), 2))
             available_balance = balance - Decimal(randint(0, 100))
             interest_earned = Decimal(round(uniform(0, 5000), 2))
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from banking_system.models import LoanApplication, Member, LoanProduct, User
+from banking_system.numbering import next_number
 from faker import Faker
 from decimal import Decimal
 from random import randint, choice, sample
@@ -35,7 +36,7 @@ class Command(BaseCommand):
                 guarantor_2 = guarantors[1] if len(guarantors) > 1 else None
 
                 status = choice(application_statuses)
-                application_number = f"APP{randint(100000, 999999)}"
+                application_number = next_number('application')
 
                 loan_app = LoanApplication.objects.create(
                     application_number=application_number,
@@ -9,7 +9,7 @@ class Command(BaseCommand):
     help = 'Generate loan payment records for active loans'
 
     def handle(self, *args, **kwargs):
-        loans = Loan.objects.filter(status='active')
+        loans = Loan.objects.filter(status='active').prefetch_related('schedule')
         users = list(User.objects.all())
         total_created = 0
 
@@ -17,14 +17,19 @@ class Command(BaseCommand):
             num_payments = randint(1, 6)
             last_balance = loan.balance
             payments = []
+            schedule = list(loan.schedule.all())
 
             for i in range(num_payments):
                 if last_balance <= 0:
                     break
 
                 processor = choice(users)
-                principal = (loan.monthly_payment * Decimal('0.8')).quantize(Decimal('0.01'))
-                interest = (loan.monthly_payment * Decimal('0.2')).quantize(Decimal('0.01'))
+                if i < len(schedule):
+                    # Split the installment the way the loan's schedule does
+                    principal, interest = schedule[i].principal, schedule[i].interest
+                else:
+                    principal = (loan.monthly_payment * Decimal('0.8')).quantize(Decimal('0.01'))
+                    interest = (loan.monthly_payment * Decimal('0.2')).quantize(Decimal('0.01'))
                 total_amount = principal + interest
 
                 if total_amount > last_balance:
@@ -1,15 +1,16 @@
 from django.core.management.base import BaseCommand
+from banking_system.loan_schedule import build_schedules, loan_terms
 from banking_system.models import Loan, LoanApplication
+from banking_system.numbering import next_number
 from datetime import timedelta, date
 from decimal import Decimal
-from random import randint
 from django.utils import timezone
 
 class Command(BaseCommand):
     help = 'Generate loan records from disbursed loan applications'
 
     def handle(self, *args, **kwargs):
-        applications = LoanApplication.objects.filter(status='disbursed')
+        applications = LoanApplication.objects.filter(status='disbursed').select_related('loan_product')
 
         created = 0
         for app in applications:
@@ -20,16 +21,14 @@ class Command(BaseCommand):
             rate = app.loan_product.interest_rate
             months = app.period_months
 
-            # Calculate total interest and payments (simple interest)
-            total_interest = (Decimal(rate) / Decimal(100)) * principal * Decimal(months) / Decimal(12)
-            total_payable = principal + total_interest
-            monthly_payment = total_payable / months
+            # Installment and total follow the product's interest method
+            monthly_payment, total_payable = loan_terms(principal, rate, months, app.loan_product.interest_method)
 
             disbursed_on = app.application_date
             maturity = disbursed_on + timedelta(days=30 * months)
             next_payment = disbursed_on + timedelta(days=30)
 
-            loan_number = f"LN{randint(1000000, 9999999)}"
+            loan_number = next_number('loan')
 
             loan = Loan.objects.create(
                 loan_number=loan_number,
@@ -50,4 +49,5 @@ class Command(BaseCommand):
             )
             created += 1
 
+        build_schedules(Loan.objects.filter(schedule__isnull=True, status='active'))
         self.stdout.write(self.style.SUCCESS(f"Successfully created {created} active loan records."))
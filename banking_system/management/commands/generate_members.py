@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from banking_system.models import Member, User, Branch
+from banking_system.numbering import next_number
 from faker import Faker
 from random import choice, randint, sample
 from datetime import timedelta, date
@@ -30,7 +31,7 @@ class Command(BaseCommand):
 
             user = users.pop()
             branch = choice(branches)
-            member_number = f"M{randint(100000, 999999)}"
+            member_number = next_number('member')
             membership_date = fake.date_between(start_date='-5y', end_date='today')
             status = choice(statuses)
             monthly_contribution = Decimal(randint(500, 5000))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from banking_system.models import Account
+from banking_system.statements import STATEMENT_FORMATS, render_statement
+import sys
+
+class Command(BaseCommand):
+    help = 'Write an account statement for a date range as CSV or PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_number')
+        parser.add_argument('--start', help='First day of the statement (YYYY-MM-DD), defaults to the start of this month')
+        parser.add_argument('--end', help='Last day of the statement (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--format', choices=STATEMENT_FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write to, defaults to stdout')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(account_number=options['account_number'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Account {options['account_number']} not found")
+
+        today = timezone.now().date()
+        try:
+            start_date = parse_date(options['start'] or '') or today.replace(day=1)
+            end_date = parse_date(options['end'] or '') or today
+        except ValueError as error:
+            raise CommandError(f"Invalid date: {error}")
+        if start_date > end_date:
+            raise CommandError("--start must not be after --end")
+
+        chunks = render_statement(account, start_date, end_date, options['format'])
+        if options['output']:
+            if options['format'] == 'csv':
+                output = open(options['output'], 'w', newline='')
+            else:
+                output = open(options['output'], 'wb')
+            with output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stdout.write(self.style.SUCCESS(f"Statement written to {options['output']}"))
+        elif options['format'] == 'csv':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from banking_system.dormancy import DORMANCY_DAYS, inactive_accounts, mark_dormant
+
+class Command(BaseCommand):
+    help = 'Move active accounts without customer activity for a number of days to dormant (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DORMANCY_DAYS,
+                            help='Days without activity before an account goes dormant (default DORMANCY_DAYS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the accounts that would go dormant')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = inactive_accounts(timezone.now() - timedelta(days=options['days'])).count()
+            self.stdout.write(f"{count} accounts inactive for {options['days']} days")
+            return
+
+        flagged = mark_dormant(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Marked {flagged} accounts dormant and notified their owners"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime
+from banking_system.fixed_deposits import MATURITY_CHUNK_SIZE, process_maturities
+
+class Command(BaseCommand):
+    help = 'Settle or roll over fixed deposits maturing on or before a date, catching up on missed days (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help='Last maturity date to process (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=MATURITY_CHUNK_SIZE, help='Deposits settled per DB transaction')
+
+    def handle(self, *args, **options):
+        through = None
+        if options['through']:
+            try:
+                through = datetime.strptime(options['through'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("--through must be a date in YYYY-MM-DD format")
+
+        result = process_maturities(through, options['chunk_size'])
+        self.stdout.write(f"Matured {result.matured} and renewed {result.renewed} deposits, "
+                          f"crediting {result.interest:,.2f} interest")
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(
+                f"{result.rejected} credits rejected; those deposits stay open for the next run"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("Maturities up to date"))
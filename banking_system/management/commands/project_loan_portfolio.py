@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from banking_system.loan_schedule import project_portfolio
+from banking_system.models import Loan
+from decimal import Decimal
+
+class Command(BaseCommand):
+    help = 'Project monthly principal and interest collections for the active loan book'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help='Only print the first N months')
+
+    def handle(self, *args, **options):
+        projection = project_portfolio(Loan.objects.filter(status='active'))
+        months = list(projection.items())[:options['months']]
+
+        total_principal = total_interest = Decimal('0.00')
+        self.stdout.write(f"{'Month':<8} {'Principal':>18} {'Interest':>18}")
+        for month, (principal, interest) in months:
+            self.stdout.write(f"{month:<8} {principal:>18,.2f} {interest:>18,.2f}")
+            total_principal += principal
+            total_interest += interest
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Total':<8} {total_principal:>18,.2f} {total_interest:>18,.2f}"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from banking_system.search import INDEX_CHUNK_SIZE, rebuild
+
+class Command(BaseCommand):
+    help = 'Rebuild the member, account and transaction search index (run once after migrating)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=INDEX_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        written = rebuild(chunk_size=options['chunk_size'])
+        for kind, count in written.items():
+            self.stdout.write(f"{kind}: {count} documents")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
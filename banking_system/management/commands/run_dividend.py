@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from banking_system.dividends import PAYOUT_CHUNK_SIZE, dividend_totals, run_dividend
+from banking_system.models import Dividend
+
+class Command(BaseCommand):
+    help = 'Pay a declared dividend into members\' savings accounts; safe to rerun until complete'
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int, help='Year of the declared dividend')
+        parser.add_argument('--pro-rate', action='store_true',
+                            help='Count share capital bought or sold during the year by months held')
+        parser.add_argument('--chunk-size', type=int, default=PAYOUT_CHUNK_SIZE, help='Members paid per DB transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the members and total still to pay')
+
+    def handle(self, *args, **options):
+        try:
+            dividend = Dividend.objects.get(year=options['year'])
+        except Dividend.DoesNotExist:
+            raise CommandError(f"No dividend declared for {options['year']}")
+
+        if options['dry_run']:
+            totals = dividend_totals(dividend, options['pro_rate'])
+            self.stdout.write(
+                f"{totals.members} members to pay, {totals.amount:,.2f} in total at {dividend.rate_percentage}%"
+            )
+            if totals.no_account:
+                self.stdout.write(self.style.WARNING(
+                    f"{totals.no_account} entitled members have no savings account that can be credited"
+                ))
+            return
+
+        result = run_dividend(dividend, options['pro_rate'], options['chunk_size'])
+        self.stdout.write(f"Paid {result.paid} members {result.amount:,.2f}")
+        if result.rejected or result.no_account:
+            self.stdout.write(self.style.WARNING(
+                f"{result.rejected} credits rejected and {result.no_account} members without a savings account "
+                "that can be credited; rerun after fixing them"
+            ))
+        if result.complete:
+            self.stdout.write(self.style.SUCCESS(f"Dividend {dividend.year} fully paid"))
@@ -0,0 +1,346 @@
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction as db_transaction
+from django.utils import timezone
+from banking_system.loan_schedule import compute_schedules
+from banking_system.models import (
+    User, Branch, Member, AccountType, Account, Transaction, LoanProduct,
+    LoanApplication, Loan, LoanPayment,
+)
+from banking_system.numbering import allocate
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from faker import Faker
+import random
+import time
+import uuid
+
+MEMBERS_PER_SCALE = 1000
+MEMBERS_PER_BRANCH = 20000
+LOAN_SHARE = 0.3
+SECOND_ACCOUNT_SHARE = 0.5
+HISTORY_DAYS = 365
+
+TRANSACTION_COLUMNS = (
+    'transaction_id', 'account', 'transaction_type', 'amount', 'balance_before', 'balance_after',
+    'description', 'reference_number', 'status', 'processed_by', 'processed_at', 'created_at',
+)
+
+MEMBER_STATUSES = ['active'] * 8 + ['pending', 'suspended']
+CREDIT_WEIGHTS = [('deposit', 60), ('interest_payment', 5), ('dividend_payment', 3), ('loan_disbursement', 2)]
+DEBIT_WEIGHTS = [('withdrawal', 20), ('fee_charge', 6), ('share_purchase', 4)]
+
+
+def _cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+@contextmanager
+def historic_dates(*fields):
+    """Let bulk_create keep the past dates assigned to auto_now_add fields"""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic bank for load testing; --scale 1 is 1,000 members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1)
+        parser.add_argument('--transactions-per-member', type=int, default=50)
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Members generated per DB transaction')
+        parser.add_argument('--password', default='password123', help='Password shared by every seeded user')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible data set')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Skip rollups, loan schedules, arrears and the search index')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--scale and --chunk-size must be positive")
+
+        self.rng = random.Random(options['seed'])
+        fake = Faker()
+        if options['seed'] is not None:
+            Faker.seed(options['seed'])
+        # Small pools sampled in memory; calling Faker per row would dominate the run time
+        self.first_names = [fake.first_name() for _ in range(500)]
+        self.last_names = [fake.last_name() for _ in range(500)]
+        self.descriptions = [fake.sentence() for _ in range(200)]
+        # One PBKDF2 run shared by every seeded user instead of one per create_user call
+        self.password = make_password(options['password'])
+        self.transactions_per_member = options['transactions_per_member']
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+        total = options['scale'] * MEMBERS_PER_SCALE
+        self.prepare_reference_data(total)
+        self.member_ids = list(Member.objects.values_list('pk', flat=True)[:10000])
+
+        if connection.vendor == 'sqlite':
+            # A throwaway load-test database does not need fsyncs; a large page cache keeps index inserts in memory
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA synchronous = OFF')
+                cursor.execute('PRAGMA cache_size = -262144')
+
+        started = time.monotonic()
+        created = 0
+        counts = {'accounts': 0, 'transactions': 0, 'loans': 0, 'payments': 0}
+        with historic_dates(Transaction._meta.get_field('created_at'),
+                            LoanApplication._meta.get_field('application_date')):
+            while created < total:
+                size = min(options['chunk_size'], total - created)
+                with db_transaction.atomic():
+                    for key, value in self.seed_chunk(size).items():
+                        counts[key] += value
+                created += size
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{created}/{total} members, {counts['transactions']} transactions "
+                    f"({counts['transactions'] / elapsed:,.0f} rows/s)"
+                )
+
+        if not options['skip_derived']:
+            for command in ('backfill_ledger_rollups', 'build_loan_schedules', 'classify_loan_arrears',
+                            'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created} members, {counts['accounts']} accounts, {counts['transactions']} transactions, "
+            f"{counts['loans']} loans and {counts['payments']} loan payments in {time.monotonic() - started:.0f}s."
+        ))
+
+    def prepare_reference_data(self, total):
+        if not AccountType.objects.exists():
+            call_command('generate_account_types', stdout=self.stdout)
+        if not LoanProduct.objects.exists():
+            call_command('generate_loan_products', stdout=self.stdout)
+
+        account_types = list(AccountType.objects.filter(is_active=True))
+        savings = [account_type for account_type in account_types if account_type.is_savings]
+        self.savings_type_ids = [account_type.pk for account_type in savings] or [account_types[0].pk]
+        self.other_type_ids = [account_type.pk for account_type in account_types if account_type not in savings] \
+            or self.savings_type_ids
+        self.products = list(LoanProduct.objects.filter(is_active=True))
+        self.staff_ids = list(User.objects.filter(is_staff_member=True).values_list('pk', flat=True)[:100]) or [None]
+
+        needed = max(total // MEMBERS_PER_BRANCH, 5) - Branch.objects.count()
+        codes = set(Branch.objects.values_list('code', flat=True))
+        number = 0
+        new_branches = []
+        while len(new_branches) < needed:
+            number += 1
+            code = f"SB{number:04d}"
+            if code not in codes:
+                new_branches.append(Branch(
+                    name=f"Seed Branch {number}", code=code, address='-', phone_number=f"020{number:07d}",
+                ))
+        Branch.objects.bulk_create(new_branches)
+        self.branch_ids = list(Branch.objects.values_list('pk', flat=True))
+
+    def pick(self, weights):
+        names, values = zip(*weights)
+        return self.rng.choices(names, values)[0]
+
+    def seed_chunk(self, size):
+        """Generate and insert one chunk of members with everything that hangs off them"""
+        rng = self.rng
+        member_numbers = allocate('member', size)
+
+        users = []
+        for number in member_numbers:
+            first_name, last_name = rng.choice(self.first_names), rng.choice(self.last_names)
+            digits = number[1:]
+            users.append(User(
+                username=number.lower(), password=self.password, first_name=first_name, last_name=last_name,
+                email=f"{number.lower()}@seed.example", national_id=f"N{digits}", phone_number=f"+2547{digits}",
+                is_member=True,
+            ))
+        User.objects.bulk_create(users, batch_size=2000)
+        user_ids = self.ids(User, users, 'username')
+
+        # Accounts and their transaction history are generated before the members so the
+        # denormalized savings_balance can be written with the member row
+        plans = []
+        for index in range(size):
+            accounts = [(self.rng.choice(self.savings_type_ids), True)]
+            if rng.random() < SECOND_ACCOUNT_SHARE:
+                accounts.append((rng.choice(self.other_type_ids), False))
+            budget = rng.randint(self.transactions_per_member // 2, self.transactions_per_member * 3 // 2)
+            plans.append([(type_id, is_savings, self.history(budget // len(accounts)))
+                          for type_id, is_savings in accounts])
+
+        members = []
+        for index, number in enumerate(member_numbers):
+            guarantors = rng.sample(self.member_ids, 2) if len(self.member_ids) >= 2 else [None, None]
+            members.append(Member(
+                user_id=user_ids[index], member_number=number, branch_id=rng.choice(self.branch_ids),
+                membership_date=self.today - timedelta(days=rng.randint(HISTORY_DAYS, 5 * HISTORY_DAYS)),
+                status=rng.choice(MEMBER_STATUSES),
+                monthly_contribution=rng.randint(5, 50) * 100, total_shares=rng.randint(100, 2000) * 100,
+                savings_balance=_cents(sum(history[-1][3] for _, is_savings, history in plans[index]
+                                           if is_savings and history)),
+                guarantor_1_id=guarantors[0], guarantor_2_id=guarantors[1],
+            ))
+        Member.objects.bulk_create(members, batch_size=2000)
+        member_ids = self.ids(Member, members, 'member_number')
+
+        account_numbers = iter(allocate('account', sum(len(plan) for plan in plans)))
+        accounts, histories = [], []
+        for index, plan in enumerate(plans):
+            for type_id, _, history in plan:
+                balance = _cents(history[-1][3] if history else 0)
+                accounts.append(Account(
+                    account_number=next(account_numbers), member_id=member_ids[index], account_type_id=type_id,
+                    balance=balance, available_balance=balance,
+                    last_transaction_date=history[-1][0] if history else None,
+                ))
+                histories.append(history)
+        Account.objects.bulk_create(accounts, batch_size=2000)
+        account_ids = self.ids(Account, accounts, 'account_number')
+
+        transactions = []
+        for account_id, history in zip(account_ids, histories):
+            for position, (created_at, transaction_type, amount, balance_after) in enumerate(history):
+                before = balance_after + amount if transaction_type in Transaction.DEBIT_TYPES else balance_after - amount
+                transactions.append((
+                    uuid.uuid4(), account_id, transaction_type, _cents(amount), _cents(before),
+                    _cents(balance_after), rng.choice(self.descriptions), f"SEED{account_id}-{position}",
+                    'completed', rng.choice(self.staff_ids), created_at, created_at,
+                ))
+        self.insert_transactions(transactions)
+
+        loans, payments = self.seed_loans(member_ids)
+        self.member_ids.extend(member_ids)
+        return {'accounts': len(accounts), 'transactions': len(transactions), 'loans': loans, 'payments': payments}
+
+    def insert_transactions(self, rows):
+        """
+        Insert (transaction_id, ..., created_at) tuples in TRANSACTION_COLUMNS order with executemany.
+
+        This is the one table written at tens of millions of rows, where
+        bulk_create's per-value SQL compilation costs more than the insert
+        itself. The UUID and timestamp are adapted by their model fields so
+        every backend stores them as the ORM would; Decimals, ints and
+        strings are passed to the driver as they are.
+        """
+        db = connections[Transaction.objects.db]
+        fields = [Transaction._meta.get_field(name) for name in TRANSACTION_COLUMNS]
+        uuid_field, created_field = fields[0], fields[-1]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            db.ops.quote_name(Transaction._meta.db_table),
+            ', '.join(db.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        with db.cursor() as cursor:
+            for start in range(0, len(rows), 5000):
+                batch = []
+                for row in rows[start:start + 5000]:
+                    timestamp = created_field.get_db_prep_value(row[-1], db)
+                    batch.append((uuid_field.get_db_prep_value(row[0], db), *row[1:-2], timestamp, timestamp))
+                cursor.executemany(sql, batch)
+
+    def history(self, count):
+        """Return [(created_at, type, amount_cents, balance_after_cents)] in date order; never overdrawn"""
+        rng = self.rng
+        offsets = sorted(rng.random() * HISTORY_DAYS * 86400 for _ in range(count))
+        balance = 0
+        rows = []
+        for offset in offsets:
+            amount = rng.randint(10000, 5000000)
+            transaction_type = self.pick(DEBIT_WEIGHTS) if rng.random() < 0.35 else self.pick(CREDIT_WEIGHTS)
+            if transaction_type in Transaction.DEBIT_TYPES:
+                if balance < 10000:
+                    transaction_type = 'deposit'
+                else:
+                    amount = rng.randint(100, balance)
+            balance += -amount if transaction_type in Transaction.DEBIT_TYPES else amount
+            created_at = self.now - timedelta(seconds=HISTORY_DAYS * 86400 - offset)
+            rows.append((created_at, transaction_type, amount, balance))
+        return rows
+
+    def seed_loans(self, member_ids):
+        """Disbursed applications, loans and repayments for a share of the chunk's members"""
+        rng = self.rng
+        borrowers = [member_id for member_id in member_ids if rng.random() < LOAN_SHARE]
+        if not borrowers:
+            return 0, 0
+
+        terms = []
+        for member_id in borrowers:
+            product = rng.choice(self.products)
+            principal = rng.randint(int(product.minimum_amount) // 100, int(product.maximum_amount) // 100) * 100
+            months = rng.randint(product.minimum_period_months, product.maximum_period_months)
+            disbursed_on = self.today - timedelta(days=rng.randint(0, min(months * 30, 3 * HISTORY_DAYS)))
+            terms.append((member_id, product, Decimal(principal), months, disbursed_on))
+
+        schedules = compute_schedules(
+            [principal for _, _, principal, _, _ in terms], [product.interest_rate for _, product, _, _, _ in terms],
+            [months for _, _, _, months, _ in terms], [product.interest_method for _, product, _, _, _ in terms],
+            [disbursed_on for *_, disbursed_on in terms],
+        )
+        installments = schedules.installment
+        application_numbers = allocate('application', len(terms))
+        loan_numbers = allocate('loan', len(terms))
+
+        applications = [
+            LoanApplication(
+                application_number=application_numbers[row], member_id=member_id, loan_product=product,
+                amount_requested=principal, amount_approved=principal, period_months=months,
+                purpose='Seeded loan', status='disbursed', application_date=disbursed_on,
+                reviewed_by_id=rng.choice(self.staff_ids),
+            )
+            for row, (member_id, product, principal, months, disbursed_on) in enumerate(terms)
+        ]
+        LoanApplication.objects.bulk_create(applications, batch_size=2000)
+        application_ids = self.ids(LoanApplication, applications, 'application_number')
+
+        loans, paid_counts = [], []
+        for row, (member_id, product, principal, months, disbursed_on) in enumerate(terms):
+            due_dates = [due.item() for due in schedules.due_dates[row, :months]]
+            elapsed = sum(1 for due in due_dates if due <= self.today)
+            # Most borrowers are current; some fall a few installments behind
+            paid = max(elapsed - (rng.randint(1, 4) if rng.random() < 0.15 else 0), 0)
+            total = int(installments[row, :months].sum())
+            amount_paid = int(installments[row, :paid].sum())
+            loans.append(Loan(
+                loan_number=loan_numbers[row], application_id=application_ids[row], member_id=member_id,
+                loan_product=product, principal_amount=principal, interest_rate=product.interest_rate,
+                period_months=months, monthly_payment=_cents(installments[row, 0]), total_payable=_cents(total),
+                amount_paid=_cents(amount_paid), balance=_cents(total - amount_paid),
+                status='completed' if paid == months else 'active', disbursement_date=disbursed_on,
+                maturity_date=due_dates[-1], next_payment_date=due_dates[min(paid, months - 1)],
+            ))
+            paid_counts.append(paid)
+        Loan.objects.bulk_create(loans, batch_size=2000)
+        loan_ids = self.ids(Loan, loans, 'loan_number')
+
+        payments = []
+        for row, (loan_id, paid) in enumerate(zip(loan_ids, paid_counts)):
+            total = int(installments[row, :terms[row][3]].sum())
+            balance = total
+            for column in range(paid):
+                amount = int(installments[row, column])
+                payments.append(LoanPayment(
+                    loan_id=loan_id, amount=_cents(amount), principal_amount=_cents(schedules.principal[row, column]),
+                    interest_amount=_cents(schedules.interest[row, column]), balance_before=_cents(balance),
+                    balance_after=_cents(balance - amount), payment_date=schedules.due_dates[row, column].item(),
+                    processed_by_id=rng.choice(self.staff_ids),
+                ))
+                balance -= amount
+        LoanPayment.objects.bulk_create(payments, batch_size=5000)
+        return len(loans), len(payments)
+
+    def ids(self, model, objects, key):
+        """Primary keys of freshly bulk-created objects, looked up by a unique field where the backend returns none"""
+        if all(obj.pk is not None for obj in objects):
+            return [obj.pk for obj in objects]
+        keys = [getattr(obj, key) for obj in objects]
+        mapping = dict(model.objects.filter(**{f'{key}__in': keys}).values_list(key, 'pk'))
+        return [mapping[value] for value in keys]
@@ -0,0 +1,324 @@
+"""
+In-process counters, gauges and histograms exported in the Prometheus text format.
+
+Each process aggregates into plain dicts under one lock. Serving processes
+(start() is called from the WSGI and ASGI entry points) also write their
+totals to METRICS_DIR/<pid>-<token>.json periodically and at exit; the
+token keeps a reused PID from overwriting an earlier process's file.
+Management commands and test runs write nothing. The /metrics view merges
+every file with its own totals, so all workers are reported whichever one
+answers the scrape. Files of exited processes are folded into
+exited.json, which keeps the merged counters monotonic without leaving a
+file per process ever started. Gauges are sampled whenever a process
+writes or serves its totals and summed over the live processes only.
+"""
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are left in place
+    fcntl = None
+
+from django.conf import settings
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'banking_system_metrics'))
+
+# A process writes its file at most this often while recording
+FLUSH_INTERVAL = 5
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+EXITED_FILE = 'exited.json'
+
+_lock = threading.Lock()
+_registry = {}
+_last_flush = [0.0]
+_serving = [False]
+_process = [None, None]  # pid, file name
+_connections = weakref.WeakSet()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def state(self):
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(Metric):
+    """Current value per label set, taken from sample() ({label key: value}) when the state is read"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), sample=None):
+        super().__init__(name, documentation, labelnames)
+        self.sample = sample
+
+    def collect(self):
+        values = self.sample()
+        with _lock:
+            self.values = values
+
+
+class Histogram(Metric):
+    """Histogram kept as per-bucket (non-cumulative) counts, a sum and a count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with _lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['buckets'][index] += 1
+            state['sum'] += value
+            state['count'] += 1
+        _maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+TRANSACTIONS_POSTED = Counter(
+    'banking_transactions_posted_total', 'Transactions written by the posting engine',
+    ('transaction_type', 'status'),
+)
+POSTING_SECONDS = Histogram(
+    'banking_posting_duration_seconds', 'Time to post one transaction or one batch chunk', ('mode',),
+)
+LOAN_PAYMENTS = Counter('banking_loan_payments_total', 'Loan payments recorded')
+LOGIN_ATTEMPTS = Counter('banking_login_attempts_total', 'Login attempts', ('result',))
+DB_CONNECTIONS = Counter('banking_db_connections_opened_total', 'Database connections opened', ('alias',))
+REQUEST_QUERIES = Histogram(
+    'banking_request_db_queries', 'Database queries per request', buckets=QUERY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram('banking_request_duration_seconds', 'Request time up to the response', ('method',))
+REQUEST_SQL_SECONDS = Histogram('banking_request_sql_seconds', 'SQL time per request')
+CACHE_REQUESTS = Counter('banking_cache_requests_total', 'Cache lookups by cache and outcome', ('cache', 'result'))
+
+
+def track_connection(connection):
+    """Count a database wrapper in DB_CONNECTIONS_OPEN for as long as its connection stays open"""
+    with _lock:
+        _connections.add(connection)
+
+
+def _open_connections():
+    with _lock:
+        wrappers = list(_connections)
+    counts = {}
+    for wrapper in wrappers:
+        key = (wrapper.alias,)
+        counts[key] = counts.get(key, 0) + (wrapper.connection is not None)
+    return counts
+
+
+# Sampled from every thread's connection rather than counted, since Django sends no signal on close
+DB_CONNECTIONS_OPEN = Gauge(
+    'banking_db_connections_open', 'Database connections currently open', ('alias',), sample=_open_connections,
+)
+
+
+def record_cache(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def start():
+    """Write this process's metrics for the /metrics view from now on; called once per serving process"""
+    if not _serving[0]:
+        _serving[0] = True
+        atexit.register(flush)
+
+
+def _filename():
+    pid = os.getpid()
+    if _process[0] != pid:
+        _process[:] = [pid, f'{pid}-{uuid.uuid4().hex[:12]}.json']
+    return _process[1]
+
+
+def _state():
+    for metric in _registry.values():
+        if metric.kind == 'gauge':
+            metric.collect()
+    with _lock:
+        return {name: metric.state() for name, metric in _registry.items() if metric.values}
+
+
+def _write(filename, data):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, filename)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as handle:
+        handle.write(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def flush():
+    """Write this process's totals to its file"""
+    _last_flush[0] = time.monotonic()
+    _write(_filename(), _state())
+
+
+def _maybe_flush():
+    if _serving[0] and time.monotonic() - _last_flush[0] >= FLUSH_INTERVAL:
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _exited(filename):
+    """Whether the process that wrote a file has exited"""
+    try:
+        pid = int(filename.split('-')[0].split('.')[0])
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def _read(filename):
+    try:
+        with open(os.path.join(METRICS_DIR, filename)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def _fold_exited(names):
+    """Add the files of exited processes to exited.json, remove them and return the files left"""
+    dead = [name for name in names if name != EXITED_FILE and _exited(name)]
+    if not dead:
+        return names
+    merged = {}
+    for name in [EXITED_FILE] + dead:
+        # An exited process holds nothing open, so only its counters and histograms are kept
+        _add(merged, _read(name), gauges=False)
+    _write(EXITED_FILE, {
+        name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()
+    })
+    for name in dead:
+        os.remove(os.path.join(METRICS_DIR, name))
+    return [name for name in names if name not in dead and name != EXITED_FILE] + [EXITED_FILE]
+
+
+def _add(merged, data, gauges=True):
+    """Add one process's totals to {name: {label key: value}}"""
+    for name, samples in data.items():
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == 'gauge' and not gauges):
+            continue
+        values = merged.setdefault(name, {})
+        for key, value in samples:
+            key = tuple(key)
+            if metric.kind in ('counter', 'gauge'):
+                values[key] = values.get(key, 0) + value
+            elif key not in values:
+                values[key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+            else:
+                state = values[key]
+                state['buckets'] = [a + b for a, b in zip(state['buckets'], value['buckets'])]
+                state['sum'] += value['sum']
+                state['count'] += value['count']
+
+
+def _other_files():
+    try:
+        return [name for name in os.listdir(METRICS_DIR) if name.endswith('.json') and name != _filename()]
+    except FileNotFoundError:
+        return []
+
+
+def _merge():
+    """Sum this process's totals and the files of every other process into {name: {label key: value}}"""
+    merged = {}
+    if fcntl is not None and os.path.isdir(METRICS_DIR):
+        # Scrapes take turns, so two workers never fold the same file twice
+        with open(os.path.join(METRICS_DIR, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for filename in _fold_exited(_other_files()):
+                _add(merged, _read(filename))
+    else:
+        for filename in _other_files():
+            _add(merged, _read(filename))
+    _add(merged, _state())
+    return merged
+
+
+def _labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition():
+    """Return every process's metrics in the Prometheus text exposition format"""
+    merged = _merge()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind in ('counter', 'gauge'):
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (math.inf,), value['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, le=_number(float(bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_number(float(value["sum"]))}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,175 @@
+"""Per-request query, SQL time and template render time instrumentation"""
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import audit, metrics
+
+logger = logging.getLogger('banking_system.requests')
+
+# Requests slower than this are logged with their most expensive queries
+SLOW_REQUEST_MS = getattr(settings, 'SLOW_REQUEST_MS', 500)
+
+# The same SQL statement run this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 10)
+
+TOP_QUERIES = 5
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.statements = Counter()
+        self.statement_time = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper; sql is the parameterised statement, so N+1 lookups share a key"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += elapsed
+            self.statements[sql] += 1
+            self.statement_time[sql] += elapsed
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def repeated_statements(self):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def top_queries(self):
+        slowest = sorted(self.statement_time.items(), key=lambda item: item[1], reverse=True)[:TOP_QUERIES]
+        return [
+            {'sql': sql, 'count': self.statements[sql], 'ms': round(elapsed * 1000, 2)}
+            for sql, elapsed in slowest
+        ]
+
+    def server_timing(self, total_time):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={total_time * 1000:.1f}',
+        ])
+
+
+class TimedTemplate(Template):
+    """Template that adds its render time to the current request unless it renders inside another"""
+
+    def render(self, context=None, request=None):
+        recorded = _current.get()
+        if recorded is None or recorded.rendering:
+            return super().render(context, request)
+        recorded.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            recorded.template_time += time.perf_counter() - started
+            recorded.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time to RequestMetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def show_server_timing(request):
+    """Server-Timing exposes query counts and timings, so only developers and staff get it"""
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated and user.is_staff
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, SQL time, template render time and total time per request.
+
+    The figures go out in a Server-Timing header when DEBUG is on or the
+    user is staff; template time comes from the TimedDjangoTemplates
+    backend. Requests slower than SLOW_REQUEST_MS are logged with their top
+    queries, and statements repeated N_PLUS_ONE_THRESHOLD times are logged
+    as likely N+1 patterns.
+    Streaming responses are only measured up to the point they start.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorded = RequestMetrics()
+        token = _current.set(recorded)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorded))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total_time = recorded.total_time
+        if show_server_timing(request):
+            response['Server-Timing'] = recorded.server_timing(total_time)
+        metrics.REQUEST_SECONDS.observe(total_time, method=request.method)
+        metrics.REQUEST_SQL_SECONDS.observe(recorded.sql_time)
+        metrics.REQUEST_QUERIES.observe(recorded.queries)
+
+        repeated = recorded.repeated_statements()
+        for sql, count in repeated:
+            logger.warning('Possible N+1 on %s %s: %s executed %s times', request.method, request.path, sql, count)
+
+        if total_time * 1000 >= SLOW_REQUEST_MS:
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+                'total_ms': round(total_time * 1000, 1),
+                'sql_ms': round(recorded.sql_time * 1000, 1),
+                'template_ms': round(recorded.template_time * 1000, 1),
+                'queries': recorded.queries,
+                'repeated_statements': len(repeated),
+                'top_queries': recorded.top_queries(),
+            }
+            logger.warning('Slow request %s', json.dumps(record), extra={'request_metrics': record})
+        return response
+
+
+class AuditContextMiddleware:
+    """Make the current request available to audit events recorded while it is served"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = audit.current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            audit.current_request.reset(token)
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0003_alter_user_national_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberDashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accounts_summary', models.JSONField(default=list)),
+                ('recent_transactions', models.JSONField(default=list)),
+                ('total_savings', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('active_loans', models.JSONField(default=list)),
+                ('loan_count', models.PositiveIntegerField(default=0)),
+                ('loan_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('overdue_loans', models.PositiveIntegerField(default=0)),
+                ('loans_refreshed_on', models.DateField(blank=True, null=True)),
+                ('notifications', models.JSONField(default=list)),
+                ('unread_notifications', models.PositiveIntegerField(default=0)),
+                ('accounts_stale', models.BooleanField(default=True)),
+                ('loans_stale', models.BooleanField(default=True)),
+                ('notifications_stale', models.BooleanField(default=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_snapshot', to='banking_system.member')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0005_dashboard_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLedgerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal'), ('transfer', 'Transfer'), ('loan_disbursement', 'Loan Disbursement'), ('loan_repayment', 'Loan Repayment'), ('interest_payment', 'Interest Payment'), ('fee_charge', 'Fee Charge'), ('dividend_payment', 'Dividend Payment'), ('share_purchase', 'Share Purchase')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('reversed', 'Reversed')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_rollups', to='banking_system.branch')),
+            ],
+            options={
+                'unique_together': {('date', 'branch', 'transaction_type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0006_dailyledgerrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanproduct',
+            name='interest_method',
+            field=models.CharField(choices=[('reducing_balance', 'Reducing Balance'), ('flat_rate', 'Flat Rate'), ('declining', 'Declining Balance (Equal Principal)')], default='flat_rate', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='LoanScheduleLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installment_number', models.PositiveSmallIntegerField()),
+                ('due_date', models.DateField()),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='banking_system.loan')),
+            ],
+            options={
+                'ordering': ['loan', 'installment_number'],
+                'unique_together': {('loan', 'installment_number')},
+            },
+        ),
+    ]
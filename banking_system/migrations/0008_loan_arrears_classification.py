@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0007_loan_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='arrears_days',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='par_bucket',
+            field=models.CharField(choices=[('current', 'Current'), ('1_30', '1-30 Days'), ('31_60', '31-60 Days'), ('61_90', '61-90 Days'), ('90_plus', 'Over 90 Days')], default='current', max_length=10),
+        ),
+    ]
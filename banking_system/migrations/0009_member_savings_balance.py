@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:03
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_savings_balance(apps, schema_editor):
+    Account = apps.get_model('banking_system', 'Account')
+    Member = apps.get_model('banking_system', 'Member')
+    savings = (
+        Account.objects.filter(
+            models.Q(account_type__name__icontains='saving') | models.Q(account_type__code__istartswith='SAV'),
+            member=models.OuterRef('pk'),
+        )
+        .order_by().values('member').annotate(total=models.Sum('balance')).values('total')
+    )
+    Member.objects.update(savings_balance=Coalesce(
+        models.Subquery(savings), Decimal('0.00'),
+        output_field=models.DecimalField(max_digits=15, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0008_loan_arrears_classification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='savings_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.RunPython(backfill_savings_balance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:07
+
+from django.db import migrations, models
+
+TABLE = 'banking_system_searchdocument'
+FTS_TABLE = 'banking_system_searchdocument_fts'
+
+# External-content FTS5 table kept in step by triggers; a table remake on SQLite drops the
+# triggers, so later migrations that alter SearchDocument must recreate them
+SQLITE_CREATE = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(kind UNINDEXED, content, content='{TABLE}', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, kind, content) VALUES (new.id, new.kind, new.content);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, kind, content) VALUES ('delete', old.id, old.kind, old.content);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, kind, content) VALUES ('delete', old.id, old.kind, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, kind, content) VALUES (new.id, new.kind, new.content);
+    END""",
+]
+
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRESQL_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX searchdoc_content_trgm_idx ON {TABLE} USING gin (content gin_trgm_ops)",
+]
+
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS searchdoc_content_trgm_idx",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0009_member_savings_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('member', 'Member'), ('account', 'Account'), ('transaction', 'Transaction')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('content', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}),
+            _run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
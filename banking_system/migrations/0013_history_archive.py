@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0012_audit_log_event_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('period', models.DateField(help_text='First day of the month the event belongs to')),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('action_type', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('login', 'Login'), ('logout', 'Logout'), ('transaction', 'Transaction'), ('loan_approval', 'Loan Approval'), ('member_approval', 'Member Approval')], max_length=20)),
+                ('model_name', models.CharField(max_length=50)),
+                ('object_id', models.CharField(max_length=50)),
+                ('description', models.TextField()),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.TextField(blank=True)),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['-timestamp'], name='audit_archive_timestamp_idx'), models.Index(fields=['user_id', '-timestamp'], name='audit_archive_user_idx'), models.Index(fields=['model_name', 'object_id'], name='audit_archive_object_idx'), models.Index(fields=['period'], name='audit_archive_period_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('period', models.DateField(help_text='First day of the month the transaction belongs to')),
+                ('transaction_id', models.UUIDField(unique=True)),
+                ('account_id', models.BigIntegerField()),
+                ('transaction_type', models.CharField(choices=[('deposit', 'Deposit'), ('withdrawal', 'Withdrawal'), ('transfer', 'Transfer'), ('loan_disbursement', 'Loan Disbursement'), ('loan_repayment', 'Loan Repayment'), ('interest_payment', 'Interest Payment'), ('fee_charge', 'Fee Charge'), ('dividend_payment', 'Dividend Payment'), ('share_purchase', 'Share Purchase')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_before', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('description', models.TextField()),
+                ('reference_number', models.CharField(blank=True, max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('reversed', 'Reversed')], max_length=20)),
+                ('processed_by_id', models.BigIntegerField(null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('destination_account_id', models.BigIntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['account_id', 'created_at', 'id'], name='txn_archive_account_idx'), models.Index(fields=['period'], name='txn_archive_period_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0013_history_archive'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dividendpayment',
+            unique_together={('dividend', 'member')},
+        ),
+        migrations.AddIndex(
+            model_name='sharetransaction',
+            index=models.Index(fields=['member', 'transaction_date'], name='share_txn_member_date_idx'),
+        ),
+    ]
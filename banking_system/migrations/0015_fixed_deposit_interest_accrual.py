@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0014_dividend_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fixeddeposit',
+            name='interest_accrued_to',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
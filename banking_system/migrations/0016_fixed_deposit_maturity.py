@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0015_fixed_deposit_interest_accrual'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fixeddeposit',
+            index=models.Index(fields=['status', 'maturity_date'], name='fd_status_maturity_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0016_fixed_deposit_maturity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='dormant_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['status', 'last_transaction_date'], name='account_status_activity_idx'),
+        ),
+    ]
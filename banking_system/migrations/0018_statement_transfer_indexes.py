@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0017_account_dormancy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['destination_account', 'created_at', 'id'], name='txn_destination_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionarchive',
+            index=models.Index(fields=['destination_account_id', 'created_at', 'id'], name='txn_archive_destination_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0018_statement_transfer_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailyledgerrollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='dailyledgerrollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyledgerrollup',
+            unique_together={('date', 'branch', 'transaction_type', 'status', 'shard')},
+        ),
+    ]
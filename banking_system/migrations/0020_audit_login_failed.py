@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking_system', '0019_ledger_rollup_shards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action_type',
+            field=models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('login', 'Login'), ('login_failed', 'Failed Login'), ('logout', 'Logout'), ('transaction', 'Transaction'), ('loan_approval', 'Loan Approval'), ('member_approval', 'Member Approval')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='auditlogarchive',
+            name='action_type',
+            field=models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('login', 'Login'), ('login_failed', 'Failed Login'), ('logout', 'Logout'), ('transaction', 'Transaction'), ('loan_approval', 'Loan Approval'), ('member_approval', 'Member Approval')], max_length=20),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from decimal import Decimal
 import uuid
@@ -38,6 +39,39 @@ class Branch(models.Model):
         return f"{self.name} ({self.code})"
 
 
+class MemberQuerySet(models.QuerySet):
+    """Set-based financial figures for member lists"""
+
+    def with_financials(self):
+        """Annotate account counts and active loan balances with correlated subqueries"""
+        accounts = (
+            Account.objects.filter(member=models.OuterRef('pk')).order_by()
+            .values('member').annotate(count=models.Count('pk')).values('count')
+        )
+        loans = (
+            Loan.objects.filter(member=models.OuterRef('pk'), status='active').order_by()
+            .values('member').annotate(total=models.Sum('balance')).values('total')
+        )
+        return self.annotate(
+            accounts_count=Coalesce(models.Subquery(accounts), 0),
+            loan_balance=Coalesce(
+                models.Subquery(loans), Decimal('0.00'),
+                output_field=models.DecimalField(max_digits=15, decimal_places=2),
+            ),
+        )
+
+    def refresh_savings_balance(self):
+        """Recompute savings_balance from the savings accounts of the selected members"""
+        savings = (
+            Account.objects.filter(AccountType.savings_filter('account_type__'), member=models.OuterRef('pk'))
+            .order_by().values('member').annotate(total=models.Sum('balance')).values('total')
+        )
+        return self.update(savings_balance=Coalesce(
+            models.Subquery(savings), Decimal('0.00'),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2),
+        ))
+
+
 class Member(models.Model):
     """Cooperative member model"""
     MEMBERSHIP_STATUS = [
@@ -56,15 +90,24 @@ class Member(models.Model):
     guarantor_2 = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='guaranteed_members_2')
     monthly_contribution = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_shares = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Sum of savings account balances, kept in step by the posting engine and Account signals
+    savings_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MemberQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status'], name='member_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.member_number}"
 
     @property
     def total_savings(self):
-        return sum(account.balance for account in self.accounts.filter(account_type='savings'))
+        return self.savings_balance
 
 
 class AccountType(models.Model):
@@ -80,6 +123,15 @@ class AccountType(models.Model):
     def __str__(self):
         return f"{self.name} ({self.code})"
 
+    @property
+    def is_savings(self):
+        return 'saving' in self.name.lower() or self.code.upper().startswith('SAV')
+
+    @staticmethod
+    def savings_filter(prefix=''):
+        """Q object matching the same account types as is_savings, optionally across a relation"""
+        return models.Q(**{f'{prefix}name__icontains': 'saving'}) | models.Q(**{f'{prefix}code__istartswith': 'SAV'})
+
 
 class Account(models.Model):
     """Bank accounts model"""
@@ -98,6 +150,9 @@ class Account(models.Model):
         ('frozen', 'Frozen')
     ]
 
+    # Statuses that still accept postings; frozen and closed accounts are rejected
+    POSTABLE_STATUSES = ('active', 'dormant')
+
     account_number = models.CharField(max_length=20, unique=True)
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='accounts')
     account_type = models.ForeignKey(AccountType, on_delete=models.CASCADE)
@@ -106,23 +161,36 @@ class Account(models.Model):
     status = models.CharField(max_length=20, choices=ACCOUNT_STATUS, default='active')
     date_opened = models.DateField(auto_now_add=True)
     last_transaction_date = models.DateTimeField(null=True, blank=True)
+    # Set by the dormancy run, cleared when activity reactivates the account
+    dormant_since = models.DateTimeField(null=True, blank=True)
     interest_earned = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Dormancy run: active accounts with no activity since a cutoff
+            models.Index(fields=['status', 'last_transaction_date'], name='account_status_activity_idx'),
+        ]
+
     def __str__(self):
         return f"{self.account_number} - {self.member.user.get_full_name()}"
 
     def update_balance(self, amount, transaction_type):
-        """Update account balance based on transaction type"""
+        """Update account balance based on transaction type with a single atomic UPDATE"""
+        from .posting import apply_balance_delta
+        from .snapshots import invalidate_accounts
+
         if transaction_type in ['deposit', 'credit']:
-            self.balance += amount
-            self.available_balance += amount
+            delta = amount
         elif transaction_type in ['withdrawal', 'debit']:
-            self.balance -= amount
-            self.available_balance -= amount
-        self.last_transaction_date = timezone.now()
-        self.save()
+            delta = -amount
+        else:
+            delta = 0
+        apply_balance_delta(self.pk, delta, allow_overdraft=True, statuses=None)
+        invalidate_accounts([self.pk])
+        self.refresh_from_db(fields=['balance', 'available_balance', 'status', 'last_transaction_date', 'dormant_since',
+                                  'updated_at'])
 
 
 class Transaction(models.Model):
@@ -139,6 +207,12 @@ class Transaction(models.Model):
         ('share_purchase', 'Share Purchase')
     ]
 
+    # Direction each type moves the balance of its source account
+    CREDIT_TYPES = ('deposit', 'loan_disbursement', 'interest_payment', 'dividend_payment')
+    DEBIT_TYPES = ('withdrawal', 'transfer', 'loan_repayment', 'fee_charge', 'share_purchase')
+    # Postings the society makes on its own; they do not count as account activity for dormancy
+    SYSTEM_TYPES = ('interest_payment', 'dividend_payment', 'fee_charge')
+
     TRANSACTION_STATUS = [
         ('pending', 'Pending'),
         ('completed', 'Completed'),
@@ -164,13 +238,46 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Statements (keyset on created_at, id) and recent activity per account/member
+            models.Index(fields=['account', 'created_at', 'id'], name='txn_account_created_idx'),
+            # Staff dashboard: completed transactions in a time window, overall and per type
+            models.Index(fields=['status', 'created_at'], name='txn_status_created_idx'),
+            models.Index(fields=['transaction_type', 'status', 'created_at'], name='txn_type_status_created_idx'),
+            # Statements: transfers received by an account
+            models.Index(fields=['destination_account', 'created_at', 'id'], name='txn_destination_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} - {self.account.account_number}"
 
 
+class DailyLedgerRollup(models.Model):
+    """Per-day transaction counts and totals by branch, type and status, split over shards"""
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='ledger_rollups')
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=20, choices=Transaction.TRANSACTION_STATUS)
+    # Postings spread their increments over several rows per key; readers sum them
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'branch', 'transaction_type', 'status', 'shard']
+
+    def __str__(self):
+        return f"{self.date} - {self.branch_id} - {self.transaction_type} ({self.status}): {self.count}"
+
+
 class LoanProduct(models.Model):
     """Different loan products offered"""
+    INTEREST_METHODS = [
+        ('reducing_balance', 'Reducing Balance'),
+        ('flat_rate', 'Flat Rate'),
+        ('declining', 'Declining Balance (Equal Principal)')
+    ]
+
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=10, unique=True)
     description = models.TextField()
@@ -182,6 +289,7 @@ class LoanProduct(models.Model):
     maximum_period_months = models.IntegerField()
     collateral_required = models.BooleanField(default=False)
     guarantors_required = models.IntegerField(default=2)
+    interest_method = models.CharField(max_length=20, choices=INTEREST_METHODS, default='flat_rate')
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
@@ -227,6 +335,14 @@ class Loan(models.Model):
         ('written_off', 'Written Off')
     ]
 
+    PAR_BUCKETS = [
+        ('current', 'Current'),
+        ('1_30', '1-30 Days'),
+        ('31_60', '31-60 Days'),
+        ('61_90', '61-90 Days'),
+        ('90_plus', 'Over 90 Days')
+    ]
+
     loan_number = models.CharField(max_length=20, unique=True)
     application = models.OneToOneField(LoanApplication, on_delete=models.CASCADE)
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='loans')
@@ -242,19 +358,50 @@ class Loan(models.Model):
     disbursement_date = models.DateField()
     maturity_date = models.DateField()
     next_payment_date = models.DateField()
+    # Maintained by the nightly classify_loan_arrears job
+    arrears_days = models.PositiveIntegerField(default=0)
+    par_bucket = models.CharField(max_length=10, choices=PAR_BUCKETS, default='current')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'status', 'next_payment_date'], name='loan_member_status_due_idx'),
+            models.Index(fields=['status', 'next_payment_date'], name='loan_status_due_idx'),
+        ]
+
     def __str__(self):
         return f"{self.loan_number} - {self.member.user.get_full_name()} - {self.balance}"
 
     @property
     def days_overdue(self):
-        if self.next_payment_date < timezone.now().date():
-            return (timezone.now().date() - self.next_payment_date).days
+        today = timezone.now().date()
+        if self.next_payment_date < today:
+            return (today - self.next_payment_date).days
         return 0
 
 
+class LoanScheduleLine(models.Model):
+    """One installment of a loan repayment schedule"""
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='schedule')
+    installment_number = models.PositiveSmallIntegerField()
+    due_date = models.DateField()
+    principal = models.DecimalField(max_digits=12, decimal_places=2)
+    interest = models.DecimalField(max_digits=12, decimal_places=2)
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        unique_together = ['loan', 'installment_number']
+        ordering = ['loan', 'installment_number']
+
+    def __str__(self):
+        return f"{self.loan_id} #{self.installment_number} - {self.due_date}"
+
+    @property
+    def amount(self):
+        return self.principal + self.interest
+
+
 class LoanPayment(models.Model):
     """Loan payment records"""
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='payments')
@@ -306,6 +453,12 @@ class ShareTransaction(models.Model):
     transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Share holdings per member over a period (dividend pro-rating)
+            models.Index(fields=['member', 'transaction_date'], name='share_txn_member_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.member.user.get_full_name()} - {self.transaction_type} - {self.number_of_shares} shares"
 
@@ -319,6 +472,9 @@ class FixedDeposit(models.Model):
         ('renewed', 'Renewed')
     ]
 
+    # Statuses of a deposit that is running a term: the original one or a rolled-over one
+    OPEN_STATUSES = ('active', 'renewed')
+
     account = models.OneToOneField(Account, on_delete=models.CASCADE)
     principal_amount = models.DecimalField(max_digits=15, decimal_places=2)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -328,8 +484,16 @@ class FixedDeposit(models.Model):
     maturity_date = models.DateField()
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='active')
     auto_renew = models.BooleanField(default=False)
+    # Last day included in Account.interest_earned by the monthly accrual run
+    interest_accrued_to = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Maturity run: open deposits due on or before a date
+            models.Index(fields=['status', 'maturity_date'], name='fd_status_maturity_idx'),
+        ]
+
     def __str__(self):
         return f"FD-{self.account.account_number} - {self.principal_amount}"
 
@@ -359,6 +523,10 @@ class DividendPayment(models.Model):
     transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # One payout per member per dividend; a rerun of the dividend run skips members already paid
+        unique_together = ['dividend', 'member']
+
     def __str__(self):
         return f"{self.member.user.get_full_name()} - {self.dividend.year} - {self.amount}"
 
@@ -443,6 +611,14 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Only unread notifications are listed per recipient, so keep the index partial
+            models.Index(
+                fields=['recipient', '-created_at'],
+                condition=models.Q(is_read=False),
+                name='notif_unread_recipient_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.recipient.username} - {self.title}"
@@ -467,6 +643,7 @@ class AuditLog(models.Model):
         ('update', 'Update'),
         ('delete', 'Delete'),
         ('login', 'Login'),
+        ('login_failed', 'Failed Login'),
         ('logout', 'Logout'),
         ('transaction', 'Transaction'),
         ('loan_approval', 'Loan Approval'),
@@ -480,10 +657,130 @@ class AuditLog(models.Model):
     description = models.TextField()
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens rather than when the batched writer inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp'], name='audit_timestamp_idx'),
+            models.Index(fields=['user', '-timestamp'], name='audit_user_timestamp_idx'),
+            models.Index(fields=['model_name', 'object_id'], name='audit_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.action_type} - {self.model_name} - {self.timestamp}"
+
+class MemberDashboardSnapshot(models.Model):
+    """Precomputed member dashboard figures, rebuilt per section when marked stale"""
+    member = models.OneToOneField(Member, on_delete=models.CASCADE, related_name='dashboard_snapshot')
+    accounts_summary = models.JSONField(default=list)
+    recent_transactions = models.JSONField(default=list)
+    total_savings = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    active_loans = models.JSONField(default=list)
+    loan_count = models.PositiveIntegerField(default=0)
+    loan_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    overdue_loans = models.PositiveIntegerField(default=0)
+    loans_refreshed_on = models.DateField(null=True, blank=True)
+    notifications = models.JSONField(default=list)
+    unread_notifications = models.PositiveIntegerField(default=0)
+    accounts_stale = models.BooleanField(default=True)
+    loans_stale = models.BooleanField(default=True)
+    notifications_stale = models.BooleanField(default=True)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard snapshot - {self.member_id}"
+
+
+class SearchDocument(models.Model):
+    """Lower-cased search text of a member, account or transaction for admin and teller lookup"""
+    KINDS = [
+        ('member', 'Member'),
+        ('account', 'Account'),
+        ('transaction', 'Transaction'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    content = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
+
+
+class NumberSequence(models.Model):
+    """Last value handed out for a business number series, advanced in blocks by numbering.allocate"""
+    name = models.CharField(max_length=30, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
+class TransactionArchive(models.Model):
+    """
+    Transactions of closed months moved out of the live table by archive_history.
+
+    Rows keep their original primary key. Related rows are referenced by id
+    only, so the archive can live in a separate database (see routers.ArchiveRouter).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    period = models.DateField(help_text="First day of the month the transaction belongs to")
+    transaction_id = models.UUIDField(unique=True)
+    account_id = models.BigIntegerField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_before = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2)
+    description = models.TextField()
+    reference_number = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=20, choices=Transaction.TRANSACTION_STATUS)
+    processed_by_id = models.BigIntegerField(null=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    destination_account_id = models.BigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['account_id', 'created_at', 'id'], name='txn_archive_account_idx'),
+            models.Index(fields=['destination_account_id', 'created_at', 'id'], name='txn_archive_destination_idx'),
+            models.Index(fields=['period'], name='txn_archive_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type} - {self.amount} - {self.period:%Y-%m}"
+
+
+class AuditLogArchive(models.Model):
+    """Audit events of closed months moved out of the live AuditLog table by archive_history"""
+    id = models.BigIntegerField(primary_key=True)
+    period = models.DateField(help_text="First day of the month the event belongs to")
+    user_id = models.BigIntegerField(null=True)
+    action_type = models.CharField(max_length=20, choices=AuditLog.ACTION_TYPES)
+    model_name = models.CharField(max_length=50)
+    object_id = models.CharField(max_length=50)
+    description = models.TextField()
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.TextField(blank=True)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp'], name='audit_archive_timestamp_idx'),
+            models.Index(fields=['user_id', '-timestamp'], name='audit_archive_user_idx'),
+            models.Index(fields=['model_name', 'object_id'], name='audit_archive_object_idx'),
+            models.Index(fields=['period'], name='audit_archive_period_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user} - {self.action_type} - {self.model_name} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.user_id} - {self.action_type} - {self.model_name} - {self.timestamp}"
@@ -0,0 +1,133 @@
+"""
+Collision-free member, account, loan and application numbers.
+
+Blocks of numbers are reserved on a connection of their own, owned by a
+single reserver thread, and commit at once. The caller's transaction never
+holds the sequence row lock, and a block stays with the process even if
+that transaction rolls back, so numbers can be skipped but never reissued.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, close_old_connections, connection, transaction as db_transaction
+from django.db.models import F
+
+from .models import NumberSequence
+
+# Sequence name: (prefix, zero-padded digits). The widths differ from the older random
+# numbers (M + 6, LN + 7, APP + 6, 10-digit accounts), so the two series cannot collide.
+SEQUENCES = {
+    'member': ('M', 7),
+    'account': ('', 10),
+    'loan': ('LN', 8),
+    'application': ('APP', 8),
+}
+
+# Sequences whose numbers end in a Luhn check digit
+CHECK_DIGIT_SEQUENCES = {'account'}
+
+# Numbers reserved per database round trip and kept by the process for later allocations
+BLOCK_SIZE = 100
+
+_lock = threading.Lock()
+_blocks = {}  # name -> list of [next_value, last_value] ranges this process owns
+_reserver = None
+_reserver_pid = None
+
+
+def luhn_check_digit(digits):
+    """Return the Luhn check digit for a string of digits"""
+    total = 0
+    for position, char in enumerate(reversed(digits)):
+        digit = int(char)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_account_number(number):
+    return number.isdigit() and len(number) > 1 and luhn_check_digit(number[:-1]) == number[-1]
+
+
+def format_number(name, value):
+    prefix, digits = SEQUENCES[name]
+    number = f"{prefix}{value:0{digits}d}"
+    if name in CHECK_DIGIT_SEQUENCES:
+        number += luhn_check_digit(number)
+    return number
+
+
+def _reserve(name, size):
+    """Advance a sequence by size in the database and return the first value of the reserved range"""
+    sequence = NumberSequence.objects.filter(name=name)
+    with db_transaction.atomic():
+        if not sequence.update(last_value=F('last_value') + size):
+            try:
+                with db_transaction.atomic():
+                    NumberSequence.objects.create(name=name, last_value=size)
+                return 1
+            except IntegrityError:
+                # Another process created the row first
+                sequence.update(last_value=F('last_value') + size)
+        # The UPDATE holds the row lock, so this reads back our own increment
+        return sequence.values_list('last_value', flat=True).get() - size + 1
+
+
+def _reserve_committed(name, size):
+    # Runs on the reserver thread, whose connection is in autocommit mode
+    close_old_connections()
+    return _reserve(name, size)
+
+
+def _reserve_outside_transaction(name, size):
+    """Reserve a block on the reserver thread's connection, so it commits whatever the caller does"""
+    global _reserver, _reserver_pid
+    # A forked worker inherits the executor but not its thread
+    if _reserver is None or _reserver_pid != os.getpid():
+        _reserver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='numbering')
+        _reserver_pid = os.getpid()
+    return _reserver.submit(_reserve_committed, name, size).result()
+
+
+def allocate(name, count=1):
+    """
+    Return count new numbers of a sequence, formatted for their field.
+
+    Numbers come from blocks this process already reserved; when those run
+    out a single UPDATE reserves the shortfall plus BLOCK_SIZE spares. SQLite
+    allows one writer at a time, so inside a transaction there the caller
+    already holds the lock a second connection would wait on; the shortfall
+    alone is then reserved in the caller's transaction, which a rollback
+    returns to the sequence.
+    """
+    if name not in SEQUENCES:
+        raise KeyError(f"Unknown number sequence: {name}")
+    values = []
+    with _lock:
+        blocks = _blocks.setdefault(name, [])
+        while blocks and len(values) < count:
+            block = blocks[0]
+            take = min(count - len(values), block[1] - block[0] + 1)
+            values.extend(range(block[0], block[0] + take))
+            block[0] += take
+            if block[0] > block[1]:
+                blocks.pop(0)
+
+        missing = count - len(values)
+        if missing and connection.vendor == 'sqlite' and connection.in_atomic_block:
+            first = _reserve(name, missing)
+            values.extend(range(first, first + missing))
+        elif missing:
+            first = _reserve_outside_transaction(name, missing + BLOCK_SIZE)
+            values.extend(range(first, first + missing))
+            blocks.append([first + missing, first + missing + BLOCK_SIZE - 1])
+
+    return [format_number(name, value) for value in values]
+
+
+def next_number(name):
+    return allocate(name)[0]
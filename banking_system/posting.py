@@ -0,0 +1,334 @@
+"""Posting engine for account balances and their transaction records"""
+from collections import Counter, defaultdict, namedtuple
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from . import audit, metrics, rollups, search, snapshots
+from .models import Account, AccountType, Member, Transaction
+
+
+# One entry of a batch run; ids rather than instances so callers can stream millions of them
+Posting = namedtuple(
+    'Posting',
+    ['account_id', 'transaction_type', 'amount', 'description', 'reference_number',
+     'processed_by_id', 'destination_account_id'],
+    defaults=('', '', None, None),
+)
+
+BatchResult = namedtuple('BatchResult', ['posted', 'rejected'])
+
+VALID_TYPES = frozenset(Transaction.CREDIT_TYPES + Transaction.DEBIT_TYPES)
+
+
+class PostingError(Exception):
+    """Raised when a posting cannot be applied"""
+
+
+class InsufficientFunds(PostingError):
+    """Raised when a debit would take the available balance below zero"""
+
+
+class AccountNotPostable(PostingError):
+    """Raised when the account does not exist or its status blocks postings"""
+
+
+def signed_amount(amount, transaction_type):
+    """Return the balance delta a transaction type applies to its source account"""
+    if transaction_type in Transaction.CREDIT_TYPES:
+        return amount
+    if transaction_type in Transaction.DEBIT_TYPES:
+        return -amount
+    raise PostingError(f"Unknown transaction type: {transaction_type}")
+
+
+def apply_balance_delta(account_id, delta, allow_overdraft=False, statuses=Account.POSTABLE_STATUSES,
+                        activity=True):
+    """
+    Add delta to an account balance with a single conditional UPDATE and return the new balance.
+
+    The UPDATE takes the row lock, so the balance read back inside the same
+    DB transaction is the one this call produced, even on a hot account.
+    With activity, the posting also counts as account activity: it stamps
+    last_transaction_date and reactivates a dormant account.
+    """
+    now = timezone.now()
+    with db_transaction.atomic():
+        accounts = Account.objects.filter(pk=account_id)
+        if statuses is not None:
+            accounts = accounts.filter(status__in=statuses)
+        if delta < 0 and not allow_overdraft:
+            accounts = accounts.filter(available_balance__gte=-delta)
+
+        updated = accounts.update(
+            balance=F('balance') + delta,
+            available_balance=F('available_balance') + delta,
+            updated_at=now,
+            **(activity_fields(now) if activity else {}),
+        )
+        if not updated:
+            raise _rejection(account_id, statuses)
+
+        sync_savings_balances({account_id: delta})
+        return Account.objects.filter(pk=account_id).values_list('balance', flat=True).get()
+
+
+def activity_fields(now):
+    """UPDATE values recording account activity: stamp the time and bring a dormant account back"""
+    return {
+        'last_transaction_date': now,
+        'status': Case(When(status='dormant', then=Value('active')), default=F('status')),
+        'dormant_since': None,
+    }
+
+
+def _rejection(account_id, statuses):
+    """Work out why a conditional balance UPDATE matched no row"""
+    status = Account.objects.filter(pk=account_id).values_list('status', flat=True).first()
+    if status is None:
+        return AccountNotPostable(f"Account {account_id} does not exist")
+    if statuses is not None and status not in statuses:
+        return AccountNotPostable(f"Account {account_id} is {status}")
+    return InsufficientFunds(f"Insufficient funds in account {account_id}")
+
+
+def post_transaction(account, transaction_type, amount, description='', reference_number='',
+                     processed_by=None, destination_account=None, allow_overdraft=False):
+    """
+    Apply a transaction to the balance(s) it touches and record it as completed.
+
+    Balance updates and the Transaction insert share one DB transaction, so a
+    rejected posting leaves neither behind. Transfers debit ``account`` and
+    credit ``destination_account``; rows are updated in primary key order so
+    two opposite transfers cannot deadlock.
+    """
+    if amount <= 0:
+        raise PostingError("Posting amount must be positive")
+    delta = signed_amount(amount, transaction_type)
+
+    if transaction_type == 'transfer':
+        if destination_account is None or destination_account.pk == account.pk:
+            raise PostingError("Transfers need a different destination account")
+        deltas = {account.pk: delta, destination_account.pk: amount}
+    else:
+        destination_account = None
+        deltas = {account.pk: delta}
+
+    with metrics.POSTING_SECONDS.time(mode='single'), db_transaction.atomic():
+        balances = {}
+        try:
+            for account_id in sorted(deltas):
+                # Only the customer's own postings count as activity on the source account
+                activity = account_id == account.pk and transaction_type not in Transaction.SYSTEM_TYPES
+                balances[account_id] = apply_balance_delta(
+                    account_id, deltas[account_id], allow_overdraft=allow_overdraft, activity=activity
+                )
+        except PostingError:
+            metrics.TRANSACTIONS_POSTED.inc(transaction_type=transaction_type, status='failed')
+            raise
+
+        balance_after = balances[account.pk]
+        txn = Transaction.objects.create(
+            account=account,
+            transaction_type=transaction_type,
+            amount=amount,
+            balance_before=balance_after - delta,
+            balance_after=balance_after,
+            description=description,
+            reference_number=reference_number,
+            status='completed',
+            processed_by=processed_by,
+            processed_at=timezone.now(),
+            destination_account=destination_account,
+        )
+        audit.record_entries([_audit_entry(txn)])
+    metrics.TRANSACTIONS_POSTED.inc(transaction_type=transaction_type, status='completed')
+    return txn
+
+
+def post_batch(postings, chunk_size=1000, allow_overdraft=False, on_chunk=None):
+    """
+    Post an iterable of Posting tuples in chunks and return a BatchResult.
+
+    Each chunk runs in its own DB transaction: the touched accounts are read
+    once, running balance_before/balance_after values are computed in memory,
+    transactions are written with one bulk_create and balances with one
+    CASE-based UPDATE per parameter-limited batch. Postings that fail the
+    status or funds checks, or are invalid (non-positive amount, unknown
+    type), are recorded as failed transactions that leave the balance
+    unchanged, so a bad posting never stops a batch halfway.
+
+    on_chunk, if given, is called inside each chunk's DB transaction with one
+    Transaction per posting in posting order, so callers can link their own
+    rows to them atomically. A posting on an account that does not exist
+    gets an unsaved failed Transaction, since there is no account to record
+    it against.
+    """
+    posted = rejected = 0
+    postings = iter(postings)
+    while True:
+        chunk = list(islice(postings, chunk_size))
+        if not chunk:
+            break
+        chunk_posted, chunk_rejected = _post_chunk(chunk, allow_overdraft, on_chunk)
+        posted += chunk_posted
+        rejected += chunk_rejected
+    return BatchResult(posted, rejected)
+
+
+def _lock_for_write():
+    """
+    Take SQLite's write lock at the start of the current transaction.
+
+    SQLite ignores select_for_update, and a transaction that reads before it
+    writes fails at once with "database is locked" if another connection,
+    such as the audit writer thread, writes in between. An UPDATE matching
+    no row takes the lock, waiting for it like any other write.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'UPDATE {connection.ops.quote_name(Account._meta.db_table)} SET id = id WHERE 0')
+
+
+def _post_chunk(chunk, allow_overdraft, on_chunk=None):
+    """Post one chunk of a batch inside a single DB transaction"""
+    account_ids = {p.account_id for p in chunk}
+    account_ids.update(p.destination_account_id for p in chunk if p.destination_account_id)
+    now = timezone.now()
+
+    with metrics.POSTING_SECONDS.time(mode='batch'), db_transaction.atomic():
+        _lock_for_write()
+        accounts = {
+            row['id']: row
+            for row in Account.objects.select_for_update(of=('self',)).filter(pk__in=account_ids)
+            .order_by('pk').values('id', 'balance', 'available_balance', 'status', 'member__branch_id')
+        }
+        deltas = defaultdict(Decimal)
+        active_ids = set()
+        transactions = []
+        saved = []  # a failed posting on a missing account has no row to write
+        rejected = 0
+
+        for posting in chunk:
+            source = accounts.get(posting.account_id)
+            destination = None
+            # Invalid postings are rejected like any other, so earlier chunks are never left half-applied
+            valid = posting.amount > 0 and posting.transaction_type in VALID_TYPES
+            delta = signed_amount(posting.amount, posting.transaction_type) if valid else 0
+            accepted = valid and _accepts(source, delta, allow_overdraft)
+            if posting.transaction_type == 'transfer':
+                destination = accounts.get(posting.destination_account_id)
+                accepted = (accepted and destination is not source
+                            and _accepts(destination, posting.amount, allow_overdraft))
+
+            balance_before = source['balance'] if source is not None else Decimal('0.00')
+            if accepted:
+                status = 'completed'
+                _apply(source, delta, deltas)
+                if posting.transaction_type not in Transaction.SYSTEM_TYPES:
+                    active_ids.add(posting.account_id)
+                if destination is not None:
+                    _apply(destination, posting.amount, deltas)
+            else:
+                status = 'failed'
+                rejected += 1
+
+            txn = Transaction(
+                account_id=posting.account_id,
+                transaction_type=posting.transaction_type,
+                amount=posting.amount,
+                balance_before=balance_before,
+                balance_after=source['balance'] if source is not None else balance_before,
+                description=posting.description,
+                reference_number=posting.reference_number,
+                status=status,
+                processed_by_id=posting.processed_by_id,
+                processed_at=now,
+                destination_account_id=posting.destination_account_id if destination else None,
+            )
+            transactions.append(txn)
+            if source is not None:
+                saved.append(txn)
+
+        Transaction.objects.bulk_create(saved)
+        _add_deltas(Account, deltas, ('balance', 'available_balance'), updated_at=now)
+        if active_ids:
+            Account.objects.filter(pk__in=sorted(active_ids)).update(**activity_fields(now))
+        sync_savings_balances(deltas)
+        rollups.record_transactions(
+            saved, branch_ids={pk: row['member__branch_id'] for pk, row in accounts.items()}
+        )
+        # bulk_create sends no post_save, so invalidate the owners' dashboards and index here
+        snapshots.invalidate_accounts(account_ids)
+        search.index_transactions(saved)
+        audit.record_entries([_audit_entry(txn) for txn in saved])
+        if on_chunk is not None:
+            on_chunk(transactions)
+
+    outcomes = Counter((txn.transaction_type, txn.status) for txn in transactions)
+    for (transaction_type, status), count in outcomes.items():
+        metrics.TRANSACTIONS_POSTED.inc(count, transaction_type=transaction_type, status=status)
+    return len(chunk) - rejected, rejected
+
+
+def _audit_entry(txn):
+    return audit.entry(
+        'transaction', 'Transaction', txn.transaction_id,
+        f"{txn.transaction_type} of {txn.amount} on account {txn.account_id}: {txn.status}",
+        user=txn.processed_by_id,
+    )
+
+
+def _accepts(account, delta, allow_overdraft):
+    """Mirror the conditions of apply_balance_delta for an in-memory account row"""
+    if account is None or account['status'] not in Account.POSTABLE_STATUSES:
+        return False
+    return delta >= 0 or allow_overdraft or account['available_balance'] + delta >= 0
+
+
+def _apply(account, delta, deltas):
+    """Move an in-memory account row forward and accumulate its delta for the UPDATE"""
+    account['balance'] += delta
+    account['available_balance'] += delta
+    deltas[account['id']] += delta
+
+
+def sync_savings_balances(deltas):
+    """Carry {account_id: delta} changes of savings accounts over to Member.savings_balance"""
+    account_ids = [pk for pk, delta in deltas.items() if delta]
+    if not account_ids:
+        return
+    member_deltas = defaultdict(Decimal)
+    savings = Account.objects.filter(AccountType.savings_filter('account_type__'), pk__in=account_ids)
+    for account_id, member_id in savings.values_list('pk', 'member_id'):
+        member_deltas[member_id] += deltas[account_id]
+    _add_deltas(Member, member_deltas, ('savings_balance',))
+
+
+def add_interest_earned(amounts):
+    """Add {account_id: amount} to Account.interest_earned"""
+    _add_deltas(Account, amounts, ('interest_earned',))
+
+
+def _add_deltas(model, deltas, fields, **values):
+    """Add aggregated per-row deltas to the given fields with CASE-based UPDATE statements"""
+    pks = sorted(pk for pk, delta in deltas.items() if delta)
+    if not pks:
+        return
+    # Each row contributes its pk to the IN list and a pk/delta pair to every CASE expression
+    batch_size = max(connection.ops.bulk_batch_size(['pk'] * (1 + 2 * len(fields)), pks), 1)
+    output_field = DecimalField(max_digits=15, decimal_places=2)
+
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        delta_case = Case(
+            *[When(pk=pk, then=Value(deltas[pk], output_field=output_field)) for pk in batch],
+            default=Value(Decimal('0.00'), output_field=output_field),
+            output_field=output_field,
+        )
+        model.objects.filter(pk__in=batch).update(
+            **{field: F(field) + delta_case for field in fields}, **values
+        )
@@ -0,0 +1,102 @@
+"""
+Daily ledger rollups maintained at posting time.
+
+Each (date, branch, type, status) total is split over ROLLUP_SHARDS rows
+and a posting increments one of them at random, so concurrent postings of
+the same kind rarely wait on the same row lock. Readers sum the shards.
+Transactions saved or deleted one at a time, by the engine, the admin or
+management commands, are kept in step by the Transaction signals;
+post_batch bulk-creates and records its own.
+"""
+import random
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Account, DailyLedgerRollup
+
+ROLLUP_SHARDS = 8
+
+
+def record_transactions(transactions, branch_ids=None):
+    """
+    Add newly created transactions to their daily rollup rows.
+
+    branch_ids maps account id to branch id; when omitted it is looked up
+    with one query for all accounts in the batch.
+    """
+    for key, (count, amount) in _totals(transactions, branch_ids).items():
+        _add(*key, count, amount)
+
+
+def remove_transactions(transactions, branch_ids=None):
+    """Take deleted transactions, or the previous state of edited ones, out of their rollup rows"""
+    for key, (count, amount) in _totals(transactions, branch_ids).items():
+        _subtract(*key, count, amount)
+
+
+def _totals(transactions, branch_ids):
+    """Count and sum transactions per (date, branch, type, status) rollup key"""
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    if not transactions:
+        return totals
+    if branch_ids is None:
+        branch_ids = dict(
+            Account.objects.filter(pk__in={t.account_id for t in transactions})
+            .values_list('id', 'member__branch_id')
+        )
+
+    for txn in transactions:
+        key = (
+            timezone.localdate(txn.created_at),
+            branch_ids[txn.account_id],
+            txn.transaction_type,
+            txn.status,
+        )
+        totals[key][0] += 1
+        totals[key][1] += txn.amount
+    return totals
+
+
+def _add(date, branch_id, transaction_type, status, count, amount):
+    """Increment one shard of a rollup row, creating it on first use"""
+    key = dict(date=date, branch_id=branch_id, transaction_type=transaction_type, status=status,
+               shard=random.randrange(ROLLUP_SHARDS))
+    increment = dict(count=F('count') + count, total_amount=F('total_amount') + amount)
+    if DailyLedgerRollup.objects.filter(**key).update(**increment):
+        return
+    try:
+        with db_transaction.atomic():
+            DailyLedgerRollup.objects.create(count=count, total_amount=amount, **key)
+    except IntegrityError:
+        # Another posting created the row first
+        DailyLedgerRollup.objects.filter(**key).update(**increment)
+
+
+def _subtract(date, branch_id, transaction_type, status, count, amount):
+    """Decrement a rollup row, taking the count from its fullest shards so none goes negative"""
+    rows = DailyLedgerRollup.objects.filter(date=date, branch_id=branch_id, transaction_type=transaction_type,
+                                            status=status)
+    for pk, shard_count in rows.filter(count__gt=0).order_by('-count').values_list('pk', 'count'):
+        taken = min(shard_count, count)
+        # Guarded on the count read above in case a concurrent removal took from the shard first
+        if rows.filter(pk=pk, count__gte=taken).update(count=F('count') - taken,
+                                                       total_amount=F('total_amount') - amount):
+            amount = 0
+            count -= taken
+            if not count:
+                return
+
+
+def ledger_summary(start_date, end_date, branch=None, status='completed'):
+    """Return {transaction_type: {'count', 'total'}} for an inclusive date range"""
+    rollups = DailyLedgerRollup.objects.filter(date__gte=start_date, date__lte=end_date, status=status)
+    if branch is not None:
+        rollups = rollups.filter(branch=branch)
+    return {
+        row['transaction_type']: {'count': row['count'], 'total': row['total']}
+        for row in rollups.values('transaction_type').annotate(count=Sum('count'), total=Sum('total_amount'))
+    }
@@ -0,0 +1,101 @@
+"""Database routers for the banking_system models"""
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Alias of the optional separate database holding archived history
+ARCHIVE_DATABASE = 'archive'
+
+ARCHIVE_MODELS = {'transactionarchive', 'auditlogarchive'}
+
+# Alias of the optional read replica
+REPLICA_DATABASE = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def archive_database():
+    """Alias that archive models are stored in: the archive database if configured, else default"""
+    return ARCHIVE_DATABASE if ARCHIVE_DATABASE in settings.DATABASES else 'default'
+
+
+class ArchiveRouter:
+    """
+    Keep TransactionArchive and AuditLogArchive in the 'archive' database when one is configured.
+
+    Without an 'archive' entry in DATABASES the archive tables sit next to the
+    live ones in the default database and this router stays out of the way.
+    """
+
+    def _is_archive(self, model):
+        return model._meta.app_label == 'banking_system' and model._meta.model_name in ARCHIVE_MODELS
+
+    def db_for_read(self, model, **hints):
+        if self._is_archive(model):
+            return archive_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == ARCHIVE_DATABASE:
+            return app_label == 'banking_system' and model_name in ARCHIVE_MODELS
+        if app_label == 'banking_system' and model_name in ARCHIVE_MODELS:
+            return db == archive_database()
+        return None
+
+
+class read_from_replica(ContextDecorator):
+    """
+    Send reads inside the block (or decorated view) to the read replica.
+
+    Meant for dashboards and reports that can tolerate replication lag;
+    writes still go to the default database. Without a 'replica' entry in
+    DATABASES this does nothing.
+    """
+
+    def _recreate_cm(self):
+        # A decorated view can run in several threads at once, so each call gets its own token
+        return type(self)()
+
+    def __enter__(self):
+        self._token = _replica_reads.set(True)
+        return self
+
+    def __exit__(self, *exc_info):
+        _replica_reads.reset(self._token)
+        return False
+
+
+class ReplicaRouter:
+    """Route reads marked with read_from_replica to the replica, unless default is mid-transaction"""
+
+    def db_for_read(self, model, **hints):
+        if (
+            _replica_reads.get()
+            and REPLICA_DATABASE in settings.DATABASES
+            # Rows written in the open transaction are not on the replica yet
+            and not connections['default'].in_atomic_block
+        ):
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as default, so objects read from either may be related
+        databases = {'default', REPLICA_DATABASE}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DATABASE:
+            return False
+        return None
@@ -0,0 +1,126 @@
+"""Search index over members, accounts and transactions"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Account, Member, SearchDocument, Transaction
+
+# Created by migration 0010 on SQLite; PostgreSQL uses a pg_trgm GIN index on content instead
+FTS_TABLE = 'banking_system_searchdocument_fts'
+
+# The trigram tokenizer cannot match terms shorter than this
+TRIGRAM_LENGTH = 3
+
+INDEX_CHUNK_SIZE = 2000
+
+
+def _content(*parts):
+    return ' '.join(str(part) for part in parts if part).lower()
+
+
+def _store(kind, contents):
+    """Upsert {object_id: content} documents of one kind"""
+    if not contents:
+        return
+    now = timezone.now()
+    SearchDocument.objects.bulk_create(
+        [SearchDocument(kind=kind, object_id=pk, content=content, updated_at=now)
+         for pk, content in contents.items()],
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['content', 'updated_at'],
+    )
+
+
+def index_members(member_ids):
+    """Index member names, number, national ID, phone and email"""
+    rows = Member.objects.filter(pk__in=member_ids).values_list(
+        'pk', 'member_number', 'user__first_name', 'user__last_name', 'user__national_id',
+        'user__phone_number', 'user__email',
+    )
+    _store('member', {row[0]: _content(*row[1:]) for row in rows})
+
+
+def index_accounts(account_ids):
+    """Index account numbers together with their owner's name and identifiers"""
+    rows = Account.objects.filter(pk__in=account_ids).values_list(
+        'pk', 'account_number', 'member__member_number', 'member__user__first_name',
+        'member__user__last_name', 'member__user__national_id', 'member__user__phone_number',
+    )
+    _store('account', {row[0]: _content(*row[1:]) for row in rows})
+
+
+def index_transactions(transactions):
+    """Index transaction ids, references, account numbers and descriptions of saved Transactions"""
+    account_numbers = dict(
+        Account.objects.filter(pk__in={txn.account_id for txn in transactions})
+        .values_list('pk', 'account_number')
+    )
+    _store('transaction', {
+        txn.pk: _content(txn.transaction_id, txn.reference_number, account_numbers.get(txn.account_id),
+                         txn.description)
+        for txn in transactions
+    })
+
+
+def index_member_users(user_ids):
+    """Reindex the members and accounts behind the given users"""
+    member_ids = list(Member.objects.filter(user_id__in=user_ids).values_list('pk', flat=True))
+    if member_ids:
+        index_members(member_ids)
+        index_accounts(Account.objects.filter(member_id__in=member_ids).values_list('pk', flat=True))
+
+
+def remove(kind, object_ids):
+    SearchDocument.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+def rebuild(chunk_size=INDEX_CHUNK_SIZE):
+    """Reindex every member, account and transaction; returns documents written per kind"""
+    written = {}
+    for kind, queryset, index in (
+        ('member', Member.objects.only('pk'), lambda chunk: index_members([obj.pk for obj in chunk])),
+        ('account', Account.objects.only('pk'), lambda chunk: index_accounts([obj.pk for obj in chunk])),
+        ('transaction', Transaction.objects.only(
+            'pk', 'transaction_id', 'reference_number', 'account_id', 'description'
+        ), index_transactions),
+    ):
+        written[kind] = 0
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not chunk:
+                break
+            index(chunk)
+            written[kind] += len(chunk)
+            last_pk = chunk[-1].pk
+        # Drop documents of rows deleted while signals were not connected (raw SQL, other services)
+        SearchDocument.objects.filter(kind=kind).exclude(
+            object_id__in=queryset.model.objects.values('pk')
+        ).delete()
+    return written
+
+
+def matching_ids(kind, term):
+    """
+    Return a values('object_id') queryset of documents containing every word of term.
+
+    On SQLite words of at least TRIGRAM_LENGTH characters go through the FTS5
+    trigram table; elsewhere, or for shorter words, a substring match on the
+    lower-cased content is used, which pg_trgm serves from its GIN index.
+    """
+    words = term.lower().split()
+    documents = SearchDocument.objects.all()
+    phrases = ['"' + word.replace('"', '""') + '"' for word in words if len(word) >= TRIGRAM_LENGTH]
+    if connection.vendor == 'sqlite' and phrases:
+        # Matching on the FTS table first keeps the lookup on its index rather than every document of a kind
+        documents = documents.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind = %s', [' '.join(phrases), kind]
+        ))
+        words = [word for word in words if len(word) < TRIGRAM_LENGTH]
+    else:
+        documents = documents.filter(kind=kind)
+    for word in words:
+        documents = documents.filter(content__contains=word)
+    return documents.values('object_id')
@@ -0,0 +1,136 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import audit, metrics, rollups, search, snapshots
+from .models import Account, AccountType, Loan, LoanPayment, Member, Notification, Transaction, User
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    account_ids = [instance.account_id]
+    if instance.destination_account_id:
+        account_ids.append(instance.destination_account_id)
+    snapshots.invalidate_accounts(account_ids)
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, **kwargs):
+    search.index_transactions([instance])
+
+
+# Fields that place a transaction in its daily ledger rollup row
+ROLLUP_FIELDS = ('account_id', 'created_at', 'transaction_type', 'status', 'amount')
+
+
+@receiver(pre_save, sender=Transaction)
+def transaction_saving(sender, instance, raw=False, **kwargs):
+    # Edits (admin status changes among them) move the stored row out of its old rollup
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        instance._rollup_previous = Transaction.objects.filter(pk=instance.pk).only(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_rolled_up(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        if all(getattr(previous, field) == getattr(instance, field) for field in ROLLUP_FIELDS):
+            return
+        rollups.remove_transactions([previous])
+    rollups.record_transactions([instance])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_unrolled(sender, instance, **kwargs):
+    rollups.remove_transactions([instance])
+
+
+@receiver([post_save, post_delete], sender=Account)
+def account_changed(sender, instance, **kwargs):
+    # Saves outside the posting engine (opening balances, admin edits, type changes) resync the column
+    Member.objects.filter(pk=instance.member_id).refresh_savings_balance()
+    snapshots.invalidate_members([instance.member_id], 'accounts')
+
+
+@receiver(post_save, sender=AccountType)
+def account_type_changed(sender, instance, created, **kwargs):
+    if not created:
+        Member.objects.filter(
+            pk__in=Account.objects.filter(account_type=instance).values('member_id')
+        ).refresh_savings_balance()
+
+
+@receiver([post_save, post_delete], sender=Loan)
+def loan_changed(sender, instance, **kwargs):
+    snapshots.invalidate_members([instance.member_id], 'loans')
+
+
+@receiver([post_save, post_delete], sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    snapshots.invalidate_users([instance.recipient_id], 'notifications')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return  # Logins and password changes do not touch indexed fields
+    search.index_member_users([instance.pk])
+
+
+@receiver(post_save, sender=Member)
+def member_saved(sender, instance, **kwargs):
+    search.index_member_users([instance.user_id])
+
+
+@receiver(post_save, sender=Account)
+def account_saved(sender, instance, **kwargs):
+    search.index_accounts([instance.pk])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    search.remove('transaction', [instance.pk])
+
+
+@receiver(post_delete, sender=Account)
+def account_deleted(sender, instance, **kwargs):
+    search.remove('account', [instance.pk])
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, **kwargs):
+    search.remove('member', [instance.pk])
+
+
+@receiver(post_save, sender=LoanPayment)
+def loan_payment_saved(sender, instance, created, **kwargs):
+    if created:
+        metrics.LOAN_PAYMENTS.inc()
+
+
+@receiver(user_logged_in)
+def login_succeeded(sender, request, user, **kwargs):
+    metrics.LOGIN_ATTEMPTS.inc(result='success')
+    audit.record('login', 'User', user.pk, f"{user.username} logged in", user=user)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        audit.record('logout', 'User', user.pk, f"{user.username} logged out", user=user)
+
+
+@receiver(user_login_failed)
+def login_failed(sender, credentials, request=None, **kwargs):
+    metrics.LOGIN_ATTEMPTS.inc(result='failure')
+    audit.record('login_failed', 'User', '', f"Failed login for {credentials.get('username', '')}")
+
+
+@receiver(connection_created)
+def db_connection_opened(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS.inc(alias=connection.alias)
+    metrics.track_connection(connection)
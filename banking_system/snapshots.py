@@ -0,0 +1,176 @@
+"""Materialized member dashboard snapshots and their invalidation"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Account, Loan, Member, MemberDashboardSnapshot, Notification, Transaction
+
+RECENT_TRANSACTIONS = 5
+RECENT_NOTIFICATIONS = 5
+
+SECTIONS = ('accounts', 'loans', 'notifications')
+
+
+def invalidate_members(member_ids, *sections):
+    """Mark sections of the given members' snapshots for rebuild on their next dashboard view"""
+    MemberDashboardSnapshot.objects.filter(member_id__in=member_ids).update(
+        version=F('version') + 1,
+        **{f'{section}_stale': True for section in sections or SECTIONS},
+    )
+
+
+def invalidate_accounts(account_ids):
+    """Mark the accounts section stale for the owners of the given accounts"""
+    invalidate_members(
+        Account.objects.filter(pk__in=account_ids).values('member_id'), 'accounts'
+    )
+
+
+def invalidate_users(user_ids, *sections):
+    """Mark sections stale for the members behind the given users"""
+    invalidate_members(Member.objects.filter(user_id__in=user_ids).values('pk'), *sections)
+
+
+def get_member_snapshot(user):
+    """
+    Return the dashboard snapshot for a member user, rebuilding only stale sections.
+
+    In the steady state this is one indexed row lookup joined to the member.
+    Raises Member.DoesNotExist if the user has no member profile.
+    """
+    snapshot = (
+        MemberDashboardSnapshot.objects.select_related('member')
+        .filter(member__user=user).first()
+    )
+    if snapshot is None:
+        snapshot, _ = MemberDashboardSnapshot.objects.select_related('member').get_or_create(
+            member=Member.objects.get(user=user)
+        )
+
+    today = timezone.now().date()
+    if snapshot.loans_refreshed_on != today:
+        # Overdue figures depend on the date, not only on the loan rows
+        snapshot.loans_stale = True
+
+    update_fields = []
+    if snapshot.accounts_stale:
+        update_fields += _build_accounts(snapshot)
+    if snapshot.loans_stale:
+        update_fields += _build_loans(snapshot, today)
+    if snapshot.notifications_stale:
+        update_fields += _build_notifications(snapshot, user)
+    metrics.record_cache('dashboard_snapshot', not update_fields)
+    if update_fields:
+        # A concurrent invalidation bumps the version; its stale flags then survive for the next view
+        MemberDashboardSnapshot.objects.filter(pk=snapshot.pk, version=snapshot.version).update(
+            updated_at=timezone.now(), **{field: getattr(snapshot, field) for field in update_fields}
+        )
+    return snapshot
+
+
+def _build_accounts(snapshot):
+    accounts = list(
+        Account.objects.filter(member_id=snapshot.member_id, status='active')
+        .select_related('account_type').order_by('pk')
+    )
+    snapshot.accounts_summary = [
+        {
+            'account_number': account.account_number,
+            'type': account.account_type.name,
+            'balance': str(account.balance),
+        }
+        for account in accounts
+    ]
+    snapshot.total_savings = sum(
+        (account.balance for account in accounts if account.account_type.is_savings), Decimal('0')
+    )
+    transactions = (
+        Transaction.objects.filter(account__member_id=snapshot.member_id)
+        .order_by('-created_at')[:RECENT_TRANSACTIONS]
+    )
+    snapshot.recent_transactions = [
+        {
+            'created_at': txn.created_at.isoformat(),
+            'transaction_type': txn.transaction_type,
+            'transaction_type_display': txn.get_transaction_type_display(),
+            'amount': str(txn.amount),
+            'balance_after': str(txn.balance_after),
+        }
+        for txn in transactions
+    ]
+    snapshot.accounts_stale = False
+    return ['accounts_summary', 'total_savings', 'recent_transactions', 'accounts_stale']
+
+
+def _build_loans(snapshot, today):
+    loans = list(Loan.objects.filter(member_id=snapshot.member_id, status='active').order_by('pk'))
+    snapshot.active_loans = [
+        {
+            'loan_number': loan.loan_number,
+            'status': loan.status,
+            'status_display': loan.get_status_display(),
+            'balance': str(loan.balance),
+            'monthly_payment': str(loan.monthly_payment),
+            'next_payment_date': loan.next_payment_date.isoformat(),
+            'days_overdue': max((today - loan.next_payment_date).days, 0),
+        }
+        for loan in loans
+    ]
+    snapshot.loan_count = len(loans)
+    snapshot.loan_balance = sum((loan.balance for loan in loans), Decimal('0'))
+    snapshot.overdue_loans = sum(1 for loan in loans if loan.next_payment_date < today)
+    snapshot.loans_refreshed_on = today
+    snapshot.loans_stale = False
+    return ['active_loans', 'loan_count', 'loan_balance', 'overdue_loans', 'loans_refreshed_on', 'loans_stale']
+
+
+def _build_notifications(snapshot, user):
+    unread = Notification.objects.filter(recipient=user, is_read=False)
+    snapshot.unread_notifications = unread.count()
+    snapshot.notifications = [
+        {
+            'title': notification.title,
+            'message': notification.message[:200],
+            'notification_type_display': notification.get_notification_type_display(),
+            'created_at': notification.created_at.isoformat(),
+            'is_read': notification.is_read,
+        }
+        for notification in unread.order_by('-created_at')[:RECENT_NOTIFICATIONS]
+    ]
+    snapshot.notifications_stale = False
+    return ['notifications', 'unread_notifications', 'notifications_stale']
+
+
+def dashboard_context(snapshot):
+    """Turn a snapshot into the member dashboard template context"""
+    return {
+        'member': snapshot.member,
+        'accounts_summary': [
+            dict(item, balance=Decimal(item['balance'])) for item in snapshot.accounts_summary
+        ],
+        'recent_transactions': [
+            dict(item, created_at=datetime.fromisoformat(item['created_at']),
+                 amount=Decimal(item['amount']), balance_after=Decimal(item['balance_after']))
+            for item in snapshot.recent_transactions
+        ],
+        'active_loans': [
+            dict(item, balance=Decimal(item['balance']), monthly_payment=Decimal(item['monthly_payment']),
+                 next_payment_date=date.fromisoformat(item['next_payment_date']))
+            for item in snapshot.active_loans
+        ],
+        'notifications': [
+            dict(item, created_at=datetime.fromisoformat(item['created_at']))
+            for item in snapshot.notifications
+        ],
+        'unread_notifications': snapshot.unread_notifications,
+        'total_savings': snapshot.total_savings,
+        'total_shares': snapshot.member.total_shares,
+        'loan_summary': {
+            'total_loans': snapshot.loan_count,
+            'total_balance': snapshot.loan_balance,
+            'overdue_loans': snapshot.overdue_loans,
+        },
+    }
@@ -0,0 +1,274 @@
+"""Streaming account statements in CSV and PDF"""
+import csv
+import heapq
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import Account, Transaction, TransactionArchive
+
+STATEMENT_FORMATS = ('csv', 'pdf')
+
+STATEMENT_COLUMNS = ('Date', 'Type', 'Reference', 'Description', 'Debit', 'Credit', 'Balance')
+
+KEYSET_PAGE_SIZE = 1000
+
+
+def statement_period(start_date, end_date):
+    """Return aware datetimes bounding the inclusive date range [start_date, end_date]"""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def keyset(queryset, column, page_size, descending=False):
+    """
+    Yield rows of a values_list queryset whose first two values are column and id, in that order.
+
+    Each page continues after the (column, id) of the previous page's last
+    row, so every page is an index range scan and memory stays bounded by
+    page_size no matter how many rows match.
+    """
+    direction = 'lt' if descending else 'gt'
+    ordering = (f'-{column}', '-id') if descending else (column, 'id')
+    queryset = queryset.order_by(*ordering)
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(**{f'{column}__{direction}': last[0]}) | Q(**{column: last[0], f'id__{direction}': last[1]})
+            )
+        rows = list(page[:page_size])
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+
+
+def opening_balance(account, start):
+    """
+    Balance of an account at start.
+
+    Taken from the account's last own posting before start plus the
+    transfers it received after that posting. An account with no posting
+    before start, e.g. one opened with a balance, is backed out from its
+    current balance instead.
+    """
+    last = None
+    for model in (Transaction, TransactionArchive):
+        row = (
+            model.objects.filter(account_id=account.pk, status='completed', created_at__lt=start)
+            .order_by('-created_at', '-id').values_list('created_at', 'id', 'balance_after').first()
+        )
+        if row is not None and (last is None or row[:2] > last[:2]):
+            last = row
+
+    if last is None:
+        balance = Account.objects.values_list('balance', flat=True).get(pk=account.pk)
+        for model in (Transaction, TransactionArchive):
+            since = model.objects.filter(status='completed', created_at__gte=start)
+            movement = since.filter(account_id=account.pk).aggregate(
+                credits=Sum('amount', filter=Q(transaction_type__in=Transaction.CREDIT_TYPES)),
+                debits=Sum('amount', filter=Q(transaction_type__in=Transaction.DEBIT_TYPES)),
+            )
+            received = since.filter(destination_account_id=account.pk, transaction_type='transfer').aggregate(
+                total=Sum('amount'))['total']
+            balance += (movement['debits'] or 0) - (movement['credits'] or 0) - (received or 0)
+        return balance
+
+    received = Decimal('0.00')
+    for model in (Transaction, TransactionArchive):
+        transfers = model.objects.filter(
+            destination_account_id=account.pk, transaction_type='transfer', status='completed', created_at__lt=start
+        )
+        transfers = transfers.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1]))
+        received += transfers.aggregate(total=Sum('amount'))['total'] or 0
+    return last[2] + received
+
+
+def iter_statement_transactions(account, start_date, end_date, page_size=KEYSET_PAGE_SIZE):
+    """
+    Yield (created_at, id, transaction_type, reference_number, description, amount, balance, credit)
+    for the completed transactions of an account in (created_at, id) order.
+
+    The account's own postings and the transfers it received are read from
+    the live and archived tables with keyset pagination and merged, so a
+    statement spanning archived months reads the same as a recent one. A
+    received transfer's row carries the sender's balance, so the balance
+    after it is carried forward from the previous row instead.
+    """
+    start, end = statement_period(start_date, end_date)
+    columns = ('created_at', 'id', 'transaction_type', 'reference_number', 'description',
+               'amount', 'balance_after')
+
+    def stream(model, received, **filters):
+        rows = model.objects.filter(
+            status='completed', created_at__gte=start, created_at__lt=end, **filters
+        ).values_list(*columns)
+        return ((*row, received) for row in keyset(rows, 'created_at', page_size))
+
+    rows = heapq.merge(
+        stream(Transaction, False, account_id=account.pk),
+        stream(TransactionArchive, False, account_id=account.pk),
+        stream(Transaction, True, destination_account_id=account.pk, transaction_type='transfer'),
+        stream(TransactionArchive, True, destination_account_id=account.pk, transaction_type='transfer'),
+        key=lambda row: (row[0], row[1]),
+    )
+    balance = None
+    for created_at, pk, transaction_type, reference, description, amount, balance_after, received in rows:
+        if received:
+            if balance is None:
+                balance = opening_balance(account, start)
+            balance += amount
+            credit = True
+        else:
+            balance = balance_after
+            credit = transaction_type not in Transaction.DEBIT_TYPES
+        yield created_at, pk, transaction_type, reference, description, amount, balance, credit
+
+
+def statement_rows(account, start_date, end_date):
+    """Yield formatted statement rows matching STATEMENT_COLUMNS"""
+    labels = dict(Transaction.TRANSACTION_TYPES)
+    for created_at, _, transaction_type, reference, description, amount, balance, credit in \
+            iter_statement_transactions(account, start_date, end_date):
+        yield (
+            timezone.localtime(created_at).strftime('%Y-%m-%d %H:%M'),
+            labels.get(transaction_type, transaction_type),
+            reference,
+            ' '.join(description.split()),
+            '' if credit else f'{amount:.2f}',
+            f'{amount:.2f}' if credit else '',
+            f'{balance:.2f}',
+        )
+
+
+class _Echo:
+    """File-like object whose write() hands the value back to the csv writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_statement(account, start_date, end_date):
+    """Yield a CSV statement line by line"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['Account', account.account_number])
+    yield writer.writerow(['Period', start_date.isoformat(), end_date.isoformat()])
+    yield writer.writerow(STATEMENT_COLUMNS)
+    for row in statement_rows(account, start_date, end_date):
+        yield writer.writerow(row)
+
+
+def pdf_statement(account, start_date, end_date):
+    """Yield a PDF statement page by page"""
+    pdf = StreamingPDF(title=f"Statement {account.account_number}")
+    header = [
+        f"Account statement - {account.account_number}",
+        f"Period: {start_date.isoformat()} to {end_date.isoformat()}",
+        '',
+        _pdf_line(STATEMENT_COLUMNS),
+    ]
+    yield pdf.begin()
+
+    lines = header
+    for row in statement_rows(account, start_date, end_date):
+        if len(lines) == StreamingPDF.LINES_PER_PAGE:
+            yield pdf.page(lines)
+            lines = [_pdf_line(STATEMENT_COLUMNS)]
+        lines.append(_pdf_line(row))
+    yield pdf.page(lines)
+    yield pdf.end()
+
+
+def _pdf_line(row):
+    date, kind, reference, description, debit, credit, balance = row
+    return (f"{date[:16]:<17}{kind[:18]:<19}{reference[:14]:<15}{description[:26]:<27}"
+            f"{debit:>13}{credit:>13}{balance:>15}")
+
+
+class StreamingPDF:
+    """
+    Minimal PDF writer that emits each page as soon as it is complete.
+
+    Only byte offsets and page object numbers are kept until the trailer is
+    written, so memory does not grow with the text of earlier pages.
+    """
+    LINES_PER_PAGE = 70
+    FONT_SIZE = 7
+    LEADING = 11
+
+    CATALOG, PAGES, FONT, INFO = 1, 2, 3, 4
+
+    def __init__(self, title=''):
+        self.title = title
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5
+
+    def begin(self):
+        out = self._emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        out += self._object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode())
+        out += self._object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>')
+        out += self._object(self.INFO, b'<< /Title (' + _pdf_escape(self.title) + b') >>')
+        return out
+
+    def page(self, lines):
+        content = [f'BT /F1 {self.FONT_SIZE} Tf {self.LEADING} TL 28 812 Td'.encode()]
+        for line in lines:
+            content.append(b'(' + _pdf_escape(line) + b") '")
+        content.append(b'ET')
+        stream = b'\n'.join(content)
+
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        out = self._object(
+            content_id,
+            f'<< /Length {len(stream)} >>\nstream\n'.encode() + stream + b'\nendstream',
+        )
+        out += self._object(page_id, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 {self.FONT} 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode())
+        return out
+
+    def end(self):
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        out = self._object(
+            self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>'.encode()
+        )
+        xref_position = self.position
+        xref = [f'xref\n0 {self.next_id}\n', '0000000000 65535 f \n']
+        for object_id in range(1, self.next_id):
+            xref.append(f'{self.offsets[object_id]:010d} 00000 n \n')
+        out += self._emit(''.join(xref).encode())
+        out += self._emit((
+            f'trailer\n<< /Size {self.next_id} /Root {self.CATALOG} 0 R /Info {self.INFO} 0 R >>\n'
+            f'startxref\n{xref_position}\n%%EOF\n'
+        ).encode())
+        return out
+
+    def _object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        return self._emit(f'{object_id} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    def _emit(self, data):
+        self.position += len(data)
+        return data
+
+
+def _pdf_escape(text):
+    return text.encode('latin-1', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def render_statement(account, start_date, end_date, statement_format):
+    """Return the chunk iterator for the requested statement format"""
+    if statement_format == 'pdf':
+        return pdf_statement(account, start_date, end_date)
+    return csv_statement(account, start_date, end_date)
@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction as db_transaction
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admin_counts, audit, metrics, middleware, numbering, snapshots
+from .admin_counts import ESTIMATE_THRESHOLD, EXACT_COUNT_VAR, EstimatedCountPaginator
+from .arrears import classify_arrears, portfolio_at_risk_report
+from .models import (
+    User, Branch, Member, AccountType, Account, Transaction, LoanProduct,
+    LoanApplication, Loan, LoanPayment, SharePrice, ShareTransaction, FixedDeposit,
+    Dividend, DividendPayment, Committee, CommitteeMember, Meeting, Notification, AuditLog, NumberSequence,
+    AuditLogArchive, DailyLedgerRollup, MemberDashboardSnapshot, SearchDocument,
+)
+from .dividends import dividend_totals, run_dividend
+from .dormancy import mark_dormant
+from .fees import charge_fees, fee_totals
+from .fixed_deposits import add_months, process_maturities
+from .interest import month_bounds, run_accrual
+from .loan_schedule import compute_schedules
+from .posting import InsufficientFunds, Posting, post_batch, post_transaction
+from .rollups import ledger_summary
+from .search import matching_ids
+from .snapshots import get_member_snapshot, invalidate_members
+from .statements import statement_rows
+
+# Transactions seeded for the plan checks; raise it to rehearse against production-sized tables
+EXPLAIN_SEED_ROWS = int(os.environ.get('EXPLAIN_SEED_ROWS', 2000))
+
+HOT_TABLES = {
+    model._meta.db_table
+    for model in (Member, Account, Transaction, Loan, Notification)
+}
+
+
+def seed_bank(transactions):
+    """Create a small bank with the given number of transactions spread over its accounts"""
+    staff = User.objects.create_user('staff', password='x', national_id='S-1', is_staff_member=True)
+    Branch.objects.create(name='Main', code='BR0001', address='-', phone_number='0')
+    AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+    LoanProduct.objects.create(
+        name='Personal', code='LN001', description='-', interest_rate=Decimal('12.00'),
+        minimum_amount=1000, maximum_amount=100000, minimum_period_months=1, maximum_period_months=24,
+    )
+    members = seed_members(transactions)
+    return staff, members[1]
+
+
+def seed_members(transactions, start=0):
+    """Add a member with an account, a loan and a notification per 20 transactions, numbered from start"""
+    branch = Branch.objects.get(code='BR0001')
+    savings = AccountType.objects.get(code='SAV001')
+    product = LoanProduct.objects.get(code='LN001')
+    members_count = max(transactions // 20, 2)
+    numbers = range(start, start + members_count)
+    users = User.objects.bulk_create([
+        User(username=f'member{i}', national_id=f'N-{i}', is_member=True) for i in numbers
+    ])
+    today = timezone.now().date()
+    members = Member.objects.bulk_create([
+        Member(user=user, member_number=f'M{i:07d}', branch=branch, membership_date=today,
+               status='active' if i % 5 else 'pending')
+        for i, user in zip(numbers, users)
+    ])
+    accounts = Account.objects.bulk_create([
+        Account(account_number=f'{i:010d}', member=member, account_type=savings, balance=Decimal('1000.00'))
+        for i, member in zip(numbers, members)
+    ])
+    Transaction.objects.bulk_create([
+        Transaction(
+            account=accounts[i % len(accounts)], transaction_type='deposit', amount=Decimal('10.00'),
+            balance_before=0, balance_after=Decimal('10.00'), description='seed', status='completed',
+        )
+        for i in range(transactions)
+    ])
+    applications = LoanApplication.objects.bulk_create([
+        LoanApplication(application_number=f'APP{i:07d}', member=member, loan_product=product,
+                        amount_requested=5000, period_months=12, purpose='-', status='disbursed')
+        for i, member in zip(numbers, members)
+    ])
+    Loan.objects.bulk_create([
+        Loan(loan_number=f'LN{i:07d}', application=application, member=application.member,
+             loan_product=product, principal_amount=5000, interest_rate=Decimal('12.00'), period_months=12,
+             monthly_payment=Decimal('466.67'), total_payable=5600, balance=5600,
+             status='active' if i % 3 else 'completed', disbursement_date=today,
+             maturity_date=today + timedelta(days=360), next_payment_date=today - timedelta(days=i % 40))
+        for i, application in zip(numbers, applications)
+    ])
+    Notification.objects.bulk_create([
+        Notification(recipient=member.user, title='Hello', message='-', notification_type='system_alert',
+                     is_read=bool(i % 2))
+        for i, member in zip(numbers, members)
+    ])
+    return members
+
+
+class DashboardQueryPlanTests(TestCase):
+    """Every query behind both dashboard branches must be served by an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff, cls.member = seed_bank(EXPLAIN_SEED_ROWS)
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Make sequential scans a last resort so small test tables still show index usage
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}')
+                return [row[0] for row in cursor.fetchall()
+                        if 'Seq Scan' in row[0] and any(table in row[0] for table in HOT_TABLES)]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()
+                    if row[-1].startswith('SCAN ') and row[-1].split()[1] in HOT_TABLES]
+
+    def assert_indexed(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+
+        for query in queries.captured_queries:
+            if query['sql'].lstrip().upper().startswith('SELECT'):
+                self.assertEqual(self.full_scans(query['sql']), [], query['sql'])
+
+    def test_member_dashboard_queries_use_indexes(self):
+        self.assert_indexed(self.member.user)
+
+    def test_staff_dashboard_queries_use_indexes(self):
+        self.assert_indexed(self.staff)
+
+
+# Upper bound for one changelist page: session, user, count(s), rows and filter choices
+CHANGELIST_QUERY_LIMIT = 12
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Changelist pages must not issue a query per row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff, _ = seed_bank(40)
+        cls.staff.is_staff = cls.staff.is_superuser = True
+        cls.staff.save()
+
+        today = timezone.now().date()
+        cls.dividend = Dividend.objects.create(
+            year=today.year, rate_percentage=Decimal('5.00'), total_amount=Decimal('1000.00'),
+            declaration_date=today, payment_date=today,
+        )
+        cls.committee = Committee.objects.create(name='Credit', description='-')
+        cls.add_related_rows(Member.objects.all())
+
+    @classmethod
+    def add_related_rows(cls, members):
+        """Give each member a row in every other admin-registered table"""
+        today = timezone.now().date()
+        members = list(members)
+        loans = list(Loan.objects.filter(member__in=members))
+        accounts = list(Account.objects.filter(member__in=members))
+        first_day = SharePrice.objects.count()
+        SharePrice.objects.bulk_create([
+            SharePrice(price_per_share=Decimal('20.00'), effective_date=today - timedelta(days=first_day + i),
+                       set_by=cls.staff)
+            for i in range(len(members))
+        ])
+        LoanPayment.objects.bulk_create([
+            LoanPayment(loan=loan, amount=100, principal_amount=90, interest_amount=10, balance_before=5600,
+                        balance_after=5500, payment_date=today, processed_by=cls.staff)
+            for loan in loans
+        ])
+        ShareTransaction.objects.bulk_create([
+            ShareTransaction(member=member, transaction_type='purchase', number_of_shares=1, price_per_share=20,
+                             total_amount=20, transaction_date=today)
+            for member in members
+        ])
+        FixedDeposit.objects.bulk_create([
+            FixedDeposit(account=account, principal_amount=1000, interest_rate=Decimal('8.00'), term_months=12,
+                         maturity_amount=1080, start_date=today, maturity_date=today + timedelta(days=365))
+            for account in accounts
+        ])
+        DividendPayment.objects.bulk_create([
+            DividendPayment(dividend=cls.dividend, member=member, shares_held=1, amount=1, payment_date=today)
+            for member in members
+        ])
+        CommitteeMember.objects.bulk_create([
+            CommitteeMember(committee=cls.committee, member=member, position='member', start_date=today)
+            for member in members
+        ])
+        Meeting.objects.bulk_create([
+            Meeting(title='AGM', meeting_type='agm', committee=cls.committee, date=timezone.now(), venue='-',
+                    agenda='-', created_by=cls.staff)
+            for _ in members
+        ])
+        AuditLog.objects.bulk_create([
+            AuditLog(user=member.user, action_type='login', model_name='User', object_id=str(member.pk),
+                     description='-')
+            for member in members
+        ])
+
+    def changelist_queries(self):
+        """Render every changelist and return its query count per model"""
+        # Cached counts and filter choices would hide queries on the second render
+        cache.clear()
+        counts = {}
+        for model in admin.site._registry:
+            if model._meta.app_label != 'banking_system':
+                continue
+            url = reverse(f'admin:banking_system_{model._meta.model_name}_changelist')
+            with self.subTest(model=model.__name__), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(queries), CHANGELIST_QUERY_LIMIT, '\n'.join(
+                    query['sql'] for query in queries.captured_queries
+                ))
+            counts[model.__name__] = len(queries)
+        return counts
+
+    def test_changelists_use_constant_queries(self):
+        self.client.force_login(self.staff)
+        small = self.changelist_queries()
+        # From a couple of rows per table to more than a page of each
+        self.add_related_rows(seed_members(2000, start=2))
+        self.assertEqual(self.changelist_queries(), small)
+
+
+_serial = count(1)
+
+
+def open_account(account_type, balance='0.00', status='active', member=None):
+    """Create an account (and a member to own it unless one is given) with the given balance"""
+    serial = next(_serial)
+    if member is None:
+        branch = Branch.objects.get_or_create(code='BR0001', defaults={'name': 'Main', 'address': '-',
+                                                                      'phone_number': '0'})[0]
+        user = User.objects.create(username=f'holder{serial}', national_id=f'H-{serial}', is_member=True)
+        member = Member.objects.create(user=user, member_number=f'H{serial:07d}', branch=branch,
+                                       membership_date=timezone.localdate() - timedelta(days=800),
+                                       status='active')
+    return Account.objects.create(account_number=f'AC{serial:08d}', member=member, account_type=account_type,
+                                  balance=Decimal(balance), available_balance=Decimal(balance), status=status)
+
+
+def previous_month():
+    """(year, month) of the last closed month"""
+    last_day = timezone.localdate().replace(day=1) - timedelta(days=1)
+    return last_day.year, last_day.month
+
+
+class PostingEngineTests(TestCase):
+    """Balances, transaction rows and rejections of post_transaction and post_batch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+
+    def test_post_transaction_moves_balance_and_records_transaction(self):
+        account = open_account(self.savings, '100.00')
+        txn = post_transaction(account, 'withdrawal', Decimal('40.00'))
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal('60.00'))
+        self.assertEqual((txn.balance_before, txn.balance_after, txn.status),
+                         (Decimal('100.00'), Decimal('60.00'), 'completed'))
+        self.assertEqual(Member.objects.get(pk=account.member_id).savings_balance, Decimal('60.00'))
+
+    def test_insufficient_funds_leaves_nothing_behind(self):
+        account = open_account(self.savings, '10.00')
+        with self.assertRaises(InsufficientFunds):
+            post_transaction(account, 'withdrawal', Decimal('40.00'))
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal('10.00'))
+        self.assertFalse(Transaction.objects.filter(account=account).exists())
+
+    def test_batch_keeps_running_balances_per_account(self):
+        source = open_account(self.savings, '100.00')
+        target = open_account(self.savings)
+        result = post_batch([
+            Posting(source.pk, 'deposit', Decimal('50.00')),
+            Posting(source.pk, 'transfer', Decimal('120.00'), destination_account_id=target.pk),
+            Posting(source.pk, 'withdrawal', Decimal('31.00')),
+        ])
+        self.assertEqual(result, (2, 1))
+        source.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((source.balance, target.balance), (Decimal('30.00'), Decimal('120.00')))
+        rows = list(Transaction.objects.filter(account=source).order_by('pk')
+                    .values_list('status', 'balance_before', 'balance_after'))
+        self.assertEqual(rows, [
+            ('completed', Decimal('100.00'), Decimal('150.00')),
+            ('completed', Decimal('150.00'), Decimal('30.00')),
+            ('failed', Decimal('30.00'), Decimal('30.00')),
+        ])
+
+    def test_batch_records_invalid_postings_as_failed_without_stopping(self):
+        account = open_account(self.savings, '100.00')
+        frozen = open_account(self.savings, '100.00', status='frozen')
+        result = post_batch([
+            Posting(account.pk, 'deposit', Decimal('10.00')),
+            Posting(account.pk, 'deposit', Decimal('0.00')),
+            Posting(account.pk, 'refund', Decimal('5.00')),
+            Posting(frozen.pk, 'deposit', Decimal('5.00')),
+            Posting(0, 'deposit', Decimal('5.00')),
+            Posting(account.pk, 'deposit', Decimal('10.00')),
+        ], chunk_size=2)
+        self.assertEqual(result, (2, 4))
+        account.refresh_from_db()
+        frozen.refresh_from_db()
+        self.assertEqual((account.balance, frozen.balance), (Decimal('120.00'), Decimal('100.00')))
+        self.assertEqual(Transaction.objects.filter(status='failed').count(), 3)
+
+
+class MemberDashboardSnapshotTests(TestCase):
+    """Invalidation and rebuilds of the materialized member dashboard"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_bank(100)
+        # Active, with an active overdue loan and an unread notification
+        cls.member = Member.objects.get(member_number='M0000002')
+        cls.user = cls.member.user
+        Account.objects.filter(member=cls.member).update(available_balance=F('balance'))
+        cls.account = Account.objects.get(member=cls.member)
+
+    def fresh_snapshot(self):
+        snapshot = get_member_snapshot(self.user)
+        snapshot.refresh_from_db()
+        self.assertFalse(snapshot.accounts_stale or snapshot.loans_stale or snapshot.notifications_stale)
+        return snapshot
+
+    def assert_rebuilt(self, snapshot, section):
+        stale = MemberDashboardSnapshot.objects.get(pk=snapshot.pk)
+        self.assertGreater(stale.version, snapshot.version)
+        self.assertTrue(getattr(stale, f'{section}_stale'))
+        rebuilt = get_member_snapshot(self.user)
+        self.assertFalse(MemberDashboardSnapshot.objects.filter(pk=snapshot.pk, **{f'{section}_stale': True}).exists())
+        return rebuilt
+
+    def test_posting_invalidates_the_accounts_section(self):
+        snapshot = self.fresh_snapshot()
+        post_transaction(self.account, 'deposit', Decimal('25.00'))
+        rebuilt = self.assert_rebuilt(snapshot, 'accounts')
+        self.assertEqual(rebuilt.total_savings, Decimal('1025.00'))
+        self.assertEqual(rebuilt.recent_transactions[0]['amount'], '25.00')
+
+    def test_reading_notifications_invalidates_the_notifications_section(self):
+        snapshot = self.fresh_snapshot()
+        self.assertEqual(snapshot.unread_notifications, 1)
+        admin.site._registry[Notification].mark_as_read(None, Notification.objects.filter(recipient=self.user))
+        rebuilt = self.assert_rebuilt(snapshot, 'notifications')
+        self.assertEqual((rebuilt.unread_notifications, rebuilt.notifications), (0, []))
+
+    def test_account_status_change_invalidates_the_accounts_section(self):
+        snapshot = self.fresh_snapshot()
+        self.assertEqual(len(snapshot.accounts_summary), 1)
+        self.account.status = 'frozen'
+        self.account.save()
+        rebuilt = self.assert_rebuilt(snapshot, 'accounts')
+        self.assertEqual((rebuilt.accounts_summary, rebuilt.total_savings), ([], Decimal('0')))
+
+    def test_rebuild_racing_an_invalidation_is_not_saved(self):
+        snapshot = self.fresh_snapshot()
+        invalidate_members([self.member.pk], 'accounts')
+        build_accounts = snapshots._build_accounts
+
+        def build_then_post(snapshot):
+            fields = build_accounts(snapshot)
+            # A posting committed between the rebuild's reads and its write
+            post_transaction(self.account, 'deposit', Decimal('25.00'))
+            return fields
+
+        with mock.patch.object(snapshots, '_build_accounts', build_then_post):
+            get_member_snapshot(self.user)
+        stored = MemberDashboardSnapshot.objects.get(pk=snapshot.pk)
+        self.assertTrue(stored.accounts_stale)
+        self.assertEqual(stored.total_savings, Decimal('1000.00'))
+        self.assertEqual(get_member_snapshot(self.user).total_savings, Decimal('1025.00'))
+
+    def test_dashboard_context_matches_the_live_queries(self):
+        post_transaction(self.account, 'withdrawal', Decimal('40.00'))
+        self.client.force_login(self.user)
+        self.client.get('/dashboard/')
+        post_transaction(self.account, 'deposit', Decimal('15.00'))
+        context = self.client.get('/dashboard/').context
+
+        today = timezone.localdate()
+        accounts = Account.objects.filter(member=self.member, status='active')
+        loans = Loan.objects.filter(member=self.member, status='active')
+        unread = Notification.objects.filter(recipient=self.user, is_read=False)
+        transactions = Transaction.objects.filter(account__member=self.member).order_by('-created_at')[:5]
+        self.assertEqual([(item['account_number'], item['balance']) for item in context['accounts_summary']],
+                         [(account.account_number, account.balance) for account in accounts])
+        self.assertEqual(context['total_savings'], sum(account.balance for account in accounts))
+        self.assertEqual([(item['amount'], item['balance_after']) for item in context['recent_transactions']],
+                         [(txn.amount, txn.balance_after) for txn in transactions])
+        self.assertEqual([item['loan_number'] for item in context['active_loans']],
+                         [loan.loan_number for loan in loans])
+        self.assertEqual(context['loan_summary'], {
+            'total_loans': loans.count(),
+            'total_balance': sum(loan.balance for loan in loans),
+            'overdue_loans': loans.filter(next_payment_date__lt=today).count(),
+        })
+        self.assertEqual(context['unread_notifications'], unread.count())
+        self.assertEqual(len(context['notifications']), unread.count())
+
+
+class LedgerRollupTests(TestCase):
+    """Daily ledger rollups agree with the transactions they summarize however those are written"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+
+    def rollup_totals(self):
+        rows = (
+            DailyLedgerRollup.objects.values('date', 'branch_id', 'transaction_type', 'status')
+            .annotate(count=Sum('count'), total=Sum('total_amount'))
+        )
+        return {
+            (row['date'], row['branch_id'], row['transaction_type'], row['status']): (row['count'], row['total'])
+            for row in rows if row['count']
+        }
+
+    def transaction_totals(self):
+        totals = {}
+        for txn in Transaction.objects.select_related('account__member'):
+            key = (timezone.localdate(txn.created_at), txn.account.member.branch_id, txn.transaction_type,
+                   txn.status)
+            count, total = totals.get(key, (0, Decimal('0')))
+            totals[key] = (count + 1, total + txn.amount)
+        return totals
+
+    def test_rollups_follow_postings_direct_writes_edits_and_deletes(self):
+        source = open_account(self.savings, '500.00')
+        target = open_account(self.savings)
+        post_transaction(source, 'deposit', Decimal('50.00'))
+        post_batch([
+            Posting(source.pk, 'transfer', Decimal('120.00'), destination_account_id=target.pk),
+            Posting(target.pk, 'withdrawal', Decimal('500.00')),
+        ])
+        # Written the way the admin and generate_loan_payments do, outside the posting engine
+        direct = Transaction.objects.create(
+            account=target, transaction_type='loan_repayment', amount=Decimal('30.00'), balance_before=0,
+            balance_after=0, description='-', status='pending',
+        )
+        self.assertEqual(self.rollup_totals(), self.transaction_totals())
+
+        direct.status = 'completed'
+        direct.save()
+        self.assertEqual(self.rollup_totals(), self.transaction_totals())
+        Transaction.objects.get(transaction_type='deposit').delete()
+        self.assertEqual(self.rollup_totals(), self.transaction_totals())
+
+        DailyLedgerRollup.objects.all().delete()
+        call_command('backfill_ledger_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_totals(), self.transaction_totals())
+        self.assertEqual(ledger_summary(timezone.localdate(), timezone.localdate())['loan_repayment'],
+                         {'count': 1, 'total': Decimal('30.00')})
+
+
+class LoanScheduleTests(SimpleTestCase):
+    """Installment tables of the three interest methods"""
+
+    def test_principal_lines_add_up_to_the_principal(self):
+        schedules = compute_schedules(
+            [Decimal('10000.01')] * 3, [Decimal('13.75')] * 3, [7, 11, 13],
+            ['reducing_balance', 'flat_rate', 'declining'], [date(2024, 1, 15)] * 3,
+        )
+        self.assertEqual(schedules.principal.sum(axis=1).tolist(), [1000001] * 3)
+        self.assertEqual(schedules.balance[[0, 1, 2], [6, 10, 12]].tolist(), [0, 0, 0])
+        self.assertEqual(schedules.mask.sum(axis=1).tolist(), [7, 11, 13])
+        # Reducing balance pays equal installments; declining balance charges interest on the opening balance
+        self.assertLessEqual(abs(schedules.installment[0, :7] - schedules.installment[0, 0]).max(), 1)
+        self.assertEqual(schedules.interest[2, 0], round(1000001 * 0.1375 / 12))
+
+    def test_flat_interest_is_principal_times_rate_times_term(self):
+        principal, rate, months = Decimal('12345.67'), Decimal('12.50'), 7
+        schedules = compute_schedules([principal], [rate], [months], ['flat_rate'], [date(2024, 1, 15)])
+        expected = (principal * rate / 1200 * months).quantize(Decimal('0.01'))
+        self.assertEqual(Decimal(int(schedules.interest[0].sum())).scaleb(-2), expected)
+
+    def test_due_dates_clamp_to_the_end_of_shorter_months(self):
+        schedules = compute_schedules([Decimal('300.00')], [Decimal('10.00')], [4], ['declining'],
+                                      [date(2024, 1, 31)])
+        self.assertEqual([value.item() for value in schedules.due_dates[0]],
+                         [date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)])
+
+    def test_periods_under_one_month_are_rejected(self):
+        with self.assertRaises(ValueError):
+            compute_schedules([Decimal('100.00')] * 2, [Decimal('10.00')] * 2, [12, 0],
+                              ['flat_rate', 'reducing_balance'], [date(2024, 1, 1)] * 2)
+
+
+class ArrearsClassificationTests(TestCase):
+    """PAR buckets stored on loans and the cached portfolio-at-risk report"""
+
+    @classmethod
+    def setUpTestData(cls):
+        savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+        cls.member = open_account(savings).member
+        cls.product = LoanProduct.objects.create(
+            name='Personal', code='LN001', description='-', interest_rate=Decimal('12.00'),
+            minimum_amount=1000, maximum_amount=100000, minimum_period_months=1, maximum_period_months=24,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def open_loan(self, days_overdue, balance='1000.00', status='active'):
+        serial = next(_serial)
+        today = timezone.localdate()
+        application = LoanApplication.objects.create(
+            application_number=f'APP{serial:07d}', member=self.member, loan_product=self.product,
+            amount_requested=1000, period_months=12, purpose='-', status='disbursed',
+        )
+        return Loan.objects.create(
+            loan_number=f'LN{serial:07d}', application=application, member=self.member,
+            loan_product=self.product, principal_amount=1000, interest_rate=Decimal('12.00'), period_months=12,
+            monthly_payment=Decimal('88.85'), total_payable=Decimal('1066.19'), balance=Decimal(balance),
+            status=status, disbursement_date=today - timedelta(days=400), maturity_date=today,
+            next_payment_date=today - timedelta(days=days_overdue),
+        )
+
+    def test_loans_are_bucketed_by_days_overdue(self):
+        loans = [self.open_loan(days) for days in (0, 1, 30, 31, 60, 61, 90, 91, -5)]
+        repaid = self.open_loan(200, status='completed')
+        Loan.objects.filter(pk=repaid.pk).update(arrears_days=200, par_bucket='90_plus')
+
+        report = classify_arrears(timezone.localdate())
+        stored = dict(Loan.objects.values_list('pk', 'par_bucket'))
+        days = dict(Loan.objects.values_list('pk', 'arrears_days'))
+        self.assertEqual([stored[loan.pk] for loan in loans], [
+            'current', '1_30', '1_30', '31_60', '31_60', '61_90', '61_90', '90_plus', 'current',
+        ])
+        self.assertEqual([days[loan.pk] for loan in loans], [0, 1, 30, 31, 60, 61, 90, 91, 0])
+        self.assertEqual((stored[repaid.pk], days[repaid.pk]), ('current', 0))
+        self.assertEqual({bucket['code']: bucket['loans'] for bucket in report['buckets']},
+                         {'current': 2, '1_30': 2, '31_60': 2, '61_90': 2, '90_plus': 1})
+        self.assertEqual(report['par_30'], Decimal('5000.00') / Decimal('9000.00') * 100)
+
+    def test_cached_report_is_replaced_by_a_new_run(self):
+        loan = self.open_loan(45)
+        classify_arrears(timezone.localdate())
+        self.assertEqual(portfolio_at_risk_report()['par_30'], 100)
+
+        # Repaid since the run: the cached report stands until the next classification
+        Loan.objects.filter(pk=loan.pk).update(next_payment_date=timezone.localdate() + timedelta(days=10))
+        self.assertEqual(portfolio_at_risk_report()['par_30'], 100)
+        classify_arrears(timezone.localdate())
+        self.assertEqual(portfolio_at_risk_report()['par_30'], 0)
+
+
+class AdminCountTests(TestCase):
+    """Estimated, cached and exact changelist counts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='admin', national_id='S-1', is_staff=True, is_superuser=True)
+        savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+        cls.account = open_account(savings, '100.00')
+        for _ in range(3):
+            post_transaction(cls.account, 'deposit', Decimal('1.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def paginator(self, exact=False):
+        paginator = EstimatedCountPaginator(Transaction.objects.order_by('pk'), 10)
+        paginator.exact = exact
+        return paginator
+
+    def test_exact_count_without_planner_statistics_or_when_asked(self):
+        self.assertEqual(self.paginator().count, 3)
+        with mock.patch.object(admin_counts, 'planner_estimate', return_value=ESTIMATE_THRESHOLD * 2):
+            self.assertEqual(self.paginator().count, ESTIMATE_THRESHOLD * 2)
+            self.assertEqual(self.paginator(exact=True).count, 3)
+        with mock.patch.object(admin_counts, 'planner_estimate', return_value=ESTIMATE_THRESHOLD - 1):
+            self.assertEqual(self.paginator().count, 3)
+
+    def test_cached_count_is_reused_until_refreshed(self):
+        self.assertEqual(self.paginator().count, 3)
+        post_transaction(self.account, 'deposit', Decimal('1.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.paginator().count, 3)
+        self.assertEqual(self.paginator(exact=True).count, 4)
+        self.assertEqual(self.paginator().count, 4)
+
+    def test_changelist_counts_and_facets_are_cached_unless_exact(self):
+        self.client.force_login(self.staff)
+        url = reverse('admin:banking_system_transaction_changelist')
+
+        def counting_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            sql = [query['sql'] for query in queries.captured_queries]
+            return response.context['cl'].result_count, sum('COUNT(' in statement for statement in sql)
+
+        result_count, counted = counting_queries({'_facets': '1'})
+        self.assertEqual(result_count, 3)
+        self.assertGreater(counted, 0)
+        post_transaction(self.account, 'deposit', Decimal('1.00'))
+        self.assertEqual(counting_queries({'_facets': '1'}), (3, 0))
+        self.assertEqual(counting_queries({'_facets': '1', EXACT_COUNT_VAR: '1'}), (4, counted))
+        self.assertEqual(counting_queries({'_facets': '1'}), (4, 0))
+
+
+class SearchIndexTests(TestCase):
+    """Search documents follow saves and deletes of members, accounts and transactions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+
+    def found(self, kind, term):
+        return {row['object_id'] for row in matching_ids(kind, term)}
+
+    def test_members_are_found_by_name(self):
+        member = open_account(self.savings).member
+        user = member.user
+        user.first_name, user.last_name = 'Wanjiku', 'Otieno'
+        user.save()
+        self.assertEqual(self.found('member', 'wanjiku OTIENO'), {member.pk})
+
+        user.first_name = 'Akinyi'
+        user.save()
+        self.assertEqual(self.found('member', 'wanjiku'), set())
+        self.assertEqual(self.found('member', 'akinyi otieno'), {member.pk})
+        member.delete()
+        self.assertEqual(self.found('member', 'akinyi'), set())
+
+    def test_accounts_are_found_by_number(self):
+        account = open_account(self.savings)
+        other = open_account(self.savings)
+        self.assertEqual(self.found('account', account.account_number), {account.pk})
+
+        old_number, account.account_number = account.account_number, 'ZX99887766'
+        account.save()
+        self.assertEqual(self.found('account', old_number), set())
+        self.assertEqual(self.found('account', '9988'), {account.pk})
+        account.delete()
+        self.assertEqual(self.found('account', 'zx99'), set())
+        self.assertEqual(self.found('account', other.account_number), {other.pk})
+
+    def test_transactions_are_found_by_reference(self):
+        account = open_account(self.savings)
+        txn = post_transaction(account, 'deposit', Decimal('10.00'), reference_number='REF-7781XZ')
+        post_transaction(account, 'deposit', Decimal('10.00'), reference_number='REF-1200')
+        self.assertEqual(self.found('transaction', 'ref-7781'), {txn.pk})
+        # Words shorter than a trigram fall back to a substring match; no hex transaction id contains xz
+        self.assertEqual(self.found('transaction', 'ref xz'), {txn.pk})
+
+        txn.reference_number = 'REF-5150'
+        txn.save()
+        self.assertEqual(self.found('transaction', 'ref-7781'), set())
+        self.assertEqual(self.found('transaction', 'ref-5150'), {txn.pk})
+        txn.delete()
+        self.assertEqual(self.found('transaction', 'ref-5150'), set())
+
+    def test_rebuild_indexes_rows_written_before_the_index(self):
+        account = open_account(self.savings)
+        txn, = Transaction.objects.bulk_create([Transaction(
+            account=account, transaction_type='deposit', amount=Decimal('10.00'), balance_before=0,
+            balance_after=Decimal('10.00'), description='-', reference_number='BULK-4242', status='completed',
+        )])
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.found('transaction', 'bulk-4242'), set())
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('transaction', 'bulk-4242'), {txn.pk})
+        self.assertEqual(self.found('account', account.account_number), {account.pk})
+
+
+class StatementTests(TestCase):
+    """Rows and running balance of account statements"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+
+    def test_received_transfers_are_credits_in_the_running_balance(self):
+        sender = open_account(self.savings, '500.00')
+        account = open_account(self.savings, '100.00')
+        post_batch([
+            Posting(sender.pk, 'transfer', Decimal('75.00'), destination_account_id=account.pk),
+            Posting(account.pk, 'withdrawal', Decimal('25.00')),
+            Posting(sender.pk, 'transfer', Decimal('10.00'), destination_account_id=account.pk),
+        ])
+        today = timezone.localdate()
+        rows = [(row[4], row[5], row[6]) for row in statement_rows(account, today, today)]
+        self.assertEqual(rows, [('', '75.00', '175.00'), ('25.00', '', '150.00'), ('', '10.00', '160.00')])
+
+    def test_invalid_date_is_a_bad_request(self):
+        account = open_account(self.savings)
+        self.client.force_login(User.objects.get(pk=account.member.user_id))
+        response = self.client.get(reverse('account_statement', args=[account.account_number]),
+                                   {'start': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class NumberingTests(TestCase):
+    """Number formats and reservations made inside a transaction"""
+
+    def setUp(self):
+        numbering._blocks.clear()
+
+    def test_account_numbers_carry_a_valid_check_digit(self):
+        numbers = numbering.allocate('account', 3)
+        self.assertEqual([number[:10] for number in numbers], ['0000000001', '0000000002', '0000000003'])
+        self.assertTrue(all(numbering.is_valid_account_number(number) for number in numbers))
+        wrong_digit = str((int(numbers[0][-1]) + 1) % 10)
+        self.assertFalse(numbering.is_valid_account_number(numbers[0][:-1] + wrong_digit))
+
+    def test_numbers_in_one_transaction_are_consecutive(self):
+        self.assertEqual([numbering.next_number('member') for _ in range(3)], ['M0000001', 'M0000002', 'M0000003'])
+        self.assertEqual(NumberSequence.objects.get(name='member').last_value, 3)
+
+    def test_unknown_sequence_is_rejected(self):
+        with self.assertRaises(KeyError):
+            numbering.allocate('share')
+
+
+class NumberReservationTests(TransactionTestCase):
+    """Blocks reserved on the reserver thread's own connection"""
+
+    def setUp(self):
+        numbering._blocks.clear()
+
+    def test_block_is_committed_and_kept_through_a_rollback(self):
+        self.assertEqual(numbering.next_number('loan'), 'LN00000001')
+        self.assertEqual(NumberSequence.objects.get(name='loan').last_value, 1 + numbering.BLOCK_SIZE)
+        with self.assertRaises(RuntimeError), db_transaction.atomic():
+            numbering.next_number('loan')
+            raise RuntimeError
+        # The rolled-back number is skipped rather than handed out again
+        with self.assertNumQueries(0):
+            self.assertEqual(numbering.next_number('loan'), 'LN00000003')
+        self.assertEqual(NumberSequence.objects.get(name='loan').last_value, 1 + numbering.BLOCK_SIZE)
+
+
+class DividendTests(TestCase):
+    """Dividend payouts, dry-run totals and reruns"""
+
+    @classmethod
+    def setUpTestData(cls):
+        savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+        today = timezone.localdate()
+        cls.dividend = Dividend.objects.create(
+            year=today.year - 1, rate_percentage=Decimal('10.00'), total_amount=Decimal('1000.00'),
+            declaration_date=today, payment_date=today,
+        )
+        cls.active = open_account(savings)
+        cls.dormant = open_account(savings, status='dormant')
+        cls.frozen = open_account(savings, status='frozen')
+        for account, shares in ((cls.active, 1000), (cls.dormant, 500), (cls.frozen, 200)):
+            Member.objects.filter(pk=account.member_id).update(total_shares=shares)
+
+    def test_dry_run_reports_members_without_a_payout_account_separately(self):
+        self.assertEqual(dividend_totals(self.dividend), (2, Decimal('150.00'), 1))
+        output = StringIO()
+        call_command('run_dividend', self.dividend.year, dry_run=True, stdout=output)
+        self.assertIn('2 members to pay, 150.00 in total', output.getvalue())
+        self.assertIn('1 entitled members have no savings account', output.getvalue())
+
+    def test_rerun_pays_nobody_twice(self):
+        result = run_dividend(self.dividend)
+        self.assertEqual(result, (2, Decimal('150.00'), 0, 1, False))
+        self.dormant.refresh_from_db()
+        self.assertEqual((self.dormant.balance, self.dormant.status), (Decimal('50.00'), 'dormant'))
+
+        self.assertEqual(run_dividend(self.dividend), (0, Decimal('0'), 0, 1, False))
+        self.assertEqual(DividendPayment.objects.filter(dividend=self.dividend).count(), 2)
+
+
+class InterestAccrualTests(TestCase):
+    """Monthly capitalization of daily interest and fixed deposit accrual"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-',
+                                                 interest_rate=Decimal('10.00'))
+        cls.deposits = AccountType.objects.create(name='Fixed Deposit', code='FD001', description='-')
+        cls.first_day, cls.last_day = month_bounds(*previous_month())
+
+    def test_month_is_capitalized_once_on_its_end_of_day_balances(self):
+        # 3,650.00 at 10% earns 1.00 a day; today's deposit is backed out of the month's balances
+        account = open_account(self.savings, '3650.00')
+        post_transaction(account, 'deposit', Decimal('365.00'))
+        days = self.last_day.day
+        year, month = self.first_day.year, self.first_day.month
+
+        dry_run = run_accrual(year, month, dry_run=True)
+        self.assertEqual((dry_run.posted, dry_run.amount), (1, Decimal(days)))
+        result = run_accrual(year, month)
+        self.assertEqual((result.posted, result.amount, result.rejected), (1, Decimal(days), 0))
+        account.refresh_from_db()
+        self.assertEqual((account.balance, account.interest_earned), (Decimal('4015.00') + days, Decimal(days)))
+
+        self.assertEqual(run_accrual(year, month).posted, 0)
+        self.assertEqual(Transaction.objects.filter(account=account, transaction_type='interest_payment').count(), 1)
+
+    def test_fixed_deposits_accrue_through_month_end_once(self):
+        # 36,500.00 at 10% accrues 10.00 a day into interest_earned without a posting
+        account = open_account(self.deposits, '36500.00')
+        deposit = FixedDeposit.objects.create(
+            account=account, principal_amount=Decimal('36500.00'), interest_rate=Decimal('10.00'), term_months=12,
+            maturity_amount=Decimal('40150.00'), start_date=self.first_day,
+            maturity_date=add_months(self.first_day, 12),
+        )
+        year, month = self.first_day.year, self.first_day.month
+        result = run_accrual(year, month)
+        self.assertEqual((result.posted, result.deposits, result.accrued), (0, 1, Decimal(10 * self.last_day.day)))
+        deposit.refresh_from_db()
+        account.refresh_from_db()
+        self.assertEqual(deposit.interest_accrued_to, self.last_day)
+        self.assertEqual((account.balance, account.interest_earned),
+                         (Decimal('36500.00'), Decimal(10 * self.last_day.day)))
+
+        self.assertEqual(run_accrual(year, month).deposits, 0)
+
+
+class FixedDepositMaturityTests(TestCase):
+    """Maturity credits, renewals and their agreement with the monthly accrual"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.deposits = AccountType.objects.create(name='Fixed Deposit', code='FD001', description='-')
+
+    def open_deposit(self, start_date, principal='12345.67', auto_renew=False):
+        account = open_account(self.deposits, principal)
+        return FixedDeposit.objects.create(
+            account=account, principal_amount=Decimal(principal), interest_rate=Decimal('7.35'), term_months=1,
+            # Entered on a months/12 basis; settlement replaces it with the accrued amount
+            maturity_amount=Decimal(principal) * (1 + Decimal('0.0735') / 12), start_date=start_date,
+            maturity_date=add_months(start_date, 1), auto_renew=auto_renew,
+        )
+
+    def test_credit_at_maturity_is_what_was_accrued(self):
+        # Accrued from the 15th to the month end by the monthly run, the rest at maturity
+        start = add_months(date(*previous_month(), 15), -1)
+        deposit = self.open_deposit(start)
+        run_accrual(start.year, start.month)
+
+        result = process_maturities()
+        self.assertEqual((result.matured, result.renewed, result.rejected), (1, 0, 0))
+        deposit.refresh_from_db()
+        account = Account.objects.get(pk=deposit.account_id)
+        credit = Transaction.objects.get(account=account, transaction_type='interest_payment')
+        self.assertEqual(credit.amount, account.interest_earned)
+        self.assertEqual(deposit.maturity_amount, deposit.principal_amount + credit.amount)
+        self.assertEqual(deposit.status, 'matured')
+
+    def test_missed_renewals_catch_up_in_one_run(self):
+        today = timezone.localdate()
+        deposit = self.open_deposit(add_months(today, -5) - timedelta(days=1), auto_renew=True)
+
+        result = process_maturities()
+        self.assertEqual((result.matured, result.renewed, result.rejected), (0, 5, 0))
+        deposit.refresh_from_db()
+        account = Account.objects.get(pk=deposit.account_id)
+        self.assertEqual(deposit.status, 'renewed')
+        self.assertGreater(deposit.maturity_date, today)
+        self.assertEqual(deposit.principal_amount, Decimal('12345.67') + result.interest)
+        self.assertEqual(account.interest_earned, result.interest)
+        self.assertEqual(account.balance, Decimal('12345.67') + result.interest)
+
+        self.assertEqual(process_maturities(), (0, 0, Decimal('0'), 0))
+
+
+class MonthlyFeeTests(TestCase):
+    """Monthly fees: who owes, dry-run totals and reruns"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.current = AccountType.objects.create(name='Current Account', code='CUR001', description='-',
+                                                 minimum_balance=Decimal('100.00'), monthly_fee=Decimal('5.00'))
+        cls.owing = open_account(cls.current, '50.00')
+        cls.waived = open_account(cls.current, '200.00')
+        cls.short = open_account(cls.current, '2.00')
+        cls.frozen = open_account(cls.current, '10.00', status='frozen')
+
+    def test_dry_run_totals_match_the_charges(self):
+        year, month = previous_month()
+        self.assertEqual(fee_totals(year, month), [(self.current, 1, Decimal('5.00'), 1)])
+        self.assertEqual(charge_fees(year, month), [(self.current, 1, Decimal('5.00'), 1)])
+        balances = dict(Account.objects.values_list('pk', 'balance'))
+        self.assertEqual(
+            [balances[account.pk] for account in (self.owing, self.waived, self.short, self.frozen)],
+            [Decimal('45.00'), Decimal('200.00'), Decimal('2.00'), Decimal('10.00')],
+        )
+
+    def test_rerun_charges_nobody_twice(self):
+        year, month = previous_month()
+        charge_fees(year, month)
+        self.assertEqual(charge_fees(year, month), [(self.current, 0, Decimal('0.00'), 1)])
+        self.assertEqual(Transaction.objects.filter(transaction_type='fee_charge').count(), 1)
+
+
+class DormancyTests(TestCase):
+    """Flagging inactive accounts dormant and reactivating them on customer activity"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.savings = AccountType.objects.create(name='Savings Account', code='SAV001', description='-')
+
+    def test_inactive_accounts_are_flagged_once(self):
+        now = timezone.now()
+        idle = open_account(self.savings, '10.00')
+        unused = open_account(self.savings)
+        recent = open_account(self.savings, '10.00')
+        Account.objects.filter(pk=idle.pk).update(last_transaction_date=now - timedelta(days=400))
+        Account.objects.filter(pk=unused.pk).update(created_at=now - timedelta(days=400))
+        Account.objects.filter(pk=recent.pk).update(last_transaction_date=now - timedelta(days=30))
+
+        self.assertEqual(mark_dormant(days=365, now=now), 2)
+        statuses = dict(Account.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[account.pk] for account in (idle, unused, recent)],
+                         ['dormant', 'dormant', 'active'])
+        self.assertEqual(Notification.objects.filter(notification_type='account_update').count(), 2)
+        self.assertEqual(mark_dormant(days=365), 0)
+
+    def test_customer_postings_reactivate_but_system_credits_do_not(self):
+        account = open_account(self.savings, '10.00', status='dormant')
+        Account.objects.filter(pk=account.pk).update(dormant_since=timezone.now())
+
+        post_batch([Posting(account.pk, 'interest_payment', Decimal('1.00'))])
+        account.refresh_from_db()
+        self.assertEqual((account.status, account.balance), ('dormant', Decimal('11.00')))
+
+        post_transaction(account, 'deposit', Decimal('5.00'))
+        account.refresh_from_db()
+        self.assertEqual((account.status, account.dormant_since, account.balance),
+                         ('active', None, Decimal('16.00')))
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    """Server-Timing header, request histograms and the slow request log"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='admin', national_id='S-1', is_staff=True, is_superuser=True)
+
+    def test_server_timing_is_sent_to_staff_and_under_debug_only(self):
+        response = self.client.get(reverse('login'))
+        self.assertNotIn('Server-Timing', response)
+        with self.settings(DEBUG=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('login')))
+
+        self.client.force_login(self.staff)
+        timing = self.client.get(reverse('admin:index'))['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_query_count_is_observed_per_request(self):
+        def observed():
+            empty = {'buckets': [0] * (len(metrics.QUERY_BUCKETS) + 1), 'count': 0}
+            state = metrics.REQUEST_QUERIES.values.get((), empty)
+            return list(state['buckets']), state['count']
+
+        self.client.force_login(self.staff)
+        buckets, requests = observed()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:index'))
+        bucket = next(i for i, bound in enumerate(metrics.QUERY_BUCKETS) if len(queries) <= bound)
+        buckets[bucket] += 1
+        self.assertEqual(observed(), (buckets, requests + 1))
+
+    def test_slow_requests_are_logged_with_their_top_queries(self):
+        self.client.force_login(self.staff)
+        with mock.patch.object(middleware, 'SLOW_REQUEST_MS', 0), \
+                self.assertLogs('banking_system.requests', 'WARNING') as logs:
+            self.client.get(reverse('admin:index'))
+        record = logs.records[0].request_metrics
+        self.assertEqual((record['path'], record['status'], record['user_id']), ('/admin/', 200, self.staff.pk))
+        self.assertTrue(record['top_queries'])
+
+        with mock.patch.object(middleware, 'SLOW_REQUEST_MS', 60000), \
+                self.assertNoLogs('banking_system.requests', 'WARNING'):
+            self.client.get(reverse('admin:index'))
+
+
+class MetricsExpositionTests(SimpleTestCase):
+    """Prometheus text output and the merge of per-process metric files"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, value in (('METRICS_DIR', directory), ('_registry', {})):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.events = metrics.Counter('test_events_total', 'Events', ('path',))
+        self.seconds = metrics.Histogram('test_seconds', 'Durations', buckets=(1, 5))
+        self.open = metrics.Gauge('test_open', 'Open handles', ('alias',), sample=lambda: {('default',): 2})
+
+    def test_buckets_are_cumulative_and_labels_escaped(self):
+        for value in (0.5, 3, 3, 10):
+            self.seconds.observe(value)
+        self.events.inc(path='a"b\\c\nd')
+        lines = metrics.exposition().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertEqual([line for line in lines if line.startswith('test_seconds')], [
+            'test_seconds_bucket{le="1.0"} 1',
+            'test_seconds_bucket{le="5.0"} 3',
+            'test_seconds_bucket{le="+Inf"} 4',
+            'test_seconds_sum 16.5',
+            'test_seconds_count 4',
+        ])
+        self.assertIn('test_events_total{path="a\\"b\\\\c\\nd"} 1', lines)
+        self.assertIn('test_open{alias="default"} 2', lines)
+
+    def test_files_of_exited_processes_are_folded_once_without_their_gauges(self):
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        sample = {
+            'test_events_total': [[['/'], 2]],
+            'test_seconds': [[[], {'buckets': [1, 0, 1], 'sum': 7.5, 'count': 2}]],
+            'test_open': [[['default'], 5]],
+        }
+        metrics._write(f'{exited.pid}-dead.json', sample)
+        metrics._write(f'{os.getpid()}-sibling.json', dict(sample, test_open=[[['default'], 1]]))
+        self.events.inc(path='/')
+
+        for _ in range(2):
+            merged = metrics._merge()
+            self.assertEqual(merged['test_events_total'], {('/',): 5})
+            self.assertEqual(merged['test_seconds'], {(): {'buckets': [2, 0, 2], 'sum': 15.0, 'count': 4}})
+            self.assertEqual(merged['test_open'], {('default',): 3})
+        self.assertEqual(sorted(os.listdir(metrics.METRICS_DIR)),
+                         ['.lock', f'{os.getpid()}-sibling.json', metrics.EXITED_FILE])
+        self.assertNotIn('test_open', metrics._read(metrics.EXITED_FILE))
+
+    def test_open_connections_are_counted_per_alias(self):
+        class Wrapper:
+            def __init__(self, alias):
+                self.alias = alias
+                self.connection = object()
+
+        wrappers = [Wrapper('default'), Wrapper('default'), Wrapper('replica')]
+        with mock.patch.object(metrics, '_connections', metrics.weakref.WeakSet()):
+            for wrapper in wrappers:
+                metrics.track_connection(wrapper)
+            wrappers[1].connection = None
+            self.assertEqual(metrics._open_connections(), {('default',): 1, ('replica',): 1})
+            # Wrappers of finished threads drop out with them
+            del wrapper, wrappers[:]
+            self.assertEqual(metrics._open_connections(), {})
+
+
+class AuditTrailAdminTests(TestCase):
+    """Object history pages list audit events from the live and archived logs"""
+
+    def test_history_spans_live_and_archived_events(self):
+        staff = User.objects.create(username='admin', national_id='S-1', is_staff=True, is_superuser=True)
+        member = User.objects.create(username='member', national_id='M-1', is_member=True)
+        now = timezone.now()
+        AuditLog.objects.create(user=member, action_type='login', model_name='User', object_id=str(member.pk),
+                                description='recent login')
+        AuditLogArchive.objects.create(
+            id=1, period=(now - timedelta(days=400)).date().replace(day=1), user_id=member.pk,
+            action_type='login', model_name='User', object_id=str(member.pk), description='archived login',
+            timestamp=now - timedelta(days=400),
+        )
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:banking_system_user_history', args=[member.pk]))
+        self.assertEqual([event['description'] for event in response.context['audit_events']],
+                         ['recent login', 'archived login'])
+
+
+class AuditWriterTests(TransactionTestCase):
+    """Batched AuditLog inserts outside any test transaction, as the writer thread runs them"""
+
+    def test_rows_violating_a_constraint_are_dropped_without_holding_up_the_batch(self):
+        user = User.objects.create(username='auditor', national_id='A-1')
+        writer = audit.AuditWriter(batch_size=10)
+        entries = [audit.entry('update', 'Account', number, user=user) for number in range(4)]
+        entries[2].user_id = 999999
+        writer.pending = list(entries)
+        with self.assertLogs('banking_system.audit', 'ERROR'):
+            self.assertTrue(writer._write())
+        self.assertEqual(writer.pending, [])
+        self.assertEqual(sorted(AuditLog.objects.values_list('object_id', flat=True)), ['0', '1', '3'])
+
+    def test_failed_login_is_recorded_as_login_failed(self):
+        # Password hashing can take the request past the slow request threshold
+        with mock.patch.object(middleware, 'SLOW_REQUEST_MS', 60000):
+            self.client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'})
+        # Stops the writer thread once it has written what it took off the queue
+        audit.writer.shutdown()
+        self.assertEqual(list(AuditLog.objects.values_list('action_type', 'description')),
+                         [('login_failed', 'Failed login for nobody')])
@@ -5,4 +5,7 @@ urlpatterns = [
     path('', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('accounts/<str:account_number>/statement/', views.account_statement, name='account_statement'),
+    path('reports/portfolio-at-risk/', views.portfolio_at_risk, name='portfolio_at_risk'),
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coop_banking_system.settings')
 
 application = get_asgi_application()
+
+# Only serving processes write the per-process files behind /metrics
+from banking_system import metrics  # noqa: E402
+
+metrics.start()
@@ -34,11 +34,13 @@ AUTH_USER_MODEL = 'banking_system.User'
 
 
 MIDDLEWARE = [
+    'banking_system.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'banking_system.middleware.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -47,7 +49,8 @@ ROOT_URLCONF = 'coop_banking_system.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with render timing for RequestMetricsMiddleware
+        'BACKEND': 'banking_system.middleware.TimedDjangoTemplates',
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -66,12 +69,64 @@ WSGI_APPLICATION = 'coop_banking_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite unless DB_NAME is set, in which case PostgreSQL is configured from the DB_* variables.
+# DB_POOL_MAX_SIZE > 0 enables psycopg's connection pool; otherwise connections persist
+# for DB_CONN_MAX_AGE seconds. DB_REPLICA_HOST adds a read replica for dashboards and
+# reports, DB_ARCHIVE_NAME a separate database for archived history.
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _postgres(name, host):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': _env_int('DB_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': _env_int('DB_CONNECT_TIMEOUT', 5),
+        },
+    }
+    pool_size = _env_int('DB_POOL_MAX_SIZE', 0)
+    if pool_size:
+        # Pooled connections are returned after each request, so they cannot also persist
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': _env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': pool_size,
+            'timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        }
+    return database
+
+
+if os.environ.get('DB_NAME'):
+    DATABASES = {'default': _postgres(os.environ['DB_NAME'], os.environ.get('DB_HOST', 'localhost'))}
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = _postgres(os.environ['DB_NAME'], os.environ['DB_REPLICA_HOST'])
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    if os.environ.get('DB_ARCHIVE_NAME'):
+        DATABASES['archive'] = _postgres(
+            os.environ['DB_ARCHIVE_NAME'], os.environ.get('DB_ARCHIVE_HOST', DATABASES['default']['HOST'])
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': _env_int('DB_CONN_MAX_AGE', 60),
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
-}
+
+
+# Archived history goes to an 'archive' database when one is configured; reads marked with
+# routers.read_from_replica go to 'replica' when one is configured
+DATABASE_ROUTERS = ['banking_system.routers.ArchiveRouter', 'banking_system.routers.ReplicaRouter']
 
 
 # Password validation
@@ -120,6 +175,32 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Request instrumentation (banking_system.middleware.RequestMetricsMiddleware)
+SLOW_REQUEST_MS = 500
+N_PLUS_ONE_THRESHOLD = 10
+
+# Clients allowed to scrape /metrics without a staff login; set METRICS_DIR to move the
+# per-process metric files out of the system temp directory
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Batched audit log writer (banking_system.audit)
+AUDIT_FLUSH_INTERVAL_MS = 200
+AUDIT_BATCH_SIZE = 500
+
+# Days without customer activity before the dormancy run flags an active account
+DORMANCY_DAYS = _env_int('DORMANCY_DAYS', 365)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'banking_system.requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coop_banking_system.settings')
 
 application = get_wsgi_application()
+
+# Only serving processes write the per-process files behind /metrics
+from banking_system import metrics  # noqa: E402
+
+metrics.start()